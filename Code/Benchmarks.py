@@ -0,0 +1,630 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas
+from sklearn.metrics import roc_curve
+import fnmatch
+import platform
+import Headless
+from MemoryUsage import formatBytes
+from PimaDataManagement import DataManager
+from Profiling import profiler
+
+
+def _timeCalls(function, repetitions):
+    durations = np.empty(repetitions)
+    for i in range(repetitions):
+        start = time.perf_counter()
+        function()
+        durations[i] = time.perf_counter() - start
+    return durations
+
+
+def _latencySummary(durations):
+    return {
+        'p50_ms': float(np.percentile(durations, 50) * 1000),
+        'p99_ms': float(np.percentile(durations, 99) * 1000),
+        'mean_ms': float(np.mean(durations) * 1000),
+    }
+
+
+def trainBenchmarkModel(hiddenLayersConfig=[12, 8], epochs=5, batchSize=32, seed=1):
+    dataManager, networkManager, _ = Headless.train(hiddenLayersConfig, epochs, batchSize, seed)
+    return dataManager, networkManager
+
+
+def legacyEvaluation(networkManager, dataManager, batchSize=1):
+    # the evaluation after fit before the single-pass engine: evaluate on every split and
+    # on the concatenated hold-out, then predict the hold-out again, all through keras
+    datasets = {
+        'train': (dataManager.X_train, dataManager.y_train),
+        'validate': (dataManager.X_validate, dataManager.y_validate),
+        'test': (dataManager.X_test, dataManager.y_test),
+        'holdout': (pandas.concat([dataManager.X_test, dataManager.X_validate], ignore_index=True), pandas.concat([dataManager.y_test, dataManager.y_validate], ignore_index=True)),
+    }
+    results = dict()
+    for name, (X, y) in datasets.items():
+        loss, accuracy = networkManager.nn_model.evaluate(networkManager.createDataset(X, y, batchSize, None), verbose=0)
+        results[name] = {'loss': loss, 'accuracy': accuracy}
+    X_holdout, y_holdout = datasets['holdout']
+    probabilities = networkManager.nn_model.predict(networkManager.createDataset(X_holdout, None, batchSize, None), verbose=0)
+    results['roc_data'] = roc_curve(y_holdout, probabilities)
+    return results
+
+
+def benchmarkEvaluation(networkManager, dataManager, repetitions=5):
+    # how much faster the single-pass evaluation is, tests/test_evaluation.py checks that the numbers agree
+    def singlePass():
+        return networkManager.evaluateSplits(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test, dataManager.X_validate, dataManager.y_validate)
+
+    return {
+        'legacy evaluate': _latencySummary(_timeCalls(lambda: legacyEvaluation(networkManager, dataManager), repetitions)),
+        'single pass': _latencySummary(_timeCalls(singlePass, repetitions * 100)),
+    }
+
+
+def benchmarkPredictionLatency(networkManager, dataManager, repetitions=1000):
+    # latency of one "Prognose" click, from the eight input strings to the probability
+    patient = [str(v) for v in dataManager.odf[dataManager.feature_columns].iloc[0].values]
+
+    def kerasPath():
+        # the prognosis path before the inference engine: padded 9-column scaling and keras predict
+        np_array = np.array(patient + [0]).reshape(1, -1)
+        prognose_X = np.delete(dataManager.scaler.transform(np_array), 8, axis=1)
+        return networkManager.nn_model.predict(prognose_X, verbose=0)
+
+    def enginePath():
+        return networkManager.predict(*patient, dataManager)
+
+    results = dict()
+    with warnings.catch_warnings():
+        # the scaler was fitted on a DataFrame, the legacy path passes a plain array
+        warnings.simplefilter('ignore', UserWarning)
+        for name, function in [('keras predict', kerasPath), ('inference engine', enginePath)]:
+            function()  # warm-up
+            results[name] = _latencySummary(_timeCalls(function, repetitions))
+    return results
+
+
+def benchmarkImportTimes(modules=('PyQt5.QtWidgets', 'matplotlib.backends.backend_qt5agg', 'pandas', 'sklearn.model_selection', 'tensorflow'), repetitions=3):
+    # cold import time of every module in a fresh interpreter
+    results = dict()
+    for module in modules:
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        durations = [float(subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()[-1]) for _ in range(repetitions)]
+        results[module] = float(np.median(durations))
+    return results
+
+
+def benchmarkStartup(repetitions=3):
+    # starts the GUI with --startup-benchmark, which closes the window as soon as TensorFlow is loaded,
+    # and reports the medians of the startup times measured by the MainWindow plus the process wall time
+    environment = dict(os.environ)
+    environment.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    runs = list()
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, 'MainWindow.py', '--startup-benchmark'], capture_output=True, text=True, env=environment, check=True).stdout
+        wallTime = time.perf_counter() - start
+        line = [line for line in output.splitlines() if line.startswith('STARTUP-BENCHMARK ')][-1]
+        times = json.loads(line[len('STARTUP-BENCHMARK '):])
+        times['process'] = wallTime
+        runs.append(times)
+    return {name: float(np.median([run[name] for run in runs])) for name in runs[0]}
+
+
+def createSyntheticCsv(path, rows, chunkSize=100000, seed=1):
+    # resamples the Pima Indians rows with a little noise, written chunk by chunk
+    original = pandas.read_csv(DataManager.data_file)
+    random = np.random.default_rng(seed)
+    for start in range(0, rows, chunkSize):
+        chunk = original.iloc[random.integers(len(original.index), size=min(chunkSize, rows - start))].copy()
+        noisy = [column for column in DataManager.feature_columns if column not in ('Pregnancies', 'Age')]
+        chunk[noisy] = chunk[noisy] * random.normal(1, 0.02, size=(len(chunk.index), len(noisy)))
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=(start == 0), index=False)
+
+
+def benchmarkOutOfCore(rows=1000000, epochs=1):
+    # peak RSS (and time) of the in-memory DataManager versus the streaming pipeline on the same large CSV,
+    # every variant runs in its own process so that the peak is its own
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'large.csv')
+        createSyntheticCsv(path, rows)
+        inMemory = ("import json, time, MemoryUsage; from PimaDataManagement import DataManager; "
+            f"DataManager.data_file = {path!r}; start = time.perf_counter(); DataManager(usePreprocessedArtifact=False); "
+            "print('STREAMING-RESULT ' + json.dumps({'ingest_time': time.perf_counter() - start, 'peak_rss': MemoryUsage.peakRss()}))")
+        variants = {
+            'in-memory preprocess': [sys.executable, '-c', inMemory],
+            'streaming ingest': [sys.executable, 'StreamingDataManagement.py', path, '--store', os.path.join(directory, 'store')],
+            'streaming training': [sys.executable, 'StreamingDataManagement.py', path, '--store', os.path.join(directory, 'store'), '--epochs', str(epochs)],
+        }
+        results = dict()
+        for name, command in variants.items():
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            line = [line for line in output.splitlines() if line.startswith('STREAMING-RESULT ')][-1]
+            results[name] = json.loads(line[len('STREAMING-RESULT '):])
+        return results
+
+
+def benchmarkTableModel(rows=1000000, pageRows=40, pages=50):
+    # the Tabelle model on a large frame: construction, painting random pages, sorting and filtering
+    from PyQt5 import QtCore as qtc
+    from ChildWindows import PandasModel
+    original = pandas.read_csv(DataManager.data_file)
+    frame = original.iloc[np.random.default_rng(1).integers(len(original.index), size=rows)].reset_index(drop=True)
+    random = np.random.default_rng(2)
+    results = dict()
+
+    start = time.perf_counter()
+    model = PandasModel(frame)
+    results['construct_s'] = time.perf_counter() - start
+
+    def paintPages():
+        # scroll to random positions (fetching the rows up to there) and paint one page of cells
+        for _ in range(pages):
+            top = int(random.integers(rows - pageRows))
+            while model.rowCount() < top + pageRows and model.canFetchMore(qtc.QModelIndex()):
+                model.fetchMore(qtc.QModelIndex())
+            for row in range(top, top + pageRows):
+                for column in range(model.columnCount()):
+                    model.data(model.index(row, column))
+
+    start = time.perf_counter()
+    paintPages()
+    results['page_ms'] = (time.perf_counter() - start) / pages * 1000
+
+    for name in ['sort_first_s', 'sort_cached_s']:
+        start = time.perf_counter()
+        model.sort(1, qtc.Qt.DescendingOrder)
+        results[name] = time.perf_counter() - start
+    start = time.perf_counter()
+    model.setFilter(5, 30, 40)
+    results['filter_s'] = time.perf_counter() - start
+    results['filtered_rows'] = len(model._order)
+
+    # the previous model materialized frame.values for every single cell, one row of cells times the page height
+    start = time.perf_counter()
+    for column in range(len(frame.columns)):
+        str(frame.values[0][column])
+    results['legacy_page_ms_estimate'] = (time.perf_counter() - start) * pageRows * 1000
+    return results
+
+
+def benchmarkRocWidget(runs=100, rows=100000):
+    # time to add one ROC curve of a large hold-out set per run, the widget against the previous
+    # behaviour (every curve and the legend stay on the axes, full canvas redraw per run)
+    from PyQt5 import QtWidgets as qtw
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+    from CanvasWidgets import ROCWidget
+    application = qtw.QApplication.instance() or qtw.QApplication(sys.argv)
+    random = np.random.default_rng(1)
+    y = random.integers(2, size=rows)
+    curves = list()
+    for _ in range(runs):
+        probabilities = np.clip(0.5 + (y - 0.5) * random.uniform(0.05, 0.5) + random.normal(0, 0.3, rows), 0, 1)
+        curves.append(roc_curve(y, probabilities, drop_intermediate=False))
+
+    widget = ROCWidget()
+    widget.show()
+    application.processEvents()
+    durations = np.empty(runs)
+    for i, (FPR, TPR, thresholds) in enumerate(curves):
+        start = time.perf_counter()
+        widget.plot(FPR, TPR, thresholds, f"run {i}")
+        durations[i] = time.perf_counter() - start
+
+    legacyCanvas = FigureCanvas(Figure(figsize=(8, 8)))
+    axes = legacyCanvas.figure.add_subplot(111)
+    legacyDurations = np.empty(runs)
+    for i, (FPR, TPR, thresholds) in enumerate(curves):
+        start = time.perf_counter()
+        p = axes.plot(FPR, TPR, label=f"run {i}")
+        axes.legend(loc="lower right")
+        index = next(j for j in range(len(thresholds)) if thresholds[j] <= 0.5)
+        for j in [index, index - 1]:
+            axes.plot(FPR[j], TPR[j], 'o-', color=p[-1].get_color())
+            axes.annotate(np.round(thresholds[j], 2), (FPR[j], TPR[j] - 0.04), color=p[-1].get_color())
+        legacyCanvas.draw()
+        legacyDurations[i] = time.perf_counter() - start
+    widget.close()
+    return {
+        'legacy, first 10 runs': _latencySummary(legacyDurations[:10]),
+        'legacy, last 10 runs': _latencySummary(legacyDurations[-10:]),
+        'widget, first 10 runs': _latencySummary(durations[:10]),
+        'widget, last 10 runs': _latencySummary(durations[-10:]),
+    }
+
+
+def benchmarkChildWindows(rounds=8, windowsPerKind=5, epochs=5):
+    # RSS of the GUI while child windows are opened and closed: after one short training run, every round
+    # opens windowsPerKind Lernbericht, Histogramm and Tabelle windows each and closes them all again;
+    # closed windows have to be freed, RSS and the number of live figures should stay flat after the first round
+    import gc
+    from PyQt5 import QtWidgets as qtw, QtCore as qtc
+    from matplotlib.figure import Figure
+    from MemoryUsage import currentRss
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    application = qtw.QApplication.instance() or qtw.QApplication(sys.argv)
+    from MainWindow import MainWindow
+
+    def waitFor(condition, timeout=300):
+        end = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < end:
+            application.processEvents()
+            time.sleep(0.02)
+
+    window = MainWindow()
+    waitFor(window.button_train.isEnabled)
+    window.textfield_topology.setText("12,8")
+    window.textfield_epochs.setText(str(epochs))
+    window.textfield_batchSize.setText("32")
+    window.cache_checkBox.setChecked(False)
+    window.trainButtonClicked()
+    waitFor(lambda: window._lastFinishedJob is not None)
+
+    results = list()
+    for _ in range(rounds):
+        for _ in range(windowsPerKind):
+            window.buttonBerichtClicked()
+            window.buttonHistogrammClicked()
+            window.buttonTabelleClicked()
+        application.processEvents()
+        for childWindow in list(window._childWindows):
+            childWindow.close()
+        # the closed windows are deleted by deferred delete events
+        for _ in range(3):
+            application.processEvents()
+            qtc.QCoreApplication.sendPostedEvents(None, qtc.QEvent.DeferredDelete)
+        gc.collect()
+        results.append({'rss': currentRss(), 'figures': sum(isinstance(o, Figure) for o in gc.get_objects()), 'open_windows': len(window._childWindows)})
+    window.close()
+    return results
+
+
+def benchmarkLiveLearningCurve(epochs=30, batchSize=8, repetitions=3):
+    # training throughput on the TrainingWorker with and without a live learning graph open
+    from PyQt5 import QtWidgets as qtw
+    from PyQt5 import QtCore as qtc
+    from TrainingWorker import TrainingWorker, TrainingJob
+    from ChildWindows import LearningWindow
+    from NeuralNetworkManagement import NNManager
+    application = qtw.QApplication.instance() or qtw.QApplication(sys.argv)
+    dataManager = DataManager()
+    dataManager.splitDataIntoTrainingValidationAndTestingSets(1)
+    dataSplits = (dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test, dataManager.X_validate, dataManager.y_validate)
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    worker = TrainingWorker(networkManager)
+    worker.start()
+
+    results = {'without live view': list(), 'with live view': list()}
+    for _ in range(repetitions):
+        for name in results:
+            job = TrainingJob([12, 8], epochs, False, False, False, batchSize, 0, True, dataSplits, 1)
+            learningWindow = LearningWindow(job, worker.learningCurve) if name == 'with live view' else None
+            if learningWindow is not None:
+                learningWindow.show()
+            loop = qtc.QEventLoop()
+            worker.runFinished.connect(loop.quit)
+            worker.enqueue(job)
+            loop.exec_()
+            worker.runFinished.disconnect(loop.quit)
+            if learningWindow is not None:
+                learningWindow.close()
+            results[name].append(job.samples_per_second)
+    worker.stop()
+    return {name: float(np.median(throughputs)) for name, throughputs in results.items()}
+
+
+def benchmarkInferenceServer(requests=5000, concurrency=64, maxDelayMs=2.0):
+    # load test of the InferenceServer (own process) with concurrent single-patient requests:
+    # micro-batching against scoring every request alone (max batch size 1)
+    import asyncio
+    from InferenceServer import generateLoad
+    dataManager, networkManager = trainBenchmarkModel()
+    patients = dataManager.odf[dataManager.feature_columns].values.tolist()
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        modelPath = os.path.join(directory, 'model.npz')
+        networkManager.exportModel(modelPath, dataManager)
+        variants = {
+            'micro-batching': ['--max-delay-ms', str(maxDelayMs)],
+            'per request': ['--max-batch-size', '1'],
+        }
+        for name, options in variants.items():
+            server = subprocess.Popen([sys.executable, 'InferenceServer.py', modelPath, '--port', '0'] + options, stdout=subprocess.PIPE, text=True)
+            try:
+                port = int(server.stdout.readline().rsplit(':', 1)[1])
+                wallTime, latencies = asyncio.run(generateLoad('127.0.0.1', port, patients, requests, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            results[name] = {'requests_per_second': requests / wallTime, 'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p99_ms': float(np.percentile(latencies, 99) * 1000), 'mean_ms': float(np.mean(latencies) * 1000)}
+    return results
+
+
+def benchmarkPrecision(hiddenLayersConfig=[12, 8], epochs=30, batchSize=32, seed=1, repetitions=1000, rows=10000):
+    # training in every precision mode on the same split, then the float64 network exported in every
+    # weight format: hold-out accuracy/AUC against the float64 reference, file size and latency
+    from Evaluation import BinaryEvaluation
+    from FastInference import PatientModel
+    from NeuralNetworkManagement import precisionModes, setPrecision
+    dataManager = DataManager()
+    training = dict()
+    reference = None
+    for precision in precisionModes:
+        mark = profiler.mark()
+        _, networkManager, _ = Headless.train(hiddenLayersConfig, epochs, batchSize, seed, dataManager=dataManager, precision=precision)
+        epochTimes = [event['dur'] / 1e6 for event in profiler.events(since=mark) if event['ph'] == 'X' and event['name'] == 'epoch']
+        holdout = networkManager.current_run_evaluation['holdout']
+        training[precision] = {'epoch_time': float(np.median(epochTimes[1:] or epochTimes)), 'samples_per_second': networkManager.current_run_samples_per_second,
+            'accuracy': holdout.accuracy(), 'auc': holdout.auc()}
+        if reference is None:
+            reference = networkManager
+    setPrecision('float64')
+
+    y_holdout = np.concatenate([dataManager.y_test.values, dataManager.y_validate.values])
+    X_holdout = np.concatenate([dataManager.X_test.values, dataManager.X_validate.values])
+    X_batch = X_holdout[np.random.default_rng(1).integers(len(X_holdout), size=rows)]
+    referenceProbabilities = reference.inference_engine.predict(X_holdout)
+    export = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for weights, computeDtype in [('float64', np.float64), ('float32', np.float32), ('float16', np.float32), ('int8', np.float32)]:
+            path = os.path.join(directory, f'model-{weights}.npz')
+            reference.exportModel(path, dataManager, weights)
+            model = PatientModel.load(path, computeDtype)
+            probabilities = model.engine.predict(X_holdout)
+            holdout = BinaryEvaluation(y_holdout, probabilities)
+            export[weights] = {'file_size': os.path.getsize(path), 'compute_dtype': np.dtype(computeDtype).name,
+                'accuracy': holdout.accuracy(), 'auc': holdout.auc(),
+                'max_probability_delta': float(np.max(np.abs(probabilities - referenceProbabilities))),
+                'single_ms': _latencySummary(_timeCalls(lambda: model.engine.predictOne(X_holdout[0]), repetitions))['p50_ms'],
+                'batch_ms': _latencySummary(_timeCalls(lambda: model.engine.predict(X_batch), max(repetitions // 10, 1)))['p50_ms']}
+    for results in (training, export):
+        for entry in results.values():
+            entry['accuracy_delta'] = entry['accuracy'] - results['float64']['accuracy']
+            entry['auc_delta'] = entry['auc'] - results['float64']['auc']
+    return training, export
+
+
+def benchmarkBackends(topologies=([12, 8], [16]), batchSizes=(1, 32, 0), epochs=50, seed=1):
+    # the same runs on the keras and the NumPy backend (batch size 0: full-batch, NumPy only):
+    # wall time of the training and hold-out accuracy / AUC
+    dataManager = DataManager()
+    results = dict()
+    for topology in topologies:
+        for batchSize in batchSizes:
+            name = '%s batch=%s' % ('x'.join(str(size) for size in topology) or 'none', batchSize or 'full')
+            for backend in (['keras', 'numpy'] if batchSize else ['numpy']):
+                _, networkManager, _ = Headless.train(topology, epochs, batchSize, seed, dataManager=dataManager, backend=backend)
+                holdout = networkManager.current_run_evaluation['holdout']
+                results.setdefault(name, dict())[backend] = {'training_time': networkManager.current_run_training_time,
+                    'accuracy': holdout.accuracy(), 'auc': holdout.auc()}
+    # a process that trains on the NumPy backend never loads TensorFlow
+    code = "import sys, Headless; Headless.train([12, 8], 5, 0, 1, backend='numpy'); print('tensorflow' in sys.modules)"
+    tensorflowImported = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()[-1] == 'True'
+    return results, tensorflowImported
+
+
+def benchmarkEnsemble(hiddenLayersConfig=[12, 8], replicas=10, epochs=30, batchSize=32, seed=1):
+    # `replicas` differently initialized networks on one split: one keras fit per network against one
+    # stacked model; wall time (model creation, training, evaluation) and the spread of the holdout AUC
+    dataManager = DataManager()
+    start = time.perf_counter()
+    separateAucs = list()
+    for _ in range(replicas):
+        _, networkManager, _ = Headless.train(hiddenLayersConfig, epochs, batchSize, seed, dataManager=dataManager)
+        separateAucs.append(networkManager.current_run_evaluation['holdout'].auc())
+    separateTime = time.perf_counter() - start
+    start = time.perf_counter()
+    _, networkManager, _ = Headless.trainEnsemble(hiddenLayersConfig, replicas, epochs, batchSize, seed, dataManager=dataManager)
+    stackedTime = time.perf_counter() - start
+    stackedAucs = [evaluation['holdout'].auc() for evaluation in networkManager.current_run_replica_evaluations]
+    return {
+        'separate fits': {'wall_time': separateTime, 'auc_mean': float(np.mean(separateAucs)), 'auc_std': float(np.std(separateAucs))},
+        'stacked model': {'wall_time': stackedTime, 'auc_mean': float(np.mean(stackedAucs)), 'auc_std': float(np.std(stackedAucs)),
+            'ensemble_auc': networkManager.current_run_evaluation['holdout'].auc()},
+    }
+
+
+def benchmarkModelPool(topologies=([12, 8], [16], []), rounds=3, batchSize=32, seed=1):
+    # time to first epoch (create network model up to the end of epoch 1: build, compile, tracing and one epoch)
+    # when the GUI alternates between a few topologies, with and without the compiled-model pool;
+    # the first round builds every network in both cases
+    from NeuralNetworkManagement import NNManager
+    dataManager = DataManager()
+    dataManager.splitDataIntoTrainingValidationAndTestingSets(seed)
+    results = dict()
+    for name, poolSize in [('without pool', 0), ('with pool', 4)]:
+        networkManager = NNManager()
+        networkManager.verbose = 0
+        networkManager.model_pool_size = poolSize
+        times = list()
+        for _ in range(rounds):
+            for topology in topologies:
+                mark = profiler.mark()
+                networkManager.createNetworkModel(topology, True, False)
+                networkManager.trainAndSupervise(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+                    dataManager.X_validate, dataManager.y_validate, 1, False, batchSize)
+                events = [event for event in profiler.events(since=mark) if event['ph'] == 'X']
+                created = next(event for event in events if event['name'] == 'create network model')
+                epoch = next(event for event in events if event['name'] == 'epoch')
+                times.append((epoch['ts'] + epoch['dur'] - created['ts']) / 1e6)
+        results[name] = {'first_round': float(np.median(times[:len(topologies)])), 'later_rounds': float(np.median(times[len(topologies):]))}
+    return results
+
+
+def runSuite(topologies=([12, 8], [16]), batchSizes=(1, 32), epochs=6, repetitions=5, predictions=1000):
+    # headless regression suite: every metric is a duration in seconds (lower is better),
+    # medians over the repetitions; the first epoch (tracing) is left out of the epoch times
+    from NeuralNetworkManagement import NNManager
+    metrics = dict()
+
+    def measure(name, function, count=repetitions):
+        metrics[name] = float(np.median(_timeCalls(function, count)))
+
+    measure('csv_load_preprocess', lambda: DataManager(usePreprocessedArtifact=False))
+    DataManager()
+    measure('artifact_load', DataManager)
+    dataManager = DataManager()
+    measure('split', lambda: dataManager.splitDataIntoTrainingValidationAndTestingSets(1))
+
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    # a model from the pool is not built again
+    networkManager.model_pool_size = 0
+    for topology in topologies:
+        name = 'x'.join(str(size) for size in topology) or 'none'
+        measure(f'model_build[{name}]', lambda: networkManager.createNetworkModel(topology, True, False))
+        for batchSize in batchSizes:
+            mark = profiler.mark()
+            Headless.train(topology, epochs, batchSize, 1, dataManager=dataManager)
+            epochTimes = [event['dur'] / 1e6 for event in profiler.events(since=mark) if event['ph'] == 'X' and event['name'] == 'epoch']
+            metrics[f'epoch_time[{name},batch={batchSize}]'] = float(np.median(epochTimes[1:] or epochTimes))
+
+    # the last trained network serves the evaluation and prediction metrics
+    _, networkManager, _ = Headless.train(topologies[0], epochs, batchSizes[-1], 1, dataManager=dataManager)
+    measure('evaluation', lambda: networkManager.evaluateSplits(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test, dataManager.X_validate, dataManager.y_validate), predictions)
+    patient = [str(v) for v in dataManager.odf[dataManager.feature_columns].iloc[0].values]
+    measure('predict_single', lambda: networkManager.predict(*patient, dataManager), predictions)
+    measure('predict_batch', lambda: networkManager.predictBatch(dataManager.odf, dataManager), predictions)
+
+    return {
+        'created': time.time(),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'tensorflow': __import__('tensorflow').__version__,
+        },
+        'metrics': metrics,
+    }
+
+
+def compareWithBaseline(results, baseline, tolerance=0.2, tolerances=None):
+    # relative slowdown per metric; a metric regresses when it is slower than the baseline by more
+    # than its tolerance (tolerances: {fnmatch pattern: tolerance}, the first matching pattern wins)
+    comparison = dict()
+    for name, value in results['metrics'].items():
+        if name not in baseline['metrics']:
+            continue
+        allowed = next((t for pattern, t in (tolerances or {}).items() if fnmatch.fnmatchcase(name, pattern)), tolerance)
+        change = value / baseline['metrics'][name] - 1
+        comparison[name] = {'baseline': baseline['metrics'][name], 'value': value, 'change': change, 'tolerance': allowed, 'regression': change > allowed}
+    return comparison
+
+
+def _printLatencies(title, results):
+    print(title)
+    for name, summary in results.items():
+        print("   %-22s p50 %8.3f ms   p99 %8.3f ms   mean %8.3f ms" % (name, summary['p50_ms'], summary['p99_ms'], summary['mean_ms']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="micro benchmarks for the Pima Indians pipeline")
+    parser.add_argument('benchmarks', nargs='*', default=['inference', 'startup'], choices=['suite', 'inference', 'evaluation', 'precision', 'backends', 'ensemble', 'model-pool', 'server', 'startup', 'out-of-core', 'table', 'roc', 'live', 'windows'])
+    parser.add_argument('--rows', type=int, default=1000000, help="rows of the synthetic CSV of the out-of-core benchmark")
+    parser.add_argument('--repetitions', type=int, default=1000)
+    parser.add_argument('--output', default='benchmark-results.json', help="suite: machine-readable results")
+    parser.add_argument('--baseline', default='benchmark-baseline.json', help="suite: results to compare against")
+    parser.add_argument('--update-baseline', action='store_true', help="suite: store the results as the new baseline")
+    parser.add_argument('--tolerance', action='append', default=[], metavar="[PATTERN=]FRACTION",
+        help="suite: allowed slowdown, e.g. 0.2 for all metrics or \"epoch_time*=0.5\" for matching ones")
+    args = parser.parse_args()
+
+    regressions = list()
+    if 'suite' in args.benchmarks:
+        results = runSuite()
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"suite results written to {args.output}")
+        tolerance = 0.2
+        tolerances = dict()
+        for entry in args.tolerance:
+            pattern, _, fraction = entry.rpartition('=')
+            if pattern:
+                tolerances[pattern] = float(fraction)
+            else:
+                tolerance = float(fraction)
+        if os.path.exists(args.baseline) and not args.update_baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            for name, entry in compareWithBaseline(results, baseline, tolerance, tolerances).items():
+                print("   %-34s %10.5fs  baseline %10.5fs  %+7.1f%% (tolerance %+.0f%%)%s" % (
+                    name, entry['value'], entry['baseline'], entry['change'] * 100, entry['tolerance'] * 100, "  REGRESSION" if entry['regression'] else ""))
+                if entry['regression']:
+                    regressions.append(name)
+        else:
+            with open(args.baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"baseline written to {args.baseline}")
+
+    if 'inference' in args.benchmarks:
+        dataManager, networkManager = trainBenchmarkModel()
+        _printLatencies("single-row prediction latency", benchmarkPredictionLatency(networkManager, dataManager, args.repetitions))
+    if 'evaluation' in args.benchmarks:
+        dataManager, networkManager = trainBenchmarkModel()
+        _printLatencies("evaluation of all splits after training", benchmarkEvaluation(networkManager, dataManager))
+    if 'precision' in args.benchmarks:
+        training, export = benchmarkPrecision()
+        print("training precision")
+        for name, entry in training.items():
+            print("   %-8s epoch %7.3fs  %8.0f samples/s   accuracy %.4f (%+.4f)   AUC %.4f (%+.4f)" % (
+                name, entry['epoch_time'], entry['samples_per_second'], entry['accuracy'], entry['accuracy_delta'], entry['auc'], entry['auc_delta']))
+        print("exported weights (float64 network)")
+        for name, entry in export.items():
+            print("   %-8s %9s  accuracy %+.4f  AUC %+.5f  max |dp| %.1e   single %.4f ms  batch of 10000 %.3f ms (%s)" % (
+                name, formatBytes(entry['file_size']), entry['accuracy_delta'], entry['auc_delta'], entry['max_probability_delta'],
+                entry['single_ms'], entry['batch_ms'], entry['compute_dtype']))
+    if 'backends' in args.benchmarks:
+        results, tensorflowImported = benchmarkBackends()
+        print("training backends, 50 epochs")
+        for name, backends in results.items():
+            print("   %-18s " % name + "   ".join("%s %7.2fs acc %.4f AUC %.4f" % (backend, entry['training_time'], entry['accuracy'], entry['auc']) for backend, entry in backends.items())
+                + ("   (x%.1f)" % (backends['keras']['training_time'] / backends['numpy']['training_time']) if 'keras' in backends else ""))
+        print(f"   TensorFlow imported by the numpy backend: {tensorflowImported}")
+    if 'ensemble' in args.benchmarks:
+        print("10 networks [12, 8], 30 epochs, batch size 32")
+        for name, result in benchmarkEnsemble().items():
+            print("   %-14s %7.2fs   holdout AUC %.4f +- %.4f%s" % (name, result['wall_time'], result['auc_mean'], result['auc_std'],
+                "   ensemble %.4f" % result['ensemble_auc'] if 'ensemble_auc' in result else ""))
+    if 'model-pool' in args.benchmarks:
+        print("time to first epoch, topologies [12, 8], [16] and [] in turn, batch size 32")
+        for name, result in benchmarkModelPool().items():
+            print("   %-14s first round %6.3fs   later rounds %6.3fs" % (name, result['first_round'], result['later_rounds']))
+    if 'server' in args.benchmarks:
+        print("inference server, 5000 requests from 64 concurrent clients")
+        for name, result in benchmarkInferenceServer().items():
+            print("   %-22s %8.0f requests/s   p50 %8.3f ms   p99 %8.3f ms" % (name, result['requests_per_second'], result['p50_ms'], result['p99_ms']))
+    if 'startup' in args.benchmarks:
+        print("cold import times (s): " + ", ".join("%s %.3f" % item for item in benchmarkImportTimes().items()))
+        print("startup times (s): " + ", ".join("%s %.3f" % item for item in benchmarkStartup().items()))
+    if 'table' in args.benchmarks:
+        print(f"table model on {args.rows} rows: " + ", ".join("%s %.3f" % item for item in benchmarkTableModel(args.rows).items()))
+    if 'roc' in args.benchmarks:
+        _printLatencies("adding a ROC curve", benchmarkRocWidget())
+    if 'windows' in args.benchmarks:
+        rounds = benchmarkChildWindows()
+        print("child windows, 8 rounds of opening and closing 5 Lernbericht, Histogramm and Tabelle windows each")
+        for i, entry in enumerate(rounds):
+            print("   round %d   RSS %10s   live figures %d   open windows %d" % (i + 1, formatBytes(entry['rss']), entry['figures'], entry['open_windows']))
+        print("   growth per round after the first: %s" % formatBytes((rounds[-1]['rss'] - rounds[0]['rss']) / max(len(rounds) - 1, 1)))
+    if 'live' in args.benchmarks:
+        print("training throughput (samples/s): " + ", ".join("%s %.0f" % item for item in benchmarkLiveLearningCurve().items()))
+    if 'out-of-core' in args.benchmarks:
+        print(f"out-of-core pipeline on {args.rows} rows")
+        for name, result in benchmarkOutOfCore(args.rows).items():
+            print("   %-22s peak RSS %10s   %s" % (name, formatBytes(result['peak_rss']), ", ".join("%s %.2f" % (key, value) for key, value in result.items() if key not in ('peak_rss', 'rows'))))
+    if regressions:
+        print(f"{len(regressions)} performance regression(s): " + ", ".join(regressions))
+        sys.exit(1)
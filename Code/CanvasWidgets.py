@@ -1,21 +1,93 @@
 from matplotlib.figure import Figure
+from matplotlib.patches import Patch
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5 import QtCore as qtc
 import numpy as np
+from Profiling import profiler
 
-class HistogramWidget(FigureCanvas):
 
-    def __init__(self, df, width = 5, height = 5, dpi = 200):
+class ProfiledFigureCanvas(FigureCanvas):
+
+    # full redraws of the canvas are recorded as profiler spans
+
+    def draw(self):
+        with profiler.span('draw ' + type(self).__name__, 'draw'):
+            super().draw()
+
+    def release(self):
+        # drops the artists (and the data they hold) of a canvas that is not shown again
+        self.figure.clear()
+
+
+class HistogramWidget(ProfiledFigureCanvas):
+
+    # draws precomputed bin counts (Histograms.ColumnHistograms), nothing is binned here
+    variants = ['raw', 'imputed', 'scaled', 'compare']
+
+    def __init__(self, histograms, scaledEdges=None, variant='imputed', width = 5, height = 5, dpi = 200):
         self.figure = Figure(figsize=(width, height), dpi=dpi)
         FigureCanvas.__init__(self, self.figure)
-        self._df = df
-        self.plot()
+        self._histograms = histograms
+        self._scaledEdges = scaledEdges
+        # one subplot per column on a square grid, as DataFrame.hist lays them out; a list, the garbage collector
+        # does not see through an object array and the cycle axes -> figure -> canvas would never be freed
+        gridSize = int(np.ceil(np.sqrt(len(histograms.columns))))
+        self._axes = list(self.figure.subplots(gridSize, gridSize, squeeze=False).flatten())
+        for ax in self._axes[len(histograms.columns):]:
+            ax.set_visible(False)
+        for ax, column in zip(self._axes, histograms.columns):
+            ax.set_title(column)
+            ax.grid(True)
+        self._variantArtists = dict()
+        self._legend = self._axes[0].legend(handles=[Patch(color='C1', alpha=.5, label='raw'), Patch(color='C0', alpha=.5, label='imputed')])
+        self.plot(variant)
+
+    def plot(self, variant='imputed'):
+        # 'raw', 'imputed', 'scaled' (the imputed counts over the standardized bins) or 'compare' (raw over imputed);
+        # the artists of a variant are created once and only shown or hidden afterwards, clearing the axes
+        # would rebuild all ticks, which costs more than drawing the bars
+        if variant not in self._variantArtists:
+            self._variantArtists[variant] = self._createArtists(variant)
+        for name, artists in self._variantArtists.items():
+            for artist in artists:
+                artist.set_visible(name == variant)
+        counts = self._histograms.counts
+        for i, ax in enumerate(self._axes[:len(self._histograms.columns)]):
+            edges = self._scaledEdges[i] if variant == 'scaled' else self._histograms.edges[i]
+            maxCount = max(counts[name][i].max() for name in ['raw', 'imputed'] if name in counts)
+            ax.set_xlim(edges[0], edges[-1])
+            ax.set_ylim(0, maxCount * 1.05)
+        self._legend.set_visible(variant == 'compare')
+        self.draw_idle()
 
-    def plot(self):
-        ax = self.figure.add_subplot(111)
-        self._df.hist(ax=ax, bins=10)
-        ax.plot()
-        
-class ROCWidget(FigureCanvas):
+    def _createArtists(self, variant):
+        counts = self._histograms.counts
+        artists = list()
+        for i, ax in enumerate(self._axes[:len(self._histograms.columns)]):
+            if variant == 'scaled':
+                artists += self._plotCounts(ax, self._scaledEdges[i], counts['imputed'][i], color='C0')
+            elif variant == 'compare':
+                artists += self._plotCounts(ax, self._histograms.edges[i], counts['raw'][i], alpha=.5, color='C1')
+                artists += self._plotCounts(ax, self._histograms.edges[i], counts['imputed'][i], alpha=.5, color='C0')
+            else:
+                artists += self._plotCounts(ax, self._histograms.edges[i], counts[variant][i], color='C0')
+        return artists
+
+    def _plotCounts(self, ax, edges, counts, **kwargs):
+        return ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', **kwargs).patches
+
+
+class ROCWidget(ProfiledFigureCanvas):
+
+    # curves, threshold markers and legend are animated artists: a new run is blitted over the cached
+    # frame instead of redrawing the canvas; only the latest maxVisibleCurves curves are shown, older
+    # ones are archived (hidden) and can be shown again with setCurveVisible
+    maxVisibleCurves = 8
+    # longer curves are thinned out to about this many points
+    maxCurvePoints = 200
+
+    # curve index, visible
+    curveVisibilityChanged = qtc.pyqtSignal(int, bool)
 
     _figure = None
 
@@ -24,24 +96,97 @@ class ROCWidget(FigureCanvas):
         FigureCanvas.__init__(self, self._figure)
         self.axes = self.figure.add_subplot(111)
         self._plotFrame(self.axes)
+        # (label, [line, threshold markers and annotations]) per plotted run
+        self._curves = list()
+        self._legend = None
+        self._background = None
+        self.mpl_connect('draw_event', self._onDraw)
+
+    def plot(self, falsePositiveRateValues, truePositiveRateValues, thresholds, legendLabel, redraw=True):
+        with profiler.span('plot roc curve', 'draw', points=len(falsePositiveRateValues)):
+            FPR, TPR = self._downsample(np.asarray(falsePositiveRateValues), np.asarray(truePositiveRateValues))
+            p = self.axes.plot(FPR, TPR, label=legendLabel, animated=True)
+            artists = p + self._plotThreshold(falsePositiveRateValues, truePositiveRateValues, thresholds, p[-1].get_color())
+            self._curves.append((legendLabel, artists))
+            self.curveVisibilityChanged.emit(len(self._curves) - 1, True)
+            self._archiveOldCurves(keep=len(self._curves) - 1)
+            self._updateLegend()
+            if redraw:
+                self.redrawCurves()
+
+    def curveCount(self):
+        return len(self._curves)
+
+    def curveLabel(self, index):
+        return self._curves[index][0]
 
-    def plot(self, falsePositiveRateValues, truePositiveRateValues, thresholds, legendLabel):
-        p = self.axes.plot(falsePositiveRateValues, truePositiveRateValues, label=legendLabel)
-        self.axes.legend(loc="lower right")
-        self._plotThreshold(falsePositiveRateValues, truePositiveRateValues, thresholds, p[-1].get_color())
-        self.draw()
+    def isCurveVisible(self, index):
+        return self._curves[index][1][0].get_visible()
+
+    def setCurveVisible(self, index, visible):
+        if visible == self.isCurveVisible(index):
+            return
+        for artist in self._curves[index][1]:
+            artist.set_visible(visible)
+        self.curveVisibilityChanged.emit(index, visible)
+        if visible:
+            self._archiveOldCurves(keep=index)
+        self._updateLegend()
+        self.redrawCurves()
+
+    def _archiveOldCurves(self, keep):
+        # hide the oldest visible curves (except the one just shown) until the bound holds
+        visible = [i for i in range(len(self._curves)) if self.isCurveVisible(i) and i != keep]
+        for i in visible[:max(0, len(visible) + 1 - self.maxVisibleCurves)]:
+            for artist in self._curves[i][1]:
+                artist.set_visible(False)
+            self.curveVisibilityChanged.emit(i, False)
+
+    def _updateLegend(self):
+        if self._legend is not None:
+            self._legend.remove()
+        lines = [artists[0] for _, artists in self._curves if artists[0].get_visible()]
+        self._legend = self.axes.legend(handles=lines, loc="lower right")
+        self._legend.set_animated(True)
+
+    def redrawCurves(self):
+        # blit the visible curves over the cached frame, a full draw only happens without a cached frame
+        if self._background is None:
+            self.draw()
+            return
+        self.restore_region(self._background)
+        self._drawAnimated()
+        self.blit(self.axes.bbox)
+
+    def _onDraw(self, event):
+        # a full draw (first paint, resize) renders the frame without the animated artists: cache it, then add them
+        self._background = self.copy_from_bbox(self.axes.bbox)
+        self._drawAnimated()
+
+    def _drawAnimated(self):
+        for _, artists in self._curves:
+            if artists[0].get_visible():
+                for artist in artists:
+                    self.axes.draw_artist(artist)
+        if self._legend is not None:
+            self.axes.draw_artist(self._legend)
+
+    def _downsample(self, falsePositiveRateValues, truePositiveRateValues):
+        # the ROC curve is monotone, points evenly spaced along fpr + tpr keep its shape
+        if len(falsePositiveRateValues) <= self.maxCurvePoints:
+            return falsePositiveRateValues, truePositiveRateValues
+        indices = np.unique(np.searchsorted(falsePositiveRateValues + truePositiveRateValues, np.linspace(0, 2, self.maxCurvePoints)))
+        indices = np.union1d(np.clip(indices, 0, len(falsePositiveRateValues) - 1), [0, len(falsePositiveRateValues) - 1])
+        return falsePositiveRateValues[indices], truePositiveRateValues[indices]
     
     def _plotThreshold(self, falsePositiveRateValues, truePositiveRateValues, thresholds, color):
-        # plot threshold in the middle of the roc data
-        for i in range(len(thresholds)):
-            if thresholds[i] <= 0.5:
-                break
-        indexBelow = i
-        indexAbove = i-1
-        self.axes.plot(falsePositiveRateValues[indexBelow], truePositiveRateValues[indexBelow], 'o-', color=color)
-        self.axes.annotate(np.round(thresholds[indexBelow],2), (falsePositiveRateValues[indexBelow], truePositiveRateValues[indexBelow]-0.04), color=color)    
-        self.axes.plot(falsePositiveRateValues[indexAbove], truePositiveRateValues[indexAbove], 'o-', color=color)
-        self.axes.annotate(np.round(thresholds[indexAbove],2), (falsePositiveRateValues[indexAbove], truePositiveRateValues[indexAbove]-0.04), color=color)   
+        # plot threshold in the middle of the roc data: the first (descending) threshold <= 0.5 and the one before it
+        i = min(np.searchsorted(-np.asarray(thresholds), -0.5, side='left'), len(thresholds) - 1)
+        artists = list()
+        for index in [i, i-1]:
+            artists += self.axes.plot(falsePositiveRateValues[index], truePositiveRateValues[index], 'o-', color=color, animated=True)
+            artists.append(self.axes.annotate(np.round(thresholds[index],2), (falsePositiveRateValues[index], truePositiveRateValues[index]-0.04), color=color, animated=True))
+        return artists
 
     def _plotFrame(self, ax):
         ax.grid(True)
@@ -49,14 +194,22 @@ class ROCWidget(FigureCanvas):
         ax.set_xlabel('False Positive Rate')
         ax.set_ylabel('True Positive Rate')
         self._plotRandomGuessBaseline(ax)
+        # fixed limits, the cached frame stays valid when curves are added
+        ax.set_xlim(-0.05, 1.05)
+        ax.set_ylim(-0.05, 1.05)
 
     def _plotRandomGuessBaseline(self, ax):
         ax.plot([0,1],[0,1], 'k--', linewidth=.5, color='black') #diagonal line
 
 
-class AccuracyWidget(FigureCanvas):
+class AccuracyWidget(ProfiledFigureCanvas):
+
+    # live mode: the losses are read from a TrainingWorker.LearningCurveBuffer on a timer and
+    # appended to the existing lines, which are blitted over the cached frame; the axis limits
+    # grow in steps, so a full redraw only happens when the curve leaves them
+    liveUpdateInterval = 250
     
-    def __init__(self, runHistory, width = 8, height = 8):
+    def __init__(self, runHistory=None, width = 8, height = 8, learningCurve=None):
         self._figure = Figure(figsize=(width, height))
         self.run_history = runHistory
         FigureCanvas.__init__(self, self._figure)
@@ -64,6 +217,20 @@ class AccuracyWidget(FigureCanvas):
         self._plotFrame(self.axes)
         self._plotRunHistoryAccuracies(self.axes)
 
+        self._learningCurve = learningCurve
+        if learningCurve is not None:
+            self._liveRunId = None
+            self._liveValues = np.empty((0, 2))
+            self._background = None
+            for line in [self._lossLine, self._valLossLine]:
+                line.set_animated(True)
+            self.axes.set_xlim(0, 10)
+            self.axes.set_ylim(0, 1)
+            self.mpl_connect('draw_event', self._onDraw)
+            self._timer = qtc.QTimer(self)
+            self._timer.timeout.connect(self.updateLive)
+            self._timer.start(self.liveUpdateInterval)
+
     def _plotFrame(self, ax):
         ax.grid(True)
         ax.set_title('Learning progress')
@@ -71,6 +238,65 @@ class AccuracyWidget(FigureCanvas):
         ax.set_ylabel('loss')
 
     def _plotRunHistoryAccuracies(self, ax):
-        ax.plot(self.run_history.history['loss'], 'blue', marker='.', label='training-data loss')
-        ax.plot(self.run_history.history['val_loss'], 'red', marker='.', label='validation-data loss')
+        history = self.run_history.history if self.run_history is not None else {'loss': [], 'val_loss': []}
+        self._lossLine, = ax.plot(history['loss'], 'blue', marker='.', label='training-data loss')
+        self._valLossLine, = ax.plot(history['val_loss'], 'red', marker='.', label='validation-data loss')
         ax.legend()
+
+    def updateLive(self):
+        if not self.isVisible():
+            return
+        runId, epochs, values = self._learningCurve.read(len(self._liveValues))
+        if runId != self._liveRunId:
+            # another run started, begin again with its first epoch
+            self._liveRunId = runId
+            runId, epochs, values = self._learningCurve.read(0)
+            self._liveValues = np.empty((0, 2))
+        if not len(epochs):
+            return
+        if epochs[0] > len(self._liveValues):
+            # epochs overwritten in the buffer before they were read stay a gap
+            self._liveValues = np.concatenate([self._liveValues, np.full((epochs[0] - len(self._liveValues), 2), np.nan)])
+        self._liveValues = np.concatenate([self._liveValues, values])
+        epochIndices = np.arange(len(self._liveValues))
+        self._lossLine.set_data(epochIndices, self._liveValues[:, 0])
+        self._valLossLine.set_data(epochIndices, self._liveValues[:, 1])
+
+        if self._extendLimits() or self._background is None:
+            self.draw_idle()
+        else:
+            self.restore_region(self._background)
+            self._drawLines()
+            self.blit(self.axes.bbox)
+
+    def _extendLimits(self):
+        # doubles the epoch axis and widens the loss axis by a margin when the curve leaves them
+        changed = False
+        xMax = self.axes.get_xlim()[1]
+        if len(self._liveValues) - 1 > xMax:
+            self.axes.set_xlim(0, max(2 * xMax, len(self._liveValues)))
+            changed = True
+        yMin, yMax = self.axes.get_ylim()
+        low, high = np.nanmin(self._liveValues), np.nanmax(self._liveValues)
+        if low < yMin or high > yMax:
+            margin = 0.1 * (max(high, yMax) - min(low, yMin))
+            self.axes.set_ylim(min(low, yMin) - margin if low < yMin else yMin, max(high, yMax) + margin if high > yMax else yMax)
+            changed = True
+        return changed
+
+    def _onDraw(self, event):
+        self._background = self.copy_from_bbox(self.axes.bbox)
+        self._drawLines()
+
+    def _drawLines(self):
+        self.axes.draw_artist(self._lossLine)
+        self.axes.draw_artist(self._valLossLine)
+
+    def stopLive(self):
+        if self._learningCurve is not None:
+            self._timer.stop()
+
+    def release(self):
+        self.stopLive()
+        self.run_history = None
+        super().release()
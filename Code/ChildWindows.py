@@ -1,24 +1,124 @@
+from collections import OrderedDict
+import numpy as np
 from PyQt5 import QtWidgets as qtw 
 from PyQt5 import QtGui as qtg 
 from PyQt5 import QtCore as qtc
 from CanvasWidgets import HistogramWidget
 from CanvasWidgets import AccuracyWidget
+from MemoryUsage import formatBytes
+from Profiling import profiler
 
 
 class LearningWindow(qtw.QWidget):
 
     """LearningWindow constructor"""
-    def __init__(self, networkManager): 
+    def __init__(self, trainingRun, learningCurve=None): 
         super().__init__()
-        self._run_history = networkManager.current_run_learning_history
-        if not networkManager.current_run_topology:
-            self.setWindowTitle("Learning Graph for 'No hidden Layers'-Run")
-        else:
-            self.setWindowTitle("Learning Graph for " + str(networkManager.current_run_topology) + " - Run")
         #self.resize(1000, 800)
-        mainLayout = qtw.QVBoxLayout()
-        mainLayout.addWidget(AccuracyWidget(self._run_history))
-        self.setLayout(mainLayout)
+        self._accuracyWidget = None
+        self._throughputLabel = qtw.QLabel()
+        self._mainLayout = qtw.QVBoxLayout()
+        self._mainLayout.addWidget(self._throughputLabel)
+        # phases of the run next to the learning graph
+        self._profilePanel = ProfilePanel()
+        windowLayout = qtw.QHBoxLayout()
+        windowLayout.addLayout(self._mainLayout)
+        windowLayout.addWidget(self._profilePanel)
+        self.setLayout(windowLayout)
+        if learningCurve is None:
+            self.showRun(trainingRun)
+        else:
+            self.showLive(trainingRun, learningCurve)
+
+    def _setTitle(self, trainingRun, suffix=""):
+        if not trainingRun.hiddenLayersConfig:
+            self.setWindowTitle("Learning Graph for 'No hidden Layers'-Run" + suffix)
+        else:
+            self.setWindowTitle("Learning Graph for " + str(trainingRun.hiddenLayersConfig) + " - Run" + suffix)
+
+    def _replaceAccuracyWidget(self, accuracyWidget):
+        if self._accuracyWidget is not None:
+            self._accuracyWidget.release()
+            self._mainLayout.removeWidget(self._accuracyWidget)
+            self._accuracyWidget.deleteLater()
+        self._accuracyWidget = accuracyWidget
+        self._mainLayout.insertWidget(0, self._accuracyWidget)
+
+    def showLive(self, trainingRun, learningCurve):
+        # trainingRun is the TrainingJob in training, its losses are streamed from the learningCurve buffer
+        self._setTitle(trainingRun, " (live)")
+        self._replaceAccuracyWidget(AccuracyWidget(learningCurve=learningCurve))
+        self._throughputLabel.setText("training ...")
+        self._profilePanel.showEvents(None)
+
+    def showRun(self, trainingRun):
+        # trainingRun is a finished TrainingJob of the TrainingWorker
+        self._run_history = trainingRun.learning_history
+        self._setTitle(trainingRun)
+        self._replaceAccuracyWidget(AccuracyWidget(self._run_history))
+        self._profilePanel.showEvents(trainingRun.profile_events)
+
+        if trainingRun.samples_per_second is not None:
+            self._throughputLabel.setText("batch size %d, training time %.2fs, throughput %.0f samples/s" % (
+                trainingRun.batch_size,
+                trainingRun.training_time,
+                trainingRun.samples_per_second))
+
+    def closeEvent(self, event):
+        # the figure and the run are released with the window (it is deleted on close)
+        if self._accuracyWidget is not None:
+            self._accuracyWidget.release()
+        self._run_history = None
+        super().closeEvent(event)
+
+
+class ProfilePanel(qtw.QWidget):
+
+    # profiler spans of one run: phase, count, total and last time, peak RSS; epoch statistics below
+
+    """ProfilePanel constructor"""
+    def __init__(self):
+        super().__init__()
+        self._events = None
+        layout = qtw.QVBoxLayout()
+        self._table = qtw.QTableWidget(0, 5)
+        self._table.setHorizontalHeaderLabels(["Phase", "n", "total [s]", "last [s]", "peak RSS"])
+        self._table.verticalHeader().setVisible(False)
+        self._table.setEditTriggers(qtw.QAbstractItemView.NoEditTriggers)
+        layout.addWidget(self._table)
+        self._epochLabel = qtw.QLabel()
+        self._epochLabel.setWordWrap(True)
+        layout.addWidget(self._epochLabel)
+        button_export = qtw.QPushButton("Chrome Trace exportieren")
+        layout.addWidget(button_export)
+        self.setLayout(layout)
+        self.setMinimumWidth(420)
+
+        button_export.clicked.connect(self.buttonExportClicked)
+
+    def showEvents(self, events):
+        self._events = events
+        summary = profiler.summary(events or [])
+        self._table.setRowCount(len(summary))
+        for row, (name, entry) in enumerate(summary.items()):
+            for column, text in enumerate([name, str(entry['count']), "%.3f" % entry['total'], "%.3f" % entry['last'], formatBytes(entry['peak_rss'])]):
+                self._table.setItem(row, column, qtw.QTableWidgetItem(text))
+        self._table.resizeColumnsToContents()
+
+        epochs = [event['args'] for event in events or [] if event['ph'] == 'X' and event['name'] == 'epoch']
+        if epochs:
+            self._epochLabel.setText("%d epochs: step time %.2f ms (median), %.0f samples/s (median)" % (
+                len(epochs),
+                np.median([epoch['step_time'] for epoch in epochs]) * 1000,
+                np.median([epoch['samples_per_second'] for epoch in epochs])))
+        else:
+            self._epochLabel.setText("no epochs recorded" if events is not None else "training ...")
+
+    def buttonExportClicked(self):
+        # the events of the run, or everything recorded in this process while a run is in training
+        path, _ = qtw.QFileDialog.getSaveFileName(self, "Chrome Trace exportieren", "trace.json", "JSON (*.json)")
+        if path:
+            profiler.exportChromeTrace(path, self._events)
 
               
 class HistogrammWindow(qtw.QWidget):
@@ -29,9 +129,27 @@ class HistogrammWindow(qtw.QWidget):
         self.setWindowTitle("Histogramm")
         self.resize(1000, 800)
         mainLayout = qtw.QVBoxLayout()
-        mainLayout.addWidget(HistogramWidget(dataManager.odf, width=20, height=10, dpi=50))
+        histograms = dataManager.histograms
+        scaledEdges = histograms.scaledEdges(dataManager.scaler.mean_, dataManager.scaler.scale_)
+        self._histogramWidget = HistogramWidget(histograms, scaledEdges, width=20, height=10, dpi=50)
+
+        # the bin counts of all variants are precomputed, switching only redraws
+        self._variant = qtw.QComboBox()
+        for label, variant in zip(["Rohdaten", "bereinigt", "standardisiert", "Rohdaten vs. bereinigt"], HistogramWidget.variants):
+            self._variant.addItem(label, variant)
+        self._variant.setCurrentIndex(HistogramWidget.variants.index('imputed'))
+        self._variant.currentIndexChanged.connect(self.variantChanged)
+        mainLayout.addWidget(self._variant)
+        mainLayout.addWidget(self._histogramWidget)
         self.setLayout(mainLayout)
 
+    def variantChanged(self, index):
+        self._histogramWidget.plot(self._variant.itemData(index))
+
+    def closeEvent(self, event):
+        self._histogramWidget.release()
+        super().closeEvent(event)
+
 
 class TabelleWindow(qtw.QWidget):
 
@@ -43,34 +161,154 @@ class TabelleWindow(qtw.QWidget):
         self.setWindowTitle("Tabelle")
         self.resize(970, 600)
         mainLayout = qtw.QVBoxLayout()
+        self._model = PandasModel(dataManager.odf)
+
+        # range filter on one column
+        filterLayout = qtw.QHBoxLayout()
+        self._filterColumn = qtw.QComboBox()
+        self._filterColumn.addItems([str(column) for column in dataManager.odf.columns])
+        filterLayout.addWidget(self._filterColumn)
+        self._filterMinimum = qtw.QLineEdit()
+        self._filterMinimum.setPlaceholderText("von")
+        filterLayout.addWidget(self._filterMinimum)
+        self._filterMaximum = qtw.QLineEdit()
+        self._filterMaximum.setPlaceholderText("bis")
+        filterLayout.addWidget(self._filterMaximum)
+        button_filter = qtw.QPushButton("Filtern")
+        filterLayout.addWidget(button_filter)
+        mainLayout.addLayout(filterLayout)
+
         tableview = qtw.QTableView()
-        tableview.setModel(PandasModel(dataManager.odf))
+        tableview.setModel(self._model)
+        # keep the initial (file) order until a column header is clicked
+        tableview.horizontalHeader().setSortIndicator(-1, qtc.Qt.AscendingOrder)
+        tableview.setSortingEnabled(True)
         mainLayout.addWidget(tableview)
         self.setLayout(mainLayout)
 
+        button_filter.clicked.connect(self.buttonFilterClicked)
+
+    def buttonFilterClicked(self):
+        try:
+            minimum = float(self._filterMinimum.text()) if self._filterMinimum.text() else None
+            maximum = float(self._filterMaximum.text()) if self._filterMaximum.text() else None
+        except ValueError as e:
+            print(f"### !! please enter numbers ONLY !! ###: {e}")
+            return
+        self._model.setFilter(self._filterColumn.currentIndex(), minimum, maximum)
+
+
 class PandasModel(qtc.QAbstractTableModel):
+
+    # rows are handed to the view in blocks (canFetchMore/fetchMore) and
+    # display strings are formatted lazily for blocks of visible rows
+    _fetchBlockSize = 1000
+    _formatBlockSize = 256
+    _maxFormattedBlocks = 512
+
     def __init__(self, data, parent=None):
         qtc.QAbstractTableModel.__init__(self, parent)
-        self._data = data
+        self._columnNames = list(data.columns)
+        # one NumPy array per column, a numeric column of a DataFrame is not copied
+        self._columns = [data[column].to_numpy() for column in data.columns]
+        self._rows = len(data.index)
+        # view row -> data row, changed by sorting and filtering
+        self._order = np.arange(self._rows)
+        self._sortColumn = None
+        self._sortOrder = qtc.Qt.AscendingOrder
+        self._filterMask = None
+        self._sortIndexes = dict()
+        self._formattedBlocks = OrderedDict()
+        self._loadedRows = min(self._fetchBlockSize, len(self._order))
 
-    def rowCount(self, parent=None):
-        return len(self._data.values)
+    def rowCount(self, parent=qtc.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._loadedRows
 
-    def columnCount(self, parent=None):
-        return self._data.columns.size
+    def columnCount(self, parent=qtc.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columnNames)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self._loadedRows < len(self._order)
+
+    def fetchMore(self, parent):
+        count = min(self._fetchBlockSize, len(self._order) - self._loadedRows)
+        self.beginInsertRows(qtc.QModelIndex(), self._loadedRows, self._loadedRows + count - 1)
+        self._loadedRows += count
+        self.endInsertRows()
 
     def data(self, index, role=qtc.Qt.DisplayRole):
         if index.isValid():
             if role == qtc.Qt.DisplayRole:
-                return qtc.QVariant(str(
-                    self._data.values[index.row()][index.column()]))
+                return self._displayString(index.row(), index.column())
         return qtc.QVariant()
 
+    def _displayString(self, row, column):
+        block = row // self._formatBlockSize
+        strings = self._formattedBlocks.get((column, block))
+        if strings is None:
+            start = block * self._formatBlockSize
+            rows = self._order[start:start + self._formatBlockSize]
+            strings = [str(value) for value in self._columns[column][rows].tolist()]
+            self._formattedBlocks[(column, block)] = strings
+            if len(self._formattedBlocks) > self._maxFormattedBlocks:
+                self._formattedBlocks.popitem(last=False)
+        else:
+            self._formattedBlocks.move_to_end((column, block))
+        return strings[row - block * self._formatBlockSize]
+
     def headerData(self, section, orientation, role):
         if (
          orientation == qtc.Qt.Horizontal and 
          role == qtc.Qt.DisplayRole
          ): 
-            return self._data.columns[section]
+            return self._columnNames[section]
+        elif orientation == qtc.Qt.Vertical and role == qtc.Qt.DisplayRole:
+            # position of the row in the file, also when sorted or filtered
+            return str(self._order[section] + 1)
         else: 
             return super().headerData(section, orientation, role)   
+
+    def _sortIndex(self, column):
+        # argsort per column, computed once and reused for sorting and filtering
+        if column not in self._sortIndexes:
+            self._sortIndexes[column] = np.argsort(self._columns[column], kind='stable')
+        return self._sortIndexes[column]
+
+    def sort(self, column, order=qtc.Qt.AscendingOrder):
+        if column < 0:
+            return
+        self._sortColumn = column
+        self._sortOrder = order
+        self._updateOrder()
+
+    def setFilter(self, column, minimum=None, maximum=None):
+        # keep rows with minimum <= value <= maximum, no bounds removes the filter
+        if minimum is None and maximum is None:
+            self._filterMask = None
+        else:
+            sortIndex = self._sortIndex(column)
+            sortedValues = self._columns[column][sortIndex]
+            first = 0 if minimum is None else np.searchsorted(sortedValues, minimum, side='left')
+            last = len(sortedValues) if maximum is None else np.searchsorted(sortedValues, maximum, side='right')
+            self._filterMask = np.zeros(self._rows, dtype=bool)
+            self._filterMask[sortIndex[first:last]] = True
+        self._updateOrder()
+
+    def _updateOrder(self):
+        self.beginResetModel()
+        if self._sortColumn is None:
+            order = np.arange(self._rows)
+        else:
+            order = self._sortIndex(self._sortColumn)
+            if self._sortOrder == qtc.Qt.DescendingOrder:
+                order = order[::-1]
+        if self._filterMask is not None:
+            order = order[self._filterMask[order]]
+        self._order = order
+        self._formattedBlocks.clear()
+        self._loadedRows = min(self._fetchBlockSize, len(self._order))
+        self.endResetModel()
@@ -0,0 +1,95 @@
+import numpy as np
+from sklearn.metrics import roc_curve
+
+
+def binaryCrossEntropy(y, probabilities, epsilon=1e-7):
+    # mean loss as keras computes it from probabilities (clipped to [epsilon, 1 - epsilon])
+    probabilities = np.clip(probabilities, epsilon, 1 - epsilon)
+    return float(np.mean(-(y * np.log(probabilities) + (1 - y) * np.log(1 - probabilities))))
+
+
+class BinaryEvaluation:
+
+    # all metrics of one set of rows, computed from the outcomes and the predicted probabilities
+
+    """BinaryEvaluation constructor"""
+    def __init__(self, y, probabilities):
+        self.y = np.asarray(y, dtype=np.float64)
+        self.probabilities = np.asarray(probabilities, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.y)
+
+    def loss(self):
+        return binaryCrossEntropy(self.y, self.probabilities)
+
+    def accuracy(self, threshold=0.5):
+        # keras binary accuracy: a probability above the threshold predicts outcome 1
+        return float(np.mean((self.probabilities > threshold) == (self.y == 1)))
+
+    def confusionMatrix(self, threshold=0.5):
+        # [[true negatives, false positives], [false negatives, true positives]] like sklearn
+        predicted = (self.probabilities > threshold).astype(np.intp)
+        actual = (self.y == 1).astype(np.intp)
+        return np.bincount(actual * 2 + predicted, minlength=4).reshape(2, 2)
+
+    def thresholdMetrics(self, threshold=0.5):
+        (tn, fp), (fn, tp) = self.confusionMatrix(threshold)
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        return {
+            'accuracy': (tp + tn) / max(len(self.y), 1),
+            'precision': precision,
+            'recall': recall,
+            'specificity': tn / (tn + fp) if tn + fp else 0.0,
+            'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        }
+
+    def rocCurve(self):
+        return roc_curve(self.y, self.probabilities)
+
+    def auc(self):
+        # trapezoidal area under the ROC curve (the dropped intermediate points are collinear)
+        FPR, TPR, _ = self.rocCurve()
+        return float(np.sum(np.diff(FPR) * (TPR[1:] + TPR[:-1]) / 2))
+
+    def summary(self, threshold=0.5):
+        summary = {'rows': len(self.y), 'loss': self.loss(), 'auc': self.auc()}
+        summary.update(self.thresholdMetrics(threshold))
+        summary['confusion_matrix'] = self.confusionMatrix(threshold).tolist()
+        return summary
+
+
+class SplitEvaluation:
+
+    # one prediction pass over the rows of all splits, the splits are index arrays into these rows
+
+    """SplitEvaluation constructor"""
+    def __init__(self, y, probabilities, splits):
+        # splits: {name: row positions}, e.g. 'holdout' as the concatenation of the testing and validation rows
+        self.y = np.asarray(y, dtype=np.float64)
+        self.probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.splits = {name: np.asarray(rows) for name, rows in splits.items()}
+
+    @classmethod
+    def fromSplits(cls, predict, X_train, y_train, X_test, y_test, X_validate, y_validate):
+        # rows of all splits in one array, scored by one predict call, the splits are row ranges into it;
+        # the hold-out is the testing followed by the validation rows, as it was concatenated before
+        X = np.concatenate([X_train.values, X_validate.values, X_test.values])
+        y = np.concatenate([y_train.values, y_validate.values, y_test.values])
+        validateStart = len(X_train.index)
+        testStart = validateStart + len(X_validate.index)
+        splits = {
+            'train': np.arange(validateStart),
+            'validate': np.arange(validateStart, testStart),
+            'test': np.arange(testStart, len(X)),
+        }
+        splits['holdout'] = np.concatenate([splits['test'], splits['validate']])
+        return cls(y, predict(X), splits)
+
+    def __getitem__(self, name):
+        rows = self.splits[name]
+        return BinaryEvaluation(self.y[rows], self.probabilities[rows])
+
+    def summary(self, threshold=0.5):
+        return {name: self[name].summary(threshold) for name in self.splits}
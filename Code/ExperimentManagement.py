@@ -0,0 +1,370 @@
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas
+
+# set per worker process by _initializeWorker
+_dataManager = None
+_networkManager = None
+
+
+def createSweepGrid(hiddenLayersConfigs, nonLinearActivations=(True,), dropOutLayers=(False,), earlyStoppings=(False,), repetitions=1, epochs=50, batchSize=1, seed=None, folds=None):
+    # one experiment per combination and repetition; repetition r of every
+    # configuration trains on the same split when a seed is given.
+    # With folds (see DataManager.createStratifiedFolds) every configuration is trained once per fold instead.
+    experiments = list()
+    for hiddenLayersConfig, nonLinear, dropout, earlyStopping in itertools.product(hiddenLayersConfigs, nonLinearActivations, dropOutLayers, earlyStoppings):
+        for repetition in range(repetitions if folds is None else len(folds)):
+            experiments.append({
+                'topology': list(hiddenLayersConfig),
+                'nonLinearActivation': nonLinear,
+                'dropout': dropout,
+                'earlyStopping': earlyStopping,
+                'epochs': epochs,
+                'batchSize': batchSize,
+                'repetition': repetition,
+                'seed': None if seed is None else seed + repetition,
+                'fold': None if folds is None else folds[repetition],
+            })
+    return experiments
+
+
+def _initializeWorker(threadsPerWorker, backend='keras'):
+    # every worker is a fresh (spawned) interpreter with its own TensorFlow runtime,
+    # the thread limits have to be set before TensorFlow runs its first operation;
+    # workers of the numpy backend do not import TensorFlow at all
+    # (the BLAS/OpenMP limits are inherited from the environment, see _WorkerPool)
+    global _dataManager, _networkManager
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    if backend == 'keras':
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threadsPerWorker)
+        tf.config.threading.set_inter_op_parallelism_threads(threadsPerWorker)
+
+    from PimaDataManagement import DataManager
+    from Headless import createNetworkManager
+    _dataManager = DataManager()
+    _networkManager = createNetworkManager(backend)
+    _networkManager.verbose = 0
+
+
+def _runExperiment(experiment):
+    from sklearn import metrics
+    start = time.perf_counter()
+    if experiment['fold'] is None:
+        _dataManager.splitDataIntoTrainingValidationAndTestingSets(experiment['seed'])
+    else:
+        _dataManager.splitDataByFold(experiment['fold'])
+    _networkManager.createNetworkModel(experiment['topology'], experiment['nonLinearActivation'], experiment['dropout'])
+    roc_data, bestEpoch = _networkManager.trainAndSupervise(
+        _dataManager.X_train, _dataManager.y_train,
+        _dataManager.X_test, _dataManager.y_test,
+        _dataManager.X_validate, _dataManager.y_validate,
+        experiment['epochs'], experiment['earlyStopping'], experiment['batchSize'])
+    FPR, TPR, thresholds = roc_data
+
+    result = dict(experiment)
+    del result['fold']
+    result['topology'] = str(experiment['topology'])
+    result['holdout_accuracy'] = float(_networkManager.current_run_holdout_accuracy_value)
+    result['auc'] = float(metrics.auc(FPR, TPR))
+    result['best_epoch'] = int(bestEpoch)
+    result['min_val_loss'] = float(np.min(_networkManager.current_run_learning_history.history['val_loss']))
+    result['wall_time'] = time.perf_counter() - start
+    result['pid'] = os.getpid()
+    return result
+
+
+class _WorkerPool(ProcessPoolExecutor):
+
+    # spawned workers with the BLAS/OpenMP thread limits in their environment: a worker imports numpy (and with
+    # it OpenBLAS/OpenMP) when it unpickles the initializer, before _initializeWorker runs, so the limits have to
+    # be in the environment it is started with. Workers are started on demand by submit, the limits stay in
+    # os.environ until the pool is shut down and the previous values are restored then
+
+    threadLimitVariables = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+    """_WorkerPool constructor"""
+    def __init__(self, processes, threadsPerWorker, backend):
+        self._previousEnvironment = {name: os.environ.get(name) for name in self.threadLimitVariables}
+        os.environ.update({name: str(threadsPerWorker) for name in self.threadLimitVariables})
+        super().__init__(max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=_initializeWorker, initargs=(threadsPerWorker, backend))
+
+    def shutdown(self, *args, **kwargs):
+        super().shutdown(*args, **kwargs)
+        if self._previousEnvironment is None:
+            return
+        for name, value in self._previousEnvironment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self._previousEnvironment = None
+
+
+def _createWorkerPool(processes, threadsPerWorker, backend, tasks):
+    if processes is None:
+        processes = max(1, (os.cpu_count() or 1) // threadsPerWorker)
+    processes = max(1, min(processes, tasks))
+    return processes, _WorkerPool(processes, threadsPerWorker, backend)
+
+
+def runSweep(experiments, processes=None, threadsPerWorker=1, outputFile=None, backend='keras'):
+    # train all experiments on a pool of isolated worker processes and collect one results table
+    processes, pool = _createWorkerPool(processes, threadsPerWorker, backend, len(experiments))
+    print(f"sweeping {len(experiments)} experiments on {processes} {backend} worker processes ({threadsPerWorker} threads each)")
+
+    start = time.perf_counter()
+    results = list()
+    with pool as executor:
+        futures = [executor.submit(_runExperiment, experiment) for experiment in experiments]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print("** %d/%d %s -> acc %.2f%% / AUC %.2f (%.1fs)" % (
+                len(results), len(experiments), result['topology'], result['holdout_accuracy'] * 100, result['auc'], result['wall_time']))
+    totalWallTime = time.perf_counter() - start
+    print("sweep finished in %.1fs (%.1fs of training summed over workers)" % (totalWallTime, sum(r['wall_time'] for r in results)))
+
+    resultsTable = pandas.DataFrame(results).sort_values(['topology', 'nonLinearActivation', 'dropout', 'earlyStopping', 'repetition'], ignore_index=True)
+    resultsTable.attrs['total_wall_time'] = totalWallTime
+    if outputFile:
+        resultsTable.to_csv(outputFile, index=False)
+        print(f"results written to {outputFile}")
+    return resultsTable
+
+
+def summarizeSweep(resultsTable):
+    # mean and standard deviation over the repetitions of every configuration
+    configuration = ['topology', 'nonLinearActivation', 'dropout', 'earlyStopping', 'epochs', 'batchSize']
+    return resultsTable.groupby(configuration)[['holdout_accuracy', 'auc', 'best_epoch', 'wall_time']].agg(['mean', 'std'])
+
+
+def crossValidate(hiddenLayersConfigs, k=5, repeats=1, nonLinearActivations=(True,), dropOutLayers=(False,), earlyStoppings=(False,), epochs=50, batchSize=1, seed=None, processes=None, threadsPerWorker=1, outputFile=None, backend='keras'):
+    # stratified (repeated) k-fold: the fold indices are generated once and the folds are trained concurrently
+    from PimaDataManagement import DataManager
+    folds = DataManager().createStratifiedFolds(k, repeats, seed)
+    experiments = createSweepGrid(hiddenLayersConfigs, nonLinearActivations, dropOutLayers, earlyStoppings, epochs=epochs, batchSize=batchSize, seed=seed, folds=folds)
+    resultsTable = runSweep(experiments, processes, threadsPerWorker, outputFile, backend)
+    summary = summarizeSweep(resultsTable)
+    print(f"{repeats}x {k}-fold cross-validation finished in %.1fs" % resultsTable.attrs['total_wall_time'])
+    return resultsTable, summary
+
+
+def sampleTopologies(count, maxLayers=3, sizes=(4, 8, 12, 16, 24, 32), seed=None):
+    # distinct random hidden layer configurations (1 to maxLayers layers) as candidates of a topology search
+    random = np.random.default_rng(seed)
+    topologies = list()
+    for _ in range(100 * count):
+        if len(topologies) == count:
+            break
+        topology = [int(size) for size in random.choice(sizes, size=random.integers(1, maxLayers + 1))]
+        if topology not in topologies:
+            topologies.append(topology)
+    return topologies
+
+
+def _trainCandidate(task):
+    # one candidate of a search rung for task['epochs'] (more) epochs, scored on the validation split.
+    # A promoted candidate may land on another worker: it is loaded from the checkpoint of its previous
+    # rung and continues with its weights and Adam state (continueTraining), then it is checkpointed again
+    start = time.perf_counter()
+    _dataManager.splitDataIntoTrainingValidationAndTestingSets(task['seed'])
+    if task['resume']:
+        _networkManager.loadCheckpoint(task['checkpoint'])
+        train = _networkManager.continueTraining
+    else:
+        _networkManager.createNetworkModel(task['topology'], task['nonLinearActivation'], task['dropout'])
+        train = _networkManager.trainAndSupervise
+    train(
+        _dataManager.X_train, _dataManager.y_train,
+        _dataManager.X_test, _dataManager.y_test,
+        _dataManager.X_validate, _dataManager.y_validate,
+        task['epochs'], False, task['batchSize'])
+    if task['checkpoint'] is not None:
+        _networkManager.saveCheckpoint(task['checkpoint'])
+    evaluation = _networkManager.current_run_evaluation
+    return {
+        'val_loss': evaluation['validate'].loss(),
+        'val_auc': evaluation['validate'].auc(),
+        'test_loss': evaluation['test'].loss(),
+        'test_auc': evaluation['test'].auc(),
+        'test_accuracy': evaluation['test'].accuracy(),
+        'wall_time': time.perf_counter() - start,
+    }
+
+
+def _rankCandidates(candidates, metric):
+    # best first: lowest validation loss or highest validation AUC
+    return sorted(candidates, key=lambda candidate: candidate[metric] if metric == 'val_loss' else -candidate[metric])
+
+
+def successiveHalving(executor, hiddenLayersConfigs, checkpointDirectory, minEpochs=2, maxEpochs=54, eta=3, metric='val_loss', nonLinearActivation=True, dropout=False, batchSize=32, seed=None, bracket=0, log=None):
+    # every candidate gets minEpochs, the best 1/eta of them are promoted and trained on to eta times that
+    # budget, and so on until the survivors reach maxEpochs (a candidate alone in its rung goes straight there).
+    # A promoted candidate continues from its checkpoint in checkpointDirectory, so a rung costs only the epochs it adds.
+    # All candidates train on the same split and are ranked on the validation split (metric 'val_loss' or
+    # 'val_auc'), the test split is left for the report. Returns the winner, log gets one row per trained rung.
+    budgets = list()
+    budget = minEpochs
+    while budget < maxEpochs:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(maxEpochs)
+    if log is None:
+        log = list()
+
+    survivors = [{'topology': list(topology), 'checkpoint': os.path.join(checkpointDirectory, f"bracket{bracket}-candidate{i}"), 'epochs': 0}
+        for i, topology in enumerate(hiddenLayersConfigs)]
+    for rung, budget in enumerate(budgets):
+        if len(survivors) == 1:
+            budget = maxEpochs
+        tasks = [{'topology': survivor['topology'], 'checkpoint': survivor['checkpoint'], 'resume': survivor['epochs'] > 0, 'epochs': budget - survivor['epochs'], 'seed': seed,
+            'nonLinearActivation': nonLinearActivation, 'dropout': dropout, 'batchSize': batchSize} for survivor in survivors]
+        for survivor, task, scores in zip(survivors, tasks, executor.map(_trainCandidate, tasks)):
+            survivor.update(scores, epochs=budget)
+            log.append(dict(scores, bracket=bracket, rung=rung, topology=str(survivor['topology']), epochs=budget, epochs_trained=task['epochs']))
+        ranked = _rankCandidates(survivors, metric)
+        print(f"** bracket {bracket} rung {rung}: {len(survivors)} candidates at {budget} epochs, best {ranked[0]['topology']} ({metric} {ranked[0][metric]:.4f})")
+        if budget >= maxEpochs:
+            return ranked[0]
+        survivors = ranked[:max(1, len(survivors) // eta)]
+
+
+def _hyperbandBracketSizes(candidates, brackets, eta):
+    # hyperband's number of candidates per bracket, most exploratory bracket first; when there are fewer
+    # candidates than that in total, the counts are scaled down (largest remainder) to partition them
+    counts = np.array([int(math.ceil((brackets + 1) / (bracket + 1) * eta ** bracket)) for bracket in range(brackets, -1, -1)])
+    if counts.sum() <= candidates:
+        return counts.tolist()
+    shares = counts * candidates / counts.sum()
+    sizes = np.floor(shares).astype(int)
+    sizes[np.argsort(sizes - shares)[:candidates - sizes.sum()]] += 1
+    return sizes.tolist()
+
+
+def topologySearch(hiddenLayersConfigs, scheduler='hyperband', minEpochs=2, maxEpochs=54, eta=3, metric='val_loss', nonLinearActivation=True, dropout=False, batchSize=32, seed=None,
+        compareWithGrid=False, processes=None, threadsPerWorker=1, backend='keras', outputFile=None):
+    # successive halving over all candidates, or hyperband: brackets of successive halving from many
+    # candidates on small budgets down to few candidates on the full budget. Every candidate is in one
+    # bracket only (see _hyperbandBracketSizes), otherwise the brackets train the same candidates over
+    # and over and a pool of a dozen candidates costs as much as the grid. The savings come from the
+    # candidates dropped in early rungs: the conservative brackets train their few candidates for
+    # maxEpochs, so with only a handful of candidates (about one per bracket) little is saved.
+    # The compute is counted in candidate-epochs against the exhaustive grid (every candidate trained
+    # for maxEpochs); compareWithGrid also trains that grid to check that the search finds a winner of
+    # the same quality on the test split.
+    if seed is None:
+        seed = int(np.random.default_rng().integers(2**31))
+    random = np.random.default_rng(seed)
+    log = list()
+    start = time.perf_counter()
+    processes, pool = _createWorkerPool(processes, threadsPerWorker, backend, len(hiddenLayersConfigs))
+    print(f"{scheduler} search over {len(hiddenLayersConfigs)} topologies, {minEpochs}-{maxEpochs} epochs, eta {eta}, on {processes} {backend} worker processes")
+    with pool as executor, tempfile.TemporaryDirectory(prefix='search-') as checkpointDirectory:
+        settings = dict(metric=metric, nonLinearActivation=nonLinearActivation, dropout=dropout, batchSize=batchSize, seed=seed, log=log)
+        if scheduler == 'halving':
+            winner = successiveHalving(executor, hiddenLayersConfigs, checkpointDirectory, minEpochs, maxEpochs, eta, **settings)
+        else:
+            bracketWinners = list()
+            brackets = int(math.floor(math.log(maxEpochs / minEpochs, eta) + 1e-9))
+            sizes = _hyperbandBracketSizes(len(hiddenLayersConfigs), brackets, eta)
+            print("** hyperband brackets of " + ", ".join(str(size) for size in sizes) + " candidates")
+            order = random.permutation(len(hiddenLayersConfigs))
+            offset = 0
+            for bracket, size in zip(range(brackets, -1, -1), sizes):
+                if size == 0:
+                    continue
+                candidates = [hiddenLayersConfigs[i] for i in order[offset:offset + size]]
+                offset += size
+                bracketMinEpochs = max(1, int(round(maxEpochs / eta ** bracket)))
+                bracketWinners.append(successiveHalving(executor, candidates, checkpointDirectory, bracketMinEpochs, maxEpochs, eta, bracket=bracket, **settings))
+            winner = _rankCandidates(bracketWinners, metric)[0]
+        searchWallTime = time.perf_counter() - start
+
+        report = {
+            'winner': str(winner['topology']), 'winner_test_auc': winner['test_auc'], 'winner_test_accuracy': winner['test_accuracy'],
+            'search_epochs': sum(entry['epochs_trained'] for entry in log), 'grid_epochs': len(hiddenLayersConfigs) * maxEpochs,
+            'search_wall_time': searchWallTime,
+        }
+        report['compute_saved'] = 1 - report['search_epochs'] / report['grid_epochs']
+        if compareWithGrid:
+            start = time.perf_counter()
+            tasks = [{'topology': list(topology), 'checkpoint': None, 'resume': False, 'epochs': maxEpochs, 'seed': seed,
+                'nonLinearActivation': nonLinearActivation, 'dropout': dropout, 'batchSize': batchSize} for topology in hiddenLayersConfigs]
+            grid = [dict(scores, topology=task['topology']) for task, scores in zip(tasks, executor.map(_trainCandidate, tasks))]
+            gridWinner = _rankCandidates(grid, metric)[0]
+            report.update({'grid_winner': str(gridWinner['topology']), 'grid_winner_test_auc': gridWinner['test_auc'],
+                'grid_winner_test_accuracy': gridWinner['test_accuracy'], 'grid_wall_time': time.perf_counter() - start})
+
+    print("search winner %s: test AUC %.4f, accuracy %.2f%% after %d candidate-epochs (grid %d, %.0f%% saved) in %.1fs" % (
+        report['winner'], report['winner_test_auc'], report['winner_test_accuracy'] * 100, report['search_epochs'], report['grid_epochs'], report['compute_saved'] * 100, searchWallTime))
+    if compareWithGrid:
+        print("grid winner   %s: test AUC %.4f, accuracy %.2f%% in %.1fs" % (
+            report['grid_winner'], report['grid_winner_test_auc'], report['grid_winner_test_accuracy'] * 100, report['grid_wall_time']))
+    searchLog = pandas.DataFrame(log)
+    searchLog.attrs.update(report)
+    if outputFile:
+        searchLog.to_csv(outputFile, index=False)
+        print(f"search log written to {outputFile}")
+    return searchLog, report
+
+
+def _parseTopologies(text):
+    # "12,8;16;" -> [[12, 8], [16], []]
+    return [[int(s) for s in topology.split(',')] if topology.strip() else [] for topology in text.split(';')]
+
+
+def _parseFlag(text):
+    return {'yes': (True,), 'no': (False,), 'both': (False, True)}[text]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="parallel topology sweep over the Pima Indians data")
+    parser.add_argument('--topologies', default=None, help="hidden layer configs separated by ';', e.g. '12,8;16;8,8,8'")
+    parser.add_argument('--candidates', type=int, default=None, help="random topologies (1 to 3 layers) instead of --topologies")
+    parser.add_argument('--linear', default='no', choices=['yes', 'no', 'both'])
+    parser.add_argument('--dropout', default='no', choices=['yes', 'no', 'both'])
+    parser.add_argument('--early-stopping', default='no', choices=['yes', 'no', 'both'])
+    parser.add_argument('--repetitions', type=int, default=1)
+    parser.add_argument('--folds', type=int, default=None, help="stratified k-fold cross-validation instead of random splits")
+    parser.add_argument('--fold-repeats', type=int, default=1, help="repeats of the k-fold cross-validation")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--output', default='sweep_results.csv')
+    parser.add_argument('--backend', default='keras', choices=['keras', 'numpy'], help="numpy trains without TensorFlow, much faster for these small networks")
+    parser.add_argument('--search', default=None, choices=['halving', 'hyperband'], help="successive halving / hyperband instead of the full grid, --epochs is the largest budget")
+    parser.add_argument('--min-epochs', type=int, default=2, help="search: smallest epoch budget")
+    parser.add_argument('--eta', type=int, default=3, help="search: 1/eta of the candidates is promoted to eta times the budget")
+    parser.add_argument('--metric', default='val_loss', choices=['val_loss', 'val_auc'], help="search: ranking on the validation split")
+    parser.add_argument('--compare-grid', action='store_true', help="search: also train the full grid and compare the winners")
+    args = parser.parse_args()
+    if args.candidates:
+        hiddenLayersConfigs = sampleTopologies(args.candidates, seed=args.seed)
+    elif args.topologies is not None:
+        hiddenLayersConfigs = _parseTopologies(args.topologies)
+    else:
+        parser.error("--topologies or --candidates is required")
+
+    nonLinearActivations = tuple(not linear for linear in _parseFlag(args.linear))
+    if args.search:
+        topologySearch(hiddenLayersConfigs, args.search, args.min_epochs, args.epochs, args.eta, args.metric, nonLinearActivations[0], _parseFlag(args.dropout)[0],
+            args.batch_size, args.seed, args.compare_grid, args.processes, args.threads_per_worker, args.backend, args.output)
+    elif args.folds:
+        resultsTable, summary = crossValidate(hiddenLayersConfigs, args.folds, args.fold_repeats, nonLinearActivations, _parseFlag(args.dropout), _parseFlag(args.early_stopping),
+            args.epochs, args.batch_size, args.seed, args.processes, args.threads_per_worker, args.output, args.backend)
+        print(summary)
+    else:
+        experiments = createSweepGrid(hiddenLayersConfigs, nonLinearActivations, _parseFlag(args.dropout), _parseFlag(args.early_stopping),
+            args.repetitions, args.epochs, args.batch_size, args.seed)
+        resultsTable = runSweep(experiments, args.processes, args.threads_per_worker, args.output, args.backend)
+        print(summarizeSweep(resultsTable))
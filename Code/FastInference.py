@@ -0,0 +1,141 @@
+import numpy as np
+
+
+def _relu(x):
+    return np.maximum(x, 0)
+
+
+def _linear(x):
+    return x
+
+
+def _sigmoid(x):
+    # numerically stable 1 / (1 + exp(-x))
+    return np.exp(-np.logaddexp(0, -x))
+
+
+class DenseInferenceEngine:
+
+    _activations = {'relu': _relu, 'linear': _linear, 'sigmoid': _sigmoid}
+
+    """DenseInferenceEngine constructor"""
+    def __init__(self, layers, dtype=np.float64):
+        # layers: list of (kernel, bias, activation name), dropout layers are the identity at inference
+        self.dtype = np.dtype(dtype)
+        self.activation_names = [activation for _, _, activation in layers]
+        self._layers = [
+            (np.ascontiguousarray(kernel, dtype=self.dtype), np.ascontiguousarray(bias, dtype=self.dtype), self._activations[activation])
+            for kernel, bias, activation in layers]
+
+    @classmethod
+    def fromKerasModel(cls, model, dtype=np.float64):
+        # snapshot the Dense weights of a trained keras model
+        layers = list()
+        for layer in model.layers:
+            if hasattr(layer, 'kernel'):
+                kernel, bias = layer.get_weights()
+                layers.append((kernel, bias, layer.activation.__name__))
+        return cls(layers, dtype)
+
+    def predict(self, X):
+        # X: (rows, 8) scaled features -> (rows,) probabilities
+        X = np.asarray(X, dtype=self.dtype)
+        for kernel, bias, activation in self._layers:
+            X = activation(X @ kernel + bias)
+        return X[:, 0]
+
+    def predictOne(self, x):
+        # x: (8,) scaled features of one patient -> probability, without any 2-D bookkeeping
+        x = np.asarray(x, dtype=self.dtype)
+        for kernel, bias, activation in self._layers:
+            x = activation(x @ kernel + bias)
+        return float(x[0])
+
+    def layers(self):
+        return [(kernel, bias, activation) for (kernel, bias, _), activation in zip(self._layers, self.activation_names)]
+
+
+class EnsembleInferenceEngine:
+
+    # the replicas of an ensemble (one DenseInferenceEngine each), the ensemble predicts their mean probability
+
+    """EnsembleInferenceEngine constructor"""
+    def __init__(self, engines):
+        self.engines = engines
+
+    def predictReplicas(self, X):
+        # X: (rows, 8) scaled features -> (rows, replicas) probabilities
+        return np.stack([engine.predict(X) for engine in self.engines], axis=1)
+
+    def predict(self, X):
+        return self.predictReplicas(X).mean(axis=1)
+
+    def predictOne(self, x):
+        return float(np.mean([engine.predictOne(x) for engine in self.engines]))
+
+
+class PatientModel:
+
+    # storage formats of the weights in an exported model, from exact to smallest
+    weightFormats = ['float64', 'float32', 'float16', 'int8']
+
+    # a trained network together with the preprocessing statistics of the DataManager (medians of the
+    # missing value columns, scaler), everything a prediction from raw patient values needs, in one .npz
+
+    """PatientModel constructor"""
+    def __init__(self, engine, missingColumns, featureMedians, mean, scale):
+        self.engine = engine
+        # positions of the columns in which a 0 stands for a missing value and their medians
+        self.missing_columns = np.asarray(missingColumns, dtype=np.intp)
+        self.feature_medians = np.asarray(featureMedians, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+    @classmethod
+    def fromManagers(cls, networkManager, dataManager):
+        n = len(dataManager.feature_columns)
+        return cls(networkManager.inference_engine,
+            [dataManager.feature_columns.index(column) for column in dataManager.missing_value_columns],
+            dataManager.feature_medians.values, dataManager.scaler.mean_[:n], dataManager.scaler.scale_[:n])
+
+    def transform(self, X):
+        # the same imputation and scaling as DataManager.transformFeatures
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        values = X[:, self.missing_columns]
+        X[:, self.missing_columns] = np.where((values == 0) | np.isnan(values), self.feature_medians, values)
+        return (X - self.mean) / self.scale
+
+    def predict(self, X):
+        # X: (rows, 8) raw patient values -> (rows,) probabilities
+        return self.engine.predict(self.transform(X))
+
+    def save(self, path, weights='float64'):
+        # weights: storage format of the kernels and biases, one of weightFormats; the preprocessing
+        # statistics always stay float64, they are only a few values
+        arrays = {'missing_columns': self.missing_columns, 'feature_medians': self.feature_medians, 'mean': self.mean, 'scale': self.scale,
+            'activations': np.array(self.engine.activation_names), 'weights': np.array(weights)}
+        for i, (kernel, bias, _) in enumerate(self.engine.layers()):
+            if weights == 'int8':
+                # symmetric per output unit: kernel ~ quantized * kernel_scale, the biases stay float32
+                kernelScale = np.max(np.abs(kernel), axis=0) / 127
+                kernelScale[kernelScale == 0] = 1
+                arrays[f'kernel{i}'] = np.round(kernel / kernelScale).astype(np.int8)
+                arrays[f'kernel_scale{i}'] = kernelScale.astype(np.float32)
+                arrays[f'bias{i}'] = bias.astype(np.float32)
+            else:
+                arrays[f'kernel{i}'] = kernel.astype(weights)
+                arrays[f'bias{i}'] = bias.astype(weights)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, dtype=np.float64):
+        # the stored weights are dequantized / widened once into the compute dtype of the engine
+        with np.load(path) as arrays:
+            activations = [str(activation) for activation in arrays['activations']]
+            layers = list()
+            for i, activation in enumerate(activations):
+                kernel = arrays[f'kernel{i}'].astype(dtype)
+                if f'kernel_scale{i}' in arrays:
+                    kernel *= arrays[f'kernel_scale{i}']
+                layers.append((kernel, arrays[f'bias{i}'], activation))
+            return cls(DenseInferenceEngine(layers, dtype), arrays['missing_columns'], arrays['feature_medians'], arrays['mean'], arrays['scale'])
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import random
+from PimaDataManagement import DataManager
+from FastInference import PatientModel
+from MemoryUsage import peakRss
+
+
+def createNetworkManager(backend='keras'):
+    # 'keras' (NeuralNetworkManagement) or 'numpy' (NumpyNetwork, TensorFlow is not imported)
+    if backend == 'numpy':
+        from NumpyNetwork import NumpyNNManager
+        return NumpyNNManager()
+    from NeuralNetworkManagement import NNManager
+    return NNManager()
+
+
+def train(hiddenLayersConfig, epochs=50, batchSize=1, seed=None, linear=False, dropout=False, earlyStopping=False, shuffleBufferSize=0, prefetch=True, verbose=0, dataManager=None, precision='float64', backend='keras',
+        checkpointDirectory=None, checkpointEvery=10):
+    # one training run as the GUI does it (split, create, train, evaluate), without PyQt5
+    if dataManager is None:
+        dataManager = DataManager()
+    if checkpointDirectory and seed is None:
+        # a resumed run has to find its split again
+        seed = random.randrange(2**31)
+    dataManager.splitDataIntoTrainingValidationAndTestingSets(seed)
+    networkManager = createNetworkManager(backend)
+    networkManager.verbose = verbose
+    if checkpointDirectory:
+        networkManager.checkpoint_directory = checkpointDirectory
+        networkManager.checkpoint_every = checkpointEvery
+        networkManager.checkpoint_metadata = {'seed': seed, 'dataChecksum': dataManager.data_checksum}
+    networkManager.createNetworkModel(hiddenLayersConfig, not linear, dropout, precision)
+    roc_data, bestEpoch = networkManager.trainAndSupervise(
+        dataManager.X_train, dataManager.y_train,
+        dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate,
+        epochs, earlyStopping, batchSize, shuffleBufferSize, prefetch)
+    return dataManager, networkManager, bestEpoch
+
+
+def resume(checkpointDirectory, epochs, verbose=0, dataManager=None, checkpointEvery=10):
+    # continues a checkpointed run (Headless.train with checkpointDirectory) on its split and with its
+    # settings until it has `epochs` epochs, checkpointing on into the same directory, with the backend that wrote it
+    with open(os.path.join(checkpointDirectory, 'run.json')) as f:
+        backend = json.load(f).get('backend', 'keras')
+    networkManager = createNetworkManager(backend)
+    networkManager.verbose = verbose
+    meta = networkManager.loadCheckpoint(checkpointDirectory)
+    if dataManager is None:
+        dataManager = DataManager()
+    if meta.get('metadata', dict()).get('dataChecksum') not in (None, dataManager.data_checksum):
+        raise ValueError(f"{checkpointDirectory} was trained on a different data file")
+    if epochs <= networkManager.epochsTrained():
+        raise ValueError(f"{checkpointDirectory} has already been trained for {networkManager.epochsTrained()} epochs")
+    dataManager.splitDataIntoTrainingValidationAndTestingSets(meta.get('metadata', dict()).get('seed'))
+    networkManager.checkpoint_directory = checkpointDirectory
+    networkManager.checkpoint_every = checkpointEvery
+    training = meta['training']
+    roc_data, bestEpoch = networkManager.continueTraining(
+        dataManager.X_train, dataManager.y_train,
+        dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate,
+        epochs - networkManager.epochsTrained(), training['earlyStopping'], training['batchSize'], training['shuffleBufferSize'], training['prefetch'])
+    return dataManager, networkManager, bestEpoch
+
+
+def trainEnsemble(hiddenLayersConfig, replicas, epochs=50, batchSize=1, seed=None, linear=False, dropout=False, earlyStopping=False, shuffleBufferSize=0, prefetch=True, verbose=0, dataManager=None, precision='float64'):
+    # `replicas` differently initialized networks of one topology on one split, trained as one stacked model
+    from NeuralNetworkManagement import NNManager
+    if dataManager is None:
+        dataManager = DataManager()
+    dataManager.splitDataIntoTrainingValidationAndTestingSets(seed)
+    networkManager = NNManager()
+    networkManager.verbose = verbose
+    networkManager.createEnsembleModel(hiddenLayersConfig, replicas, not linear, dropout, precision)
+    _, _, bestEpochs = networkManager.trainEnsemble(
+        dataManager.X_train, dataManager.y_train,
+        dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate,
+        epochs, earlyStopping, batchSize, shuffleBufferSize, prefetch)
+    return dataManager, networkManager, bestEpochs
+
+
+def runSummary(networkManager, bestEpoch):
+    summary = networkManager.current_run_evaluation.summary()
+    if networkManager.current_run_replicas is not None:
+        # an ensemble: its holdout metrics plus those of every replica
+        return {
+            'backend': networkManager.backend,
+            'topology': list(networkManager.current_run_topology),
+            'precision': networkManager.current_run_precision,
+            'replicas': networkManager.current_run_replicas,
+            'best_epochs': [int(epoch) for epoch in bestEpoch],
+            'training_time': networkManager.current_run_training_time,
+            'holdout': summary['holdout'],
+            'replica_holdout': [evaluation['holdout'].summary() for evaluation in networkManager.current_run_replica_evaluations],
+            'peak_rss': peakRss(),
+        }
+    return {
+        'backend': networkManager.backend,
+        'topology': list(networkManager.current_run_topology),
+        'precision': networkManager.current_run_precision,
+        'best_epoch': int(bestEpoch),
+        'epochs_run': len(networkManager.current_run_learning_history.history['loss']),
+        'training_time': networkManager.current_run_training_time,
+        'samples_per_second': networkManager.current_run_samples_per_second,
+        'holdout': summary['holdout'],
+        'peak_rss': peakRss(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="train one network on the Pima Indians data without the GUI")
+    parser.add_argument('--topology', default="12,8", help="hidden layer sizes, e.g. \"12,8\" (empty for no hidden layers)")
+    parser.add_argument('--epochs', type=int, default=50, help="with --resume the total number of epochs")
+    parser.add_argument('--batch-size', type=int, default=1, help="0 trains full-batch (numpy backend)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--linear', action='store_true')
+    parser.add_argument('--dropout', action='store_true')
+    parser.add_argument('--early-stopping', action='store_true')
+    parser.add_argument('--precision', default='float64', choices=['float64', 'float32', 'mixed'], help="mixed needs the keras backend")
+    parser.add_argument('--backend', default='keras', choices=['keras', 'numpy'])
+    parser.add_argument('--replicas', type=int, default=1, help="train that many differently initialized networks as one stacked ensemble (keras backend)")
+    parser.add_argument('--checkpoint', default=None, metavar="DIRECTORY", help="checkpoint weights, Adam state and history there")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="epochs between two checkpoints")
+    parser.add_argument('--resume', default=None, metavar="DIRECTORY", help="continue a checkpointed run up to --epochs epochs")
+    parser.add_argument('--verbose', type=int, default=2)
+    parser.add_argument('--output', default=None, help="write the run summary as JSON")
+    parser.add_argument('--export', default=None, help="export the trained model for the InferenceServer (.npz)")
+    parser.add_argument('--export-weights', default='float64', choices=PatientModel.weightFormats, help="storage format of the exported weights")
+    args = parser.parse_args()
+
+    hiddenLayersConfig = [int(size) for size in args.topology.split(',') if size.strip()]
+    if args.resume:
+        dataManager, networkManager, bestEpoch = resume(args.resume, args.epochs, args.verbose, checkpointEvery=args.checkpoint_every)
+    elif args.replicas > 1:
+        if args.backend != 'keras' or args.export:
+            parser.error("--replicas needs the keras backend and cannot be exported")
+        dataManager, networkManager, bestEpoch = trainEnsemble(hiddenLayersConfig, args.replicas, args.epochs, args.batch_size, args.seed,
+            args.linear, args.dropout, args.early_stopping, verbose=args.verbose, precision=args.precision)
+    else:
+        dataManager, networkManager, bestEpoch = train(hiddenLayersConfig, args.epochs, args.batch_size, args.seed,
+            args.linear, args.dropout, args.early_stopping, verbose=args.verbose, precision=args.precision, backend=args.backend,
+            checkpointDirectory=args.checkpoint, checkpointEvery=args.checkpoint_every)
+    result = runSummary(networkManager, bestEpoch)
+    print("HEADLESS-RESULT " + json.dumps(result))
+    if args.export:
+        networkManager.exportModel(args.export, dataManager, args.export_weights)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class ColumnHistograms:
+
+    # bin counts of every column of a data set over fixed, equal-width bins (like DataFrame.hist),
+    # one set of counts per variant ('raw', 'imputed', ...) and all variants over the same edges,
+    # so they can be compared; counts are accumulated chunk by chunk with update()
+
+    """ColumnHistograms constructor"""
+    def __init__(self, columns, minimums, maximums, bins=10):
+        self.columns = list(columns)
+        self.bins = bins
+        minimums = np.asarray(minimums, dtype=np.float64)
+        maximums = np.asarray(maximums, dtype=np.float64)
+        # a constant column gets a bin range of width 1 around its value, as in np.histogram
+        constant = maximums <= minimums
+        minimums = np.where(constant, minimums - 0.5, minimums)
+        maximums = np.where(constant, maximums + 0.5, maximums)
+        # (columns, bins + 1)
+        self.edges = np.linspace(minimums, maximums, bins + 1, axis=1)
+        self.counts = dict()
+
+    @classmethod
+    def fromValues(cls, columns, values, bins=10):
+        values = np.asarray(values, dtype=np.float64)
+        return cls(columns, np.nanmin(values, axis=0), np.nanmax(values, axis=0), bins)
+
+    def update(self, variant, values):
+        # adds the rows of a (rows, columns) array to the counts of a variant in one vectorized pass:
+        # bin index per value, offset by column, one bincount over everything (NaN is not counted)
+        values = np.asarray(values, dtype=np.float64)
+        lower = self.edges[:, 0]
+        width = self.edges[:, -1] - lower
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, lower)
+        binIndices = np.clip(np.floor((values - lower) / width * self.bins).astype(np.intp), 0, self.bins - 1)
+        # the division can be off by one at an edge, the edges themselves decide (as in np.histogram);
+        # the upper edge belongs to the last bin
+        columnIndices = np.arange(len(self.columns))
+        binIndices -= (values < self.edges[columnIndices, binIndices]) & (binIndices > 0)
+        binIndices += (values >= self.edges[columnIndices, binIndices + 1]) & (binIndices < self.bins - 1)
+        binIndices += columnIndices * self.bins
+        counts = np.bincount(binIndices[valid], minlength=len(self.columns) * self.bins).reshape(len(self.columns), self.bins)
+        if variant in self.counts:
+            self.counts[variant] += counts
+        else:
+            self.counts[variant] = counts
+
+    def scaledEdges(self, mean, scale):
+        # standardization is affine per column, so the counts of the standardized data are the
+        # counts of the imputed data over the standardized edges
+        return (self.edges - np.asarray(mean)[:, None]) / np.asarray(scale)[:, None]
+
+    def toDict(self):
+        return {
+            'columns': self.columns,
+            'bins': self.bins,
+            'edges': self.edges.tolist(),
+            'counts': {variant: counts.tolist() for variant, counts in self.counts.items()},
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        histograms = cls.__new__(cls)
+        histograms.columns = data['columns']
+        histograms.bins = data['bins']
+        histograms.edges = np.array(data['edges'])
+        histograms.counts = {variant: np.array(counts, dtype=np.int64) for variant, counts in data['counts'].items()}
+        return histograms
@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from FastInference import PatientModel
+
+
+class MicroBatcher:
+
+    # concurrent single-patient requests wait at most maxDelay seconds for each other and are
+    # then scored together in one vectorized forward pass (maxBatchSize 1 scores every request alone)
+
+    """MicroBatcher constructor"""
+    def __init__(self, model, maxBatchSize=256, maxDelay=0.002):
+        self.model = model
+        self.maxBatchSize = maxBatchSize
+        self.maxDelay = maxDelay
+        self._queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+
+    async def predict(self, patient):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((patient, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.maxDelay
+            while len(batch) < self.maxBatchSize:
+                # whatever is already queued joins without waiting, then wait for more until the deadline
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        try:
+            probabilities = self.model.predict(np.array([patient for patient, _ in batch], dtype=np.float64))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), probability in zip(batch, probabilities.tolist()):
+            if not future.done():
+                future.set_result(probability)
+        self.batches += 1
+        self.requests += len(batch)
+
+
+class InferenceServer:
+
+    # minimal HTTP/1.1 (keep-alive) service over TCP and/or a Unix socket:
+    #   POST /predict  {"patient": [8 values]} -> {"probability": p}
+    #                  {"patients": [[8 values], ...]} -> {"probabilities": [...]} (one forward pass, not batched further)
+    #   GET /health, GET /stats
+
+    """InferenceServer constructor"""
+    def __init__(self, model, maxBatchSize=256, maxDelay=0.002):
+        self.model = model
+        self.batcher = MicroBatcher(model, maxBatchSize, maxDelay)
+        self._servers = list()
+        self._batcherTask = None
+
+    async def start(self, host='127.0.0.1', port=8765, unixSocket=None):
+        self._batcherTask = asyncio.create_task(self.batcher.run())
+        if port is not None:
+            server = await asyncio.start_server(self._handleConnection, host, port)
+            self._servers.append(server)
+            self.port = server.sockets[0].getsockname()[1]
+            print(f"** serving on http://{host}:{self.port}", flush=True)
+        if unixSocket is not None:
+            self._servers.append(await asyncio.start_unix_server(self._handleConnection, unixSocket))
+            print(f"** serving on unix socket {unixSocket}", flush=True)
+
+    async def serveForever(self):
+        await asyncio.gather(*[server.serve_forever() for server in self._servers])
+
+    def close(self):
+        # stops accepting connections and the batcher (a server embedded in another event loop)
+        for server in self._servers:
+            server.close()
+        if self._batcherTask is not None:
+            self._batcherTask.cancel()
+
+    async def _handleConnection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                method, path, _ = requestLine.decode('latin-1').split(' ', 2)
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, response = await self._respond(method, path, body)
+                payload = json.dumps(response).encode('utf-8')
+                writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % (
+                    status, b"OK" if status == 200 else b"Error", len(payload)) + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method, path, body):
+        try:
+            if method == 'GET' and path == '/health':
+                return 200, {'status': 'ok'}
+            if method == 'GET' and path == '/stats':
+                return 200, {'requests': self.batcher.requests, 'batches': self.batcher.batches,
+                    'mean_batch_size': self.batcher.requests / max(self.batcher.batches, 1)}
+            if method == 'POST' and path == '/predict':
+                request = json.loads(body)
+                if 'patients' in request:
+                    return 200, {'probabilities': self.model.predict(np.array(request['patients'], dtype=np.float64)).tolist()}
+                patient = np.array(request['patient'], dtype=np.float64)
+                if patient.shape != (len(self.model.mean),):
+                    raise ValueError(f"a patient has {len(self.model.mean)} values")
+                return 200, {'probability': await self.batcher.predict(patient)}
+            return 404, {'error': f"unknown endpoint {method} {path}"}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': str(e)}
+
+
+async def generateLoad(host, port, patients, requests=5000, concurrency=64):
+    # `concurrency` clients with one keep-alive connection each send single-patient requests back to back,
+    # returns the wall time and the latency of every request
+    latencies = list()
+    perClient = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    async def client(count, offset):
+        reader, writer = await asyncio.open_connection(host, port)
+        for i in range(count):
+            body = json.dumps({'patient': patients[(offset + i) % len(patients)]}).encode('utf-8')
+            start = time.perf_counter()
+            writer.write(b"POST /predict HTTP/1.1\r\nHost: %s\r\nContent-Length: %d\r\n\r\n" % (host.encode(), len(body)) + body)
+            await writer.drain()
+            headers = await reader.readuntil(b"\r\n\r\n")
+            length = int([line for line in headers.split(b"\r\n") if line.lower().startswith(b"content-length:")][0].split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(count, i * 7919) for i, count in enumerate(perClient)])
+    return time.perf_counter() - start, np.array(latencies)
+
+
+async def _main(args):
+    model = PatientModel.load(args.model, args.compute_dtype)
+    server = InferenceServer(model, args.max_batch_size, args.max_delay_ms / 1000)
+    await server.start(args.host, None if args.port < 0 else args.port, args.unix_socket)
+    await server.serveForever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="local inference service with dynamic micro-batching for an exported model (Headless.py --export)")
+    parser.add_argument('model', help="exported model (.npz)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help="TCP port, 0 picks a free one, -1 disables TCP")
+    parser.add_argument('--unix-socket', default=None)
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-delay-ms', type=float, default=2.0, help="latency budget a request waits for others")
+    parser.add_argument('--compute-dtype', default='float64', choices=['float64', 'float32'], help="dtype the weights are widened to for the forward pass")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
@@ -1,28 +1,63 @@
+import time
+_startupBegin = time.perf_counter()
 import sys 
-from NeuralNetworkManagement import NNManager
-from PimaDataManagement import DataManager
+import json
+import os
+import random
 from PyQt5 import QtWidgets as qtw 
 from PyQt5 import QtGui as qtg 
 from PyQt5 import QtCore as qtc
 from QLed import QLed
-from matplotlib import pyplot as plt 
 from ChildWindows import LearningWindow
 from ChildWindows import TabelleWindow
 from ChildWindows import HistogrammWindow
-from ChildWindows import LearningWindow
 from CanvasWidgets import ROCWidget
-import sklearn.metrics as metrics
+from RunCache import RunCache, HistoryStore
+from MemoryUsage import currentRss, peakRss, formatBytes
+# TensorFlow and sklearn (NeuralNetworkManagement, PimaDataManagement, TrainingWorker)
+# are imported by the StartupLoader after the window is shown
+_startupImportsDone = time.perf_counter()
+
+
+class StartupLoader(qtc.QThread):
+
+    dataReady = qtc.pyqtSignal(object)
+    networkReady = qtc.pyqtSignal(object)
+    failed = qtc.pyqtSignal(str)
+
+    def run(self):
+        try:
+            from PimaDataManagement import DataManager
+            self.dataReady.emit(DataManager())
+            # importing TensorFlow is the slow part of the startup
+            from NeuralNetworkManagement import NNManager
+            import TrainingWorker
+            self.networkReady.emit(NNManager())
+        except Exception as e:
+            print(f"### startup failed ###: {e}")
+            self.failed.emit(str(e))
+
 
 class MainWindow(qtw.QWidget):
 
-    _neuralNetworkManager = NNManager()
-    _dataManager = DataManager()
-    _rocWidget = ROCWidget()
-    _childWindows = list()
+    # milliseconds between two updates of the memory readout
+    memoryUpdateInterval = 1000
+    # runs trained with 'checkpoints' get a directory here, "Fortsetzen..." resumes one of them
+    checkpointRoot = 'cache/checkpoints'
 
     """MainWindow constructor"""
-    def __init__(self): 
+    def __init__(self, startupBenchmark=False): 
         super().__init__()
+        self._neuralNetworkManager = None
+        self._dataManager = None
+        self._rocWidget = ROCWidget()
+        # open child windows, a closed one is deleted and leaves the list (_showChildWindow)
+        self._childWindows = list()
+        self._trainingWorker = None
+        self._historyStore = None
+        # seconds since the start of the module import
+        self.startupTimes = {'imports': _startupImportsDone - _startupBegin}
+        self._startupBenchmark = startupBenchmark
 
         stylesheet = """
         QGroupBox {
@@ -73,8 +108,79 @@ class MainWindow(qtw.QWidget):
 
         self.setLayout(mainLayout)
         # End main UI code 
+
+        self._lastFinishedJob = None
+        self._runningJob = None
+        self._checkpointedRuns = 0
+        # the run whose model the worker holds now, "Weitertrainieren" continues it
+        self._modelJob = None
+        self._setReady(False, False)
+        self._memoryTimer = qtc.QTimer(self)
+        self._memoryTimer.timeout.connect(self.updateMemoryUsage)
+        self._memoryTimer.start(self.memoryUpdateInterval)
+        self.updateMemoryUsage()
         self.show()
 
+        # data and TensorFlow are loaded in the background while the window is already visible
+        self._startupLoader = StartupLoader()
+        self._startupLoader.dataReady.connect(self.startupDataReady)
+        self._startupLoader.networkReady.connect(self.startupNetworkReady)
+        self._startupLoader.failed.connect(self.startupFailed)
+        self._startupLoader.start()
+
+    def paintEvent(self, event):
+        if 'first_paint' not in self.startupTimes:
+            self.startupTimes['first_paint'] = time.perf_counter() - _startupBegin
+        super().paintEvent(event)
+
+    def _setReady(self, dataReady, networkReady):
+        self.button_tabelle.setEnabled(dataReady)
+        self.button_histogramm.setEnabled(dataReady)
+        self.button_train.setEnabled(dataReady and networkReady)
+        self.button_continue.setEnabled(dataReady and networkReady)
+        self.button_resume.setEnabled(dataReady and networkReady)
+        # a prognosis needs the model of a finished run
+        self.button_prognose.setEnabled(dataReady and networkReady and self._neuralNetworkManager.inference_engine is not None)
+        if not dataReady:
+            self.label_progress.setText("loading data ...")
+        elif not networkReady:
+            self.label_progress.setText("data ready, loading TensorFlow ...")
+        else:
+            self.label_progress.setText("ready")
+
+    def startupDataReady(self, dataManager):
+        self._dataManager = dataManager
+        self.startupTimes['data_ready'] = time.perf_counter() - _startupBegin
+        self._setReady(True, False)
+
+    def startupNetworkReady(self, networkManager):
+        from TrainingWorker import TrainingWorker
+        self._neuralNetworkManager = networkManager
+
+        # background training, results come back over signals
+        self._historyStore = HistoryStore()
+        self._trainingWorker = TrainingWorker(self._neuralNetworkManager, RunCache(), self._historyStore)
+        self._trainingWorker.runStarted.connect(self.trainingRunStarted)
+        self._trainingWorker.epochFinished.connect(self.trainingEpochFinished)
+        self._trainingWorker.runFinished.connect(self.trainingRunFinished)
+        self._trainingWorker.runCancelled.connect(self.trainingRunCancelled)
+        self._trainingWorker.runFailed.connect(self.trainingRunFailed)
+        self._trainingWorker.queueChanged.connect(self.trainingQueueChanged)
+        self._trainingWorker.start()
+
+        self.startupTimes['network_ready'] = time.perf_counter() - _startupBegin
+        self._setReady(True, True)
+        print("startup times (s): " + ", ".join("%s %.3f" % (name, value) for name, value in self.startupTimes.items()))
+        if self._startupBenchmark:
+            print("STARTUP-BENCHMARK " + json.dumps(self.startupTimes))
+            self.close()
+
+    def startupFailed(self, message):
+        self.changeLEDColor(QLed.Red)
+        self.label_progress.setText(f"startup failed: {message}")
+        if self._startupBenchmark:
+            self.close()
+
     # GUI Section One: Trainieren 
 
     def populateGUISectionOne(self, layout):
@@ -97,15 +203,63 @@ class MainWindow(qtw.QWidget):
         labelDropoutLayout.addWidget(self.dropout_checkBox)
         self.earlyStopping_checkBox = qtw.QCheckBox('stop early, grace 50')
         labelDropoutLayout.addWidget(self.earlyStopping_checkBox)
+
+        pipelineLayout = qtw.QHBoxLayout()
+        self.textfield_batchSize = qtw.QLineEdit()
+        self.textfield_batchSize.setPlaceholderText("batch size = 1")
+        pipelineLayout.addWidget(self.textfield_batchSize)
+        self.textfield_shuffleBuffer = qtw.QLineEdit()
+        self.textfield_shuffleBuffer.setPlaceholderText("shuffle buffer = all")
+        pipelineLayout.addWidget(self.textfield_shuffleBuffer)
+        self.prefetch_checkBox = qtw.QCheckBox('prefetch')
+        self.prefetch_checkBox.setChecked(True)
+        pipelineLayout.addWidget(self.prefetch_checkBox)
+        # training precision (NeuralNetworkManagement.precisionModes, not imported here to keep TensorFlow out of the startup)
+        self.combobox_precision = qtw.QComboBox()
+        self.combobox_precision.addItems(['float64', 'float32', 'mixed'])
+        self.combobox_precision.setToolTip("precision of weights, activations and inputs during training")
+        pipelineLayout.addWidget(self.combobox_precision)
+
+        cacheLayout = qtw.QHBoxLayout()
+        self.textfield_seed = qtw.QLineEdit()
+        self.textfield_seed.setPlaceholderText("split seed = random")
+        cacheLayout.addWidget(self.textfield_seed)
+        self.cache_checkBox = qtw.QCheckBox('reuse cached runs')
+        self.cache_checkBox.setChecked(True)
+        cacheLayout.addWidget(self.cache_checkBox)
+        self.checkpoint_checkBox = qtw.QCheckBox('checkpoints')
+        self.checkpoint_checkBox.setToolTip(f"write weights, Adam state and history every 10 epochs and at the end to {self.checkpointRoot}, \"Fortsetzen...\" resumes the run")
+        cacheLayout.addWidget(self.checkpoint_checkBox)
+        self.textfield_profileEpochs = qtw.QLineEdit()
+        self.textfield_profileEpochs.setPlaceholderText("tf.profiler epochs, e.g. 2-3")
+        cacheLayout.addWidget(self.textfield_profileEpochs)
         
         configLayout.addLayout(labelOptionLayout)
         configLayout.addWidget(self.textfield_epochs)
         configLayout.addLayout(labelDropoutLayout)
+        configLayout.addLayout(pipelineLayout)
+        configLayout.addLayout(cacheLayout)
 
         layout.addLayout(configLayout)
         
-        button_train = qtw.QPushButton("Trainieren")
-        layout.addWidget(button_train)
+        self.label_progress = qtw.QLabel("")
+        configLayout.addWidget(self.label_progress)
+        self.label_memory = qtw.QLabel("")
+        configLayout.addWidget(self.label_memory)
+
+        buttonLayout = qtw.QVBoxLayout()
+        self.button_train = qtw.QPushButton("Trainieren")
+        buttonLayout.addWidget(self.button_train)
+        self.button_continue = qtw.QPushButton("Weitertrainieren")
+        self.button_continue.setToolTip("train the last model (weights and Adam state) for the given number of epochs more; not for runs restored from the run cache")
+        buttonLayout.addWidget(self.button_continue)
+        self.button_resume = qtw.QPushButton("Fortsetzen...")
+        self.button_resume.setToolTip("load a checkpoint and train it for the given number of epochs more")
+        buttonLayout.addWidget(self.button_resume)
+        self.button_cancel = qtw.QPushButton("Abbrechen")
+        self.button_cancel.setEnabled(False)
+        buttonLayout.addWidget(self.button_cancel)
+        layout.addLayout(buttonLayout)
         
         # light
         self.led=QLed(self, onColour=QLed.Grey, shape=QLed.Circle)
@@ -117,58 +271,213 @@ class MainWindow(qtw.QWidget):
         layout.addWidget(button_lb)
 
         # widget connections 
-        button_train.clicked.connect(self.trainButtonClicked)
+        self.button_train.clicked.connect(self.trainButtonClicked)
+        self.button_continue.clicked.connect(self.continueButtonClicked)
+        self.button_resume.clicked.connect(self.resumeButtonClicked)
+        self.button_cancel.clicked.connect(self.cancelButtonClicked)
         button_lb.clicked.connect(self.buttonBerichtClicked)
 
     def buttonBerichtClicked(self):
-        self.changeLEDColor(QLed.Blue)
-        learningWindow = LearningWindow(self._neuralNetworkManager)
-        self._childWindows.append(learningWindow)
-        learningWindow.show()
+        if self._runningJob is not None:
+            # follow the run in training live
+            learningWindow = LearningWindow(self._runningJob, self._trainingWorker.learningCurve)
+        elif self._lastFinishedJob is None:
+            print("### !! no finished training run to report yet !! ###")
+            return
+        else:
+            self.changeLEDColor(QLed.Blue)
+            learningWindow = LearningWindow(self._lastFinishedJob)
+        self._showChildWindow(learningWindow)
 
     def trainButtonClicked(self):
+        from TrainingWorker import TrainingJob
+        trainingParameters = self._getTrainingParameters()
+        if trainingParameters is None: return
+        hiddenLayersConfig, epochs, linear, dropout, earlyStopping, batchSize, shuffleBufferSize, prefetch, seed = trainingParameters
+        try:
+            profileEpochs = self._getProfileEpochs()
+        except ValueError as e:
+            self.changeLEDColor(QLed.Red)
+            print(f"### !! please enter the tf.profiler epochs as 'first-last' (1-based) ONLY !! ###: {e}")
+            return
+
+        # every queued run gets its own split, the worker only reads the frames
+        self._dataManager.splitDataIntoTrainingValidationAndTestingSets(seed)
+        dataSplits = (
+            self._dataManager.X_train, self._dataManager.y_train,
+            self._dataManager.X_test, self._dataManager.y_test,
+            self._dataManager.X_validate, self._dataManager.y_validate)
+
+        # every checkpointed run gets its own directory
+        checkpointDirectory = None
+        if self.checkpoint_checkBox.isChecked():
+            self._checkpointedRuns += 1
+            checkpointDirectory = os.path.join(self.checkpointRoot, "%s-seed%d-%s-%d" % (
+                'x'.join(str(size) for size in hiddenLayersConfig) or 'none', seed, time.strftime('%Y%m%d-%H%M%S'), self._checkpointedRuns))
+
+        # queue the run, the neural network is created and trained on the worker thread
+        job = TrainingJob(hiddenLayersConfig, epochs, linear, dropout, earlyStopping,
+            batchSize, shuffleBufferSize, prefetch, dataSplits,
+            seed, self._dataManager.data_checksum, self.cache_checkBox.isChecked(), profileEpochs,
+            self.combobox_precision.currentText(), checkpointDirectory=checkpointDirectory, preprocessingKey=self._dataManager.preprocessingKey())
+        self._trainingWorker.enqueue(job)
         self.changeLEDColor(QLed.Orange)
-        
-        self._dataManager.splitDataIntoTrainingValidationAndTestingSets()
 
-        # create the neural network
-        hiddenLayersConfig, epochs, linear, dropout, earlyStopping= self._getTrainingParameters()
-        self._neuralNetworkManager.createNetworkModel(hiddenLayersConfig, not linear, dropout)
+    def continueButtonClicked(self):
+        from TrainingWorker import TrainingJob
+        previous = self._modelJob
+        if previous is None or previous.learning_history is None:
+            print("### !! no trained model to continue yet !! ###")
+            return
+        if previous.cached:
+            # the run cache keeps the weights but not the Adam state, continuing would restart Adam from zero
+            self.changeLEDColor(QLed.Red)
+            self.label_progress.setText("restored from the run cache (no Adam state): train it again without 'reuse cached runs' to continue it")
+            return
+        if self._trainingWorker.isBusy():
+            # queued runs replace the model of the worker
+            print("### !! wait until the queued runs are finished !! ###")
+            return
+        epochs = self._getIntegerField(self.textfield_epochs, 'epochs', 50, 1)
+        if epochs is None: return
+
+        # same run on the same split (checkpointed into the same directory), only the number of
+        # additional epochs is taken from the form
+        job = TrainingJob(previous.hiddenLayersConfig, epochs, previous.linear, previous.dropout, previous.earlyStopping,
+            previous.batchSize, previous.shuffleBufferSize, previous.prefetch, previous.dataSplits,
+            previous.seed, previous.dataChecksum, False, None,
+            previous.precision, previous.learning_history.epochs, previous.checkpointDirectory, preprocessingKey=previous.preprocessingKey)
+        self._trainingWorker.enqueue(job)
+        self.changeLEDColor(QLed.Orange)
 
-        # train the neural network
-        roc_data, bestEpoch = self._neuralNetworkManager.trainAndSupervise(
-            self._dataManager.X_train, self._dataManager.y_train, 
-            self._dataManager.X_test, self._dataManager.y_test, 
-            self._dataManager.X_validate, self._dataManager.y_validate,
-            int(epochs), earlyStopping)
+    def resumeButtonClicked(self):
+        directory = qtw.QFileDialog.getExistingDirectory(self, "Checkpoint fortsetzen", self.checkpointRoot)
+        if directory:
+            self.resumeCheckpoint(directory)
+
+    def resumeCheckpoint(self, directory):
+        # an interrupted or finished checkpointed run (GUI or Headless.py --checkpoint) is loaded on the worker
+        # and trained for the number of epochs in the form more, on its split and with its settings
+        from TrainingWorker import TrainingJob
+        if self._trainingWorker.isBusy():
+            print("### !! wait until the queued runs are finished !! ###")
+            return
+        try:
+            with open(os.path.join(directory, 'run.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            self.changeLEDColor(QLed.Red)
+            print(f"### !! {directory} is no checkpoint !! ###: {e}")
+            return
+        model, training, seed = meta['model'], meta['training'], meta['metadata'].get('seed')
+        if seed is None or meta['metadata'].get('dataChecksum') != self._dataManager.data_checksum:
+            self.changeLEDColor(QLed.Red)
+            self.label_progress.setText("the checkpoint has no split seed or was trained on other data")
+            return
+        epochs = self._getIntegerField(self.textfield_epochs, 'epochs', 50, 1)
+        if epochs is None: return
+
+        self._dataManager.splitDataIntoTrainingValidationAndTestingSets(seed)
+        dataSplits = (
+            self._dataManager.X_train, self._dataManager.y_train,
+            self._dataManager.X_test, self._dataManager.y_test,
+            self._dataManager.X_validate, self._dataManager.y_validate)
+        job = TrainingJob(model['hiddenLayersConfig'], epochs, not model['withNonLinearActivation'], model['withDropOutLayers'], training['earlyStopping'],
+            training['batchSize'], training['shuffleBufferSize'], training['prefetch'], dataSplits,
+            seed, self._dataManager.data_checksum, False, None,
+            model['precision'], len(meta['history']['loss']), directory, True, self._dataManager.preprocessingKey())
+        self._trainingWorker.enqueue(job)
+        self.changeLEDColor(QLed.Orange)
+
+    def cancelButtonClicked(self):
+        self._trainingWorker.cancelAll()
+
+    def trainingRunStarted(self, job):
+        self._runningJob = job
+        # open learning reports follow the run in training
+        for childWindow in self._childWindows:
+            if isinstance(childWindow, LearningWindow) and childWindow.isVisible():
+                childWindow.showLive(job, self._trainingWorker.learningCurve)
+        self.changeLEDColor(QLed.Orange)
+        self.button_cancel.setEnabled(True)
+        self.button_prognose.setEnabled(False)
+        self.label_progress.setText(f"training {job.hiddenLayersConfig}, seed {job.seed} ...")
+
+    def trainingEpochFinished(self, epoch, epochs, logs):
+        text = f"epoch {epoch+1}/{epochs}: loss {logs.get('loss', 0):.4f}"
+        if 'val_loss' in logs:
+            text = text + f", val_loss {logs['val_loss']:.4f}"
+        text = text + f" ({logs['time']:.2f}s)"
+        pending = self._trainingWorker.pendingJobs()
+        if pending: text = text + f", {pending} queued"
+        self.label_progress.setText(text)
+
+    def trainingQueueChanged(self, pending):
+        if pending and not self.button_cancel.isEnabled():
+            self.label_progress.setText(f"{pending} queued")
+
+    def trainingRunFinished(self, job):
+        self._lastFinishedJob = job
+        self._modelJob = job
+        self._trainingRunEnded(QLed.Green)
+        self.label_progress.setText(f"{'cached' if job.cached else 'finished'} {job.hiddenLayersConfig}, seed {job.seed}: acc {job.holdout_accuracy}")
 
-        self.changeLEDColor(QLed.Green)
+        # plot ROC
+        FPR, TPR, thresholds = job.roc_data
+        self._rocWidget.plot(FPR, TPR, thresholds, self._composeRunLabel(job))
 
+        # open learning reports follow the latest run
+        for childWindow in self._childWindows:
+            if isinstance(childWindow, LearningWindow) and childWindow.isVisible():
+                childWindow.showRun(job)
+
+    def trainingRunCancelled(self, job):
+        # the model keeps the epochs it finished, it can be continued from there
+        if job.learning_history is not None:
+            self._modelJob = job
+        self._trainingRunEnded(QLed.Grey)
+        self.label_progress.setText(f"cancelled {job.hiddenLayersConfig}")
+
+    def trainingRunFailed(self, job, message):
+        self._modelJob = None
+        self._trainingRunEnded(QLed.Red)
+        self.label_progress.setText(f"failed {job.hiddenLayersConfig}: {message}")
+
+    def _trainingRunEnded(self, color):
+        self._runningJob = None
+        if self._trainingWorker.isBusy(): return
+        self.changeLEDColor(color)
+        self.button_cancel.setEnabled(False)
+        self.button_prognose.setEnabled(self._neuralNetworkManager.inference_engine is not None)
+
+    def _composeRunLabel(self, job):
+        import sklearn.metrics as metrics
         # compute AUC
-        FPR, TPR, thresholds = roc_data
+        FPR, TPR, thresholds = job.roc_data
         roc_auc = metrics.auc(FPR, TPR)
 
-        if bestEpoch != -1: epochs = bestEpoch
+        epochs = job.initialEpoch + job.epochs
+        if job.bestEpoch != -1: epochs = job.bestEpoch
         
         # compose labels
         roc_auc_as_string = "%.2f" % roc_auc
-        if not hiddenLayersConfig:
+        if not job.hiddenLayersConfig:
             label = "no hidden layers e(" + str(epochs) 
         else:
-            label = str(hiddenLayersConfig) + " e(" + str(epochs)
+            label = str(job.hiddenLayersConfig) + " e(" + str(epochs)
         
-        if linear:
-            label = label + ")/l -> acc(0.50, "
+        if job.linear:
+            label = label + ")/l"
         else:
-            if dropout:
-                label = label + ")/d -> acc(0.50, "
+            if job.dropout:
+                label = label + ")/d"
             else:
-                label = label + ") -> acc(0.50, "
-
-        label = label + self._neuralNetworkManager.current_run_holdout_accuracy + ") / AUC(" + roc_auc_as_string + ")"
+                label = label + ")"
+        if job.precision != 'float64':
+            label = label + "/" + job.precision
+        label = label + " -> acc(0.50, "
 
-        # plot ROC
-        self._rocWidget.plot(FPR, TPR, thresholds, label)
+        return label + job.holdout_accuracy + ") / AUC(" + roc_auc_as_string + ")"
 
 
     def _getTrainingParameters(self):
@@ -176,18 +485,60 @@ class MainWindow(qtw.QWidget):
             hiddenLayersConfig = self.convertStringToListOfInteger(self.textfield_topology.text())
         except ValueError as e:
             self.changeLEDColor(QLed.Red)
+            self.label_progress.setText("please enter the topology as integers separated by comma")
             print(f"### !! please enter integers separated by comma ONLY !! ###: {e}")
             return
-        epochs = self.textfield_epochs.text()
-        if not epochs:
-            epochs = 50
+        epochs = self._getIntegerField(self.textfield_epochs, 'epochs', 50, 1)
+        batchSize = self._getIntegerField(self.textfield_batchSize, 'batch size', 1, 1)
+        shuffleBufferSize = self._getIntegerField(self.textfield_shuffleBuffer, 'shuffle buffer', 0, 0)
+        # a fixed seed reproduces the split (and makes the run cacheable), otherwise a random one is drawn
+        seed = self._getIntegerField(self.textfield_seed, 'seed', random.randrange(2**31), 0)
+        if None in (epochs, batchSize, shuffleBufferSize, seed):
+            return
 
-        return hiddenLayersConfig, epochs, self.linear_checkBox.isChecked(), self.dropout_checkBox.isChecked(), self.earlyStopping_checkBox.isChecked()
+        return hiddenLayersConfig, epochs, self.linear_checkBox.isChecked(), self.dropout_checkBox.isChecked(), self.earlyStopping_checkBox.isChecked(), batchSize, shuffleBufferSize, self.prefetch_checkBox.isChecked(), seed
+
+    def _getIntegerField(self, textfield, name, default, minimum):
+        # the integer of a form field (default when it is empty), None after reporting an invalid entry
+        text = textfield.text().strip()
+        if not text:
+            return default
+        try:
+            value = int(text)
+            if value < minimum:
+                raise ValueError(f"{value} is below {minimum}")
+        except ValueError as e:
+            self.changeLEDColor(QLed.Red)
+            self.label_progress.setText(f"please enter an integer of at least {minimum} as {name}")
+            print(f"### !! please enter an integer of at least {minimum} as {name} ONLY !! ###: {e}")
+            return None
+        return value
+
+    def _getProfileEpochs(self):
+        # "3" or "2-4" (1-based, inclusive) -> 0-based (first, last), an empty field captures nothing
+        text = self.textfield_profileEpochs.text().strip()
+        if not text:
+            return None
+        first, _, last = text.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last < first:
+            raise ValueError(text)
+        return first - 1, last - 1
+
+    def _showChildWindow(self, childWindow):
+        # closing deletes the window with its figures and data, the list only holds open windows
+        childWindow.setAttribute(qtc.Qt.WA_DeleteOnClose)
+        childWindow.destroyed.connect(lambda _=None, window=childWindow: self._childWindows.remove(window))
+        self._childWindows.append(childWindow)
+        childWindow.show()
+
+    def updateMemoryUsage(self):
+        self.label_memory.setText(f"RSS {formatBytes(currentRss())} (peak {formatBytes(peakRss())}), {len(self._childWindows)} child windows")
 
     def changeLEDColor(self, color):
         self.led.setOnColour(color)
-        # print("forcing repaint")
-        self.repaint()
+        self.led.update()
     
     def convertStringToListOfInteger(self,topology : str): 
         if (len(topology) == 0): return []
@@ -209,14 +560,10 @@ class MainWindow(qtw.QWidget):
         self.button_tabelle.clicked.connect(self.buttonTabelleClicked)
 
     def buttonHistogrammClicked(self):
-        histogrammWindow = HistogrammWindow(self._dataManager)
-        self._childWindows.append(histogrammWindow)
-        histogrammWindow.show()
+        self._showChildWindow(HistogrammWindow(self._dataManager))
 
     def buttonTabelleClicked(self):
-        tabelleWindow = TabelleWindow(self._dataManager)
-        self._childWindows.append(tabelleWindow)
-        tabelleWindow.show()
+        self._showChildWindow(TabelleWindow(self._dataManager))
 
     # ... end GUI Section Two
 
@@ -224,6 +571,25 @@ class MainWindow(qtw.QWidget):
 
     def populateGUISectionThree(self, layout):
         layout.addWidget(self._rocWidget)
+        # every plotted run, unchecked ones are archived (hidden) in the plot
+        self.list_rocCurves = qtw.QListWidget()
+        self.list_rocCurves.setMaximumWidth(260)
+        layout.addWidget(self.list_rocCurves)
+        self._rocWidget.curveVisibilityChanged.connect(self.rocCurveVisibilityChanged)
+        self.list_rocCurves.itemChanged.connect(self.rocCurveItemChanged)
+
+    def rocCurveVisibilityChanged(self, index, visible):
+        if index == self.list_rocCurves.count():
+            item = qtw.QListWidgetItem(self._rocWidget.curveLabel(index))
+            item.setFlags(item.flags() | qtc.Qt.ItemIsUserCheckable)
+            item.setCheckState(qtc.Qt.Checked if visible else qtc.Qt.Unchecked)
+            self.list_rocCurves.addItem(item)
+            self.list_rocCurves.scrollToItem(item)
+        else:
+            self.list_rocCurves.item(index).setCheckState(qtc.Qt.Checked if visible else qtc.Qt.Unchecked)
+
+    def rocCurveItemChanged(self, item):
+        self._rocWidget.setCurveVisible(self.list_rocCurves.row(item), item.checkState() == qtc.Qt.Checked)
 
     # ... end GUI Section Three
 
@@ -265,12 +631,12 @@ class MainWindow(qtw.QWidget):
         verticalGroupboxLayoutRows.addLayout(horizontalFirstRowLayout)
         verticalGroupboxLayoutRows.addLayout(horizontalSecondRowLayout)
 
-        button_prognose = qtw.QPushButton("Prognose")
+        self.button_prognose = qtw.QPushButton("Prognose")
         self.textfield_prognose = qtw.QLineEdit()
         self.textfield_prognose.setReadOnly(True)
 
         horizontalPrognoseLayout = qtw.QHBoxLayout()
-        horizontalPrognoseLayout.addWidget(button_prognose)
+        horizontalPrognoseLayout.addWidget(self.button_prognose)
         horizontalPrognoseLayout.addWidget(self.textfield_prognose)
 
         verticalGroupboxLayoutPrognose.addLayout(horizontalPrognoseLayout)
@@ -279,7 +645,7 @@ class MainWindow(qtw.QWidget):
         layout.addLayout(verticalGroupboxLayoutPrognose)
         
         # widget connection 
-        button_prognose.clicked.connect(self.buttonPrognoseClicked)
+        self.button_prognose.clicked.connect(self.buttonPrognoseClicked)
 
     def buttonPrognoseClicked(self):
         result = self._neuralNetworkManager.predict(
@@ -291,18 +657,24 @@ class MainWindow(qtw.QWidget):
             self.textfield_bmi.text(),
             self.textfield_pedigree.text(),      
             self.textfield_age.text(),
-            self._dataManager.scaler
+            self._dataManager
         )
         self.textfield_prognose.setText("%.2f" % result)
 
     # ... end GUI Section Four
 
     def closeEvent(self, event):
-        for childWindow in self._childWindows:
-            childWindow.close()   
+        self._startupLoader.wait()
+        if self._trainingWorker is not None:
+            self._trainingWorker.stop()
+        if self._historyStore is not None:
+            self._historyStore.clear()
+        self._memoryTimer.stop()
+        for childWindow in list(self._childWindows):
+            childWindow.close()
 
 
 if __name__ == '__main__':
     app = qtw.QApplication(sys.argv)
-    mw = MainWindow()
+    mw = MainWindow(startupBenchmark='--startup-benchmark' in sys.argv)
     sys.exit(app.exec())
@@ -0,0 +1,63 @@
+import ctypes
+import os
+import sys
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    # PROCESS_MEMORY_COUNTERS of the Windows psapi
+    _fields_ = [
+        ('cb', ctypes.c_ulong),
+        ('PageFaultCount', ctypes.c_ulong),
+        ('PeakWorkingSetSize', ctypes.c_size_t),
+        ('WorkingSetSize', ctypes.c_size_t),
+        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+        ('PagefileUsage', ctypes.c_size_t),
+        ('PeakPagefileUsage', ctypes.c_size_t),
+    ]
+
+
+def _windowsMemoryCounters():
+    counters = _ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    return counters
+
+
+def peakRss():
+    # peak resident set size of this process in bytes
+    if sys.platform == 'win32':
+        return _windowsMemoryCounters().PeakWorkingSetSize
+    # Linux: VmHWM is the high-water mark of the resident set size (VmPeak would be the one of the
+    # address space); ru_maxrss would also include the peak of the parent process before fork/exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def currentRss():
+    # current resident set size of this process in bytes (the peak where the platform has no cheap way)
+    if sys.platform == 'win32':
+        return _windowsMemoryCounters().WorkingSetSize
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return peakRss()
+
+
+def formatBytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return "%.1f %s" % (size, unit)
+        size /= 1024
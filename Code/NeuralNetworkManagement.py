@@ -2,43 +2,315 @@ import tensorflow as tf
 import pandas as pd
 from tensorflow import keras
 from tensorflow.keras import layers
-from sklearn.metrics import roc_curve
 import numpy as np
+import collections
+import json
+import os
+import shutil
+import time
+from FastInference import DenseInferenceEngine, EnsembleInferenceEngine, PatientModel
+from Evaluation import SplitEvaluation
+from RunCache import CachedHistory
+from Profiling import profiler
+
+# training precision modes: (floatx of weights, inputs and the data pipeline, keras dtype policy);
+# 'mixed' computes in float16 and keeps the variables and the sigmoid output in float32
+precisionModes = {
+    'float64': ('float64', 'float64'),
+    'float32': ('float32', 'float32'),
+    'mixed': ('float32', 'mixed_float16'),
+}
+
+
+def setPrecision(precision):
+    floatx, policy = precisionModes[precision]
+    keras.backend.set_floatx(floatx)
+    if hasattr(keras.mixed_precision, 'set_global_policy'):
+        keras.mixed_precision.set_global_policy(policy)
+    else:
+        # TF 2.3
+        keras.mixed_precision.experimental.set_policy(policy)
+
+
+setPrecision('float64')
+
+
+def _optimizerVariables(optimizer):
+    # a property in keras 3, a method in TF 2.3
+    variables = optimizer.variables
+    return variables() if callable(variables) else variables
+
+
+class _EpochProfilingCallback(keras.callbacks.Callback):
+
+    # one profiler span per epoch with step time and throughput, a memory sample after every epoch
+    # and, opt-in, a tf.profiler capture of the epochs first..last (0-based, inclusive)
+
+    def __init__(self, samplesPerEpoch, profileEpochs=None, profileDirectory=None):
+        super().__init__()
+        self._samplesPerEpoch = samplesPerEpoch
+        self._profileEpochs = profileEpochs
+        self._profileDirectory = profileDirectory
+        self._tracing = False
+        self._epochStart = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if self._profileEpochs is not None and epoch == self._profileEpochs[0]:
+            print(f"** tf.profiler capture of epochs {self._profileEpochs[0]}-{self._profileEpochs[1]} into {self._profileDirectory}")
+            tf.profiler.experimental.start(self._profileDirectory)
+            self._tracing = True
+        self._epochStart = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        end = time.perf_counter()
+        steps = self.params.get('steps') or 1
+        duration = end - self._epochStart
+        profiler.addSpan('epoch', self._epochStart, end, 'epoch', epoch=epoch, steps=steps,
+            step_time=duration / steps, samples_per_second=self._samplesPerEpoch / duration)
+        profiler.sampleMemory()
+        if self._tracing and epoch >= self._profileEpochs[1]:
+            self._stopTracing()
+
+    def on_train_end(self, logs=None):
+        # early stopping or cancellation before the end of the range
+        if self._tracing:
+            self._stopTracing()
+
+    def _stopTracing(self):
+        tf.profiler.experimental.stop()
+        self._tracing = False
+
+class _CheckpointCallback(keras.callbacks.Callback):
+
+    # writes a checkpoint of the NNManager (weights, Adam state, learning history) every `every` epochs
+    # and at the end of the training, so an interrupted run can be resumed with NNManager.loadCheckpoint
+
+    def __init__(self, networkManager, directory, every, history, trainingTime):
+        super().__init__()
+        self._networkManager = networkManager
+        self._directory = directory
+        self._every = every
+        # learning history and training time of the epochs before this fit
+        self._history = {name: list(values) for name, values in history.items()}
+        self._trainingTime = trainingTime
+        self._start = None
+        self._lastSaved = None
+
+    def on_train_begin(self, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        for name, value in (logs or {}).items():
+            self._history.setdefault(name, []).append(float(value))
+        if (epoch + 1) % self._every == 0:
+            self._save(epoch)
+
+    def on_train_end(self, logs=None):
+        epochs = len(self._history.get('loss', []))
+        if epochs and self._lastSaved != epochs - 1:
+            self._save(epochs - 1)
+
+    def _save(self, epoch):
+        with profiler.span('checkpoint', epoch=epoch):
+            self._networkManager.saveCheckpoint(self._directory, self._history, self._trainingTime + time.perf_counter() - self._start)
+        self._lastSaved = epoch
+
+
+class StackedDense(layers.Layer):
+
+    # `replicas` independent Dense layers evaluated as one batched einsum:
+    # (batch, inputs) or (batch, replicas, inputs) -> (batch, replicas, units)
+
+    def __init__(self, replicas, units, activation=None, **kwargs):
+        super().__init__(**kwargs)
+        self.replicas = replicas
+        self.units = units
+        self.activation = keras.activations.get(activation)
+
+    def build(self, input_shape):
+        inputs = int(input_shape[-1])
+        # glorot uniform per replica (the default initializer would count the replicas into the fans)
+        limit = np.sqrt(6 / (inputs + self.units))
+        self.kernel = self.add_weight(name='kernel', shape=(self.replicas, inputs, self.units), initializer=keras.initializers.RandomUniform(-limit, limit))
+        self.bias = self.add_weight(name='bias', shape=(self.replicas, self.units), initializer='zeros')
+        super().build(input_shape)
+
+    def call(self, inputs):
+        equation = 'bi,rio->bro' if len(inputs.shape) == 2 else 'bri,rio->bro'
+        return self.activation(tf.einsum(equation, inputs, self.kernel) + self.bias)
+
+
+def _stackedBinaryCrossEntropy(y, probabilities):
+    # (batch,) outcomes against (batch, replicas) probabilities: the sum of the replica losses, so
+    # every replica gets exactly the gradient of its own binary cross-entropy
+    y = tf.broadcast_to(tf.reshape(tf.cast(y, probabilities.dtype), (-1, 1)), tf.shape(probabilities))
+    return tf.reduce_sum(keras.backend.binary_crossentropy(y, probabilities), axis=-1)
+
+
+def _replicaLoss(replica):
+    # binary cross-entropy of one replica as a keras metric, logged as replica_<i>_loss / val_replica_<i>_loss
+    def loss(y, probabilities):
+        return keras.backend.binary_crossentropy(tf.reshape(tf.cast(y, probabilities.dtype), (-1,)), probabilities[:, replica])
+    loss.__name__ = f'replica_{replica}_loss'
+    return loss
+
+
+class _ReplicaEarlyStopping(keras.callbacks.Callback):
+
+    # early stopping on val_loss for every replica of a stacked model on its own: a replica whose loss has
+    # not improved for `patience` epochs is done (training ends when all are), at the end every replica
+    # gets the weights of its best epoch back
+
+    def __init__(self, replicas, patience):
+        super().__init__()
+        self.patience = patience
+        self.bestLoss = np.full(replicas, np.inf)
+        self.bestEpoch = np.zeros(replicas, dtype=int)
+        self.stoppedEpoch = np.full(replicas, -1)
+        self._wait = np.zeros(replicas, dtype=int)
+        self._bestWeights = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        losses = np.array([logs[f'val_replica_{replica}_loss'] for replica in range(len(self.bestLoss))])
+        active = self.stoppedEpoch < 0
+        improved = active & (losses < self.bestLoss)
+        weights = self.model.get_weights()
+        if self._bestWeights is None:
+            self._bestWeights = weights
+        else:
+            # all weights of a stacked model have the replica as their first axis
+            for best, current in zip(self._bestWeights, weights):
+                best[improved] = current[improved]
+        self.bestLoss[improved] = losses[improved]
+        self.bestEpoch[improved] = epoch
+        self._wait[improved] = 0
+        self._wait[active & ~improved] += 1
+        self.stoppedEpoch[active & (self._wait >= self.patience)] = epoch
+        if np.all(self.stoppedEpoch >= 0):
+            self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        if self._bestWeights is not None:
+            self.model.set_weights(self._bestWeights)
 
-keras.backend.set_floatx('float64')
 
 class NNManager: 
 
+    backend = 'keras'
+
     def __init__(self): 
         print("NNManager initializing")
         self.current_run_topology = None
         self.current_run_learning_history = None
         self.current_run_holdout_accuracy = None
+        self.current_run_holdout_accuracy_value = None
         self.current_run_roc_data = None
+        self.current_run_batch_size = None
+        self.current_run_training_time = None
+        self.current_run_samples_per_second = None
+        # metrics of every split of the last trained run (Evaluation.SplitEvaluation)
+        self.current_run_evaluation = None
+        # NumPy snapshot of the trained weights for low-latency prognosis
+        self.inference_engine = None
+        # tf.profiler captures (trainAndSupervise profileEpochs) are written here
+        self.profile_directory = 'cache/tf-profile'
+        # keras progress output (0 = silent, 1 = progress bar, 2 = one line per epoch)
+        self.verbose = 1
+        # training precision of the next created model (one of precisionModes)
+        self.precision = 'float64'
+        self.current_run_precision = None
+        # checkpoints of the training (every checkpoint_every epochs, see saveCheckpoint), off without a directory;
+        # checkpoint_metadata is stored with them, e.g. the split seed to resume on the same data
+        self.checkpoint_directory = None
+        self.checkpoint_every = 10
+        self.checkpoint_metadata = dict()
+        self.current_run_model_config = None
+        self.current_run_training_config = None
+        # the current model comes from the RunCache (restoreRun): weights only, no Adam state to continue with
+        self.current_run_restored = False
+        # compiled models of earlier runs by (topology, activation, dropout, precision), most recently used last:
+        # a run of the same configuration gets one back with new weights and Adam state instead of paying for
+        # building, compiling and tracing again; 0 disables the pool
+        self.model_pool_size = 4
+        self._modelPool = collections.OrderedDict()
+        # stacked ensembles (createEnsembleModel / trainEnsemble): number of replicas and per replica
+        # learning history, SplitEvaluation and ROC data; the current_run_* results above are the ensemble's
+        self.current_run_replicas = None
+        self.current_run_replica_histories = None
+        self.current_run_replica_evaluations = None
+        self.current_run_replica_roc_data = None
 
-    def createNetworkModel(self, hiddenLayersConfig : list, withNonLinearActivation = True, withDropOutLayers = True): 
-        print(f"creating network with hidden layers topology of sizes {hiddenLayersConfig}")
-        self.current_run_topology = hiddenLayersConfig
+    def createNetworkModel(self, hiddenLayersConfig : list, withNonLinearActivation = True, withDropOutLayers = True, precision = None): 
+        if precision is None:
+            precision = self.precision
+        with profiler.span('create network model', topology=list(hiddenLayersConfig), precision=precision):
+            print(f"creating network with hidden layers topology of sizes {hiddenLayersConfig} in {precision} precision")
+            self.current_run_topology = hiddenLayersConfig
+            self.current_run_precision = precision
+            self.current_run_replicas = None
+            self.current_run_model_config = {'hiddenLayersConfig': list(hiddenLayersConfig), 'withNonLinearActivation': withNonLinearActivation,
+                'withDropOutLayers': withDropOutLayers, 'precision': precision}
+            self.current_run_learning_history = None
+            self.current_run_training_time = None
+            self.current_run_restored = False
 
-        # remove existing network from memory
-        keras.backend.clear_session()
+            poolKey = (tuple(hiddenLayersConfig), bool(withNonLinearActivation), bool(withDropOutLayers), precision)
+            if poolKey in self._modelPool:
+                setPrecision(precision)
+                self._modelPool.move_to_end(poolKey)
+                self.nn_model, initialOptimizerState = self._modelPool[poolKey]
+                self.reinitializeModel(initialOptimizerState)
+                print("** reusing the compiled network of an earlier run with new weights")
+                return
 
-        # define the keras model
-        self.nn_model = keras.Sequential()
-        if not withNonLinearActivation:
-            self.addLayers(self.nn_model, hiddenLayersConfig, 'linear', withDropOutLayers)
-            print("configured with linear !")
-        else:
-            self.addLayers(self.nn_model, hiddenLayersConfig, 'relu', withDropOutLayers)
+            # a new configuration: the least recently used networks make room for it in the pool and the session is
+            # cleared to release them (the pooled ones keep their own variables and go on working), or if nothing
+            # is pooled; the precision applies to everything created afterwards
+            evicting = len(self._modelPool) >= self.model_pool_size
+            while self._modelPool and len(self._modelPool) >= self.model_pool_size:
+                self._modelPool.popitem(last=False)
+            if evicting or not self._modelPool:
+                keras.backend.clear_session()
+            setPrecision(precision)
+
+            # define the keras model
+            self.nn_model = keras.Sequential()
+            if not withNonLinearActivation:
+                self.addLayers(self.nn_model, hiddenLayersConfig, 'linear', withDropOutLayers, precision == 'mixed')
+                print("configured with linear !")
+            else:
+                self.addLayers(self.nn_model, hiddenLayersConfig, 'relu', withDropOutLayers, precision == 'mixed')
+
+            # compile the keras model
+            self.nn_model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+
+            # print a topology summary to the console
+            self.nn_model.summary()
 
-        # compile the keras model
-        self.nn_model.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accuracy'])
+            if self.model_pool_size > 0:
+                optimizer = self.nn_model.optimizer
+                if hasattr(optimizer, 'build'):
+                    # keras 3 creates the Adam slots lazily, with them the fresh state can be kept for reinitializeModel
+                    optimizer.build(self.nn_model.trainable_variables)
+                self._modelPool[poolKey] = (self.nn_model, [variable.numpy() for variable in _optimizerVariables(optimizer)])
 
-        # print a topology summary to the console
-        self.nn_model.summary()
+    def reinitializeModel(self, optimizerState=()):
+        # new initial weights for every Dense layer and the optimizer state back to `optimizerState`
+        # (values of its variables when it was fresh; variables created later, like the lazy TF 2.3 slots, are zeroed)
+        for layer in self.nn_model.layers:
+            for name in ['kernel', 'bias']:
+                initializer = getattr(layer, f'{name}_initializer', None)
+                if initializer is None:
+                    continue
+                # a new instance per call, an unseeded keras initializer returns the same values every time
+                initializer = type(initializer).from_config(initializer.get_config())
+                variable = getattr(layer, name)
+                variable.assign(initializer(tuple(variable.shape), dtype=variable.dtype))
+        for i, variable in enumerate(_optimizerVariables(self.nn_model.optimizer)):
+            variable.assign(optimizerState[i] if i < len(optimizerState) else tf.zeros_like(variable))
 
 
-    def addLayers(self, model, hiddenLayersConfig, hiddenLayersActivationFunction, withDropOutLayers):
+    def addLayers(self, model, hiddenLayersConfig, hiddenLayersActivationFunction, withDropOutLayers, float32Output=False):
         # input layer
         model.add(layers.InputLayer(input_shape=(8,), name='input-layer'))
         # add hidden layers
@@ -46,66 +318,343 @@ class NNManager:
             model.add(layers.Dense(hiddenLayersConfig[i], activation=hiddenLayersActivationFunction, name=f"hidden-layer-{i+1}"))
             if withDropOutLayers:
                 model.add(layers.Dropout(0.5))
-        # output layer
-        model.add(layers.Dense(1, activation='sigmoid', name='output-layer'))
+        # output layer (a float16 sigmoid saturates too early for the loss, mixed precision keeps it in float32)
+        model.add(layers.Dense(1, activation='sigmoid', name='output-layer', dtype='float32' if float32Output else None))
 
 
-    def trainAndSupervise(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False):
+    def createDataset(self, X, y=None, batchSize=1, shuffleBufferSize=0, prefetch=True):
+        # feed the pandas splits of the DataManager through a cached tf.data pipeline
+        X_values = X.values.astype(keras.backend.floatx())
+        if y is None:
+            dataset = tf.data.Dataset.from_tensor_slices(X_values)
+        else:
+            y_values = y.values.astype(keras.backend.floatx())
+            dataset = tf.data.Dataset.from_tensor_slices((X_values, y_values))
+        dataset = dataset.cache()
+        if shuffleBufferSize is not None:
+            # a buffer size of 0 shuffles the whole set, like fit() does with pandas frames
+            if shuffleBufferSize <= 0: shuffleBufferSize = len(X_values)
+            dataset = dataset.shuffle(shuffleBufferSize, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batchSize)
+        if prefetch:
+            dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        return dataset
+
+    def epochsTrained(self):
+        if self.current_run_learning_history is None:
+            return 0
+        return len(self.current_run_learning_history.history['loss'])
+
+    def continueTraining(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False, batchSize=1, shuffleBufferSize=0, prefetch=True, callbacks=None, profileEpochs=None):
+        # warm start: the current model (weights and Adam state) is trained for `epochs` more epochs,
+        # the learning history is appended to (pass the splits of the run that is continued).
+        # A run restored from the RunCache is refused, the cache keeps no Adam state and it would silently start from zero
+        if self.current_run_restored:
+            raise ValueError("a run restored from the run cache has no optimizer state to continue, train it again without the cache")
+        return self.trainAndSupervise(X_train, y_train, X_test, y_test, X_validate, y_validate, epochs, earlyStopping, batchSize, shuffleBufferSize, prefetch,
+            callbacks, profileEpochs, initialEpoch=self.epochsTrained())
+
+    def trainAndSupervise(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False, batchSize=1, shuffleBufferSize=0, prefetch=True, callbacks=None, profileEpochs=None, initialEpoch=0):
+        # initialEpoch > 0 continues the current run (see continueTraining), epochs are counted from there
+        if initialEpoch:
+            print(f"continuing training after epoch {initialEpoch}")
         print("training network with supervised learning")
         print(f"** training set size {len(X_train.index)}")
         print(f"** validation set size {len(X_validate.index)}")
         print(f"** test set size {len(X_test.index)}")
-    
+        # None does not shuffle at all (see createDataset)
+        shuffleBuffer = 'off' if shuffleBufferSize is None else shuffleBufferSize if shuffleBufferSize > 0 else 'all'
+        print(f"** batch size {batchSize}, shuffle buffer {shuffleBuffer}, prefetch {prefetch}")
+        self.current_run_batch_size = batchSize
+        self.current_run_training_config = {'earlyStopping': earlyStopping, 'batchSize': batchSize, 'shuffleBufferSize': shuffleBufferSize, 'prefetch': prefetch}
+        previousHistory = self.current_run_learning_history.history if initialEpoch else dict()
+        previousTrainingTime = self.current_run_training_time if initialEpoch else 0.0
+
+        # input pipelines (only the training data is shuffled)
+        with profiler.span('create datasets'):
+            train_dataset = self.createDataset(X_train, y_train, batchSize, shuffleBufferSize, prefetch)
+            validate_dataset = self.createDataset(X_validate, y_validate, batchSize, None, prefetch)
+
         # train and cross-validate (validation set is not used in training ! but added to learning history)
         bestEpoch = -1
+        callbacks = list(callbacks or []) + [_EpochProfilingCallback(len(X_train.index), profileEpochs, self.profile_directory)]
         if earlyStopping:
             patience = 50
             early_stop = keras.callbacks.EarlyStopping(monitor='val_loss', min_delta=0, patience=patience, verbose=1, mode='auto', restore_best_weights=True)
+            callbacks.append(early_stop)
+        if self.checkpoint_directory:
+            callbacks.append(_CheckpointCallback(self, self.checkpoint_directory, self.checkpoint_every, previousHistory, previousTrainingTime))
+
+        start = time.perf_counter()
+        self.current_run_learning_history = self.nn_model.fit(train_dataset, validation_data=validate_dataset, epochs=initialEpoch + epochs, initial_epoch=initialEpoch, callbacks=callbacks, verbose=self.verbose)
+        trainingTime = time.perf_counter() - start
+        profiler.addSpan('fit', start, start + trainingTime)
+
+        epochsRun = len(self.current_run_learning_history.history['loss'])
+        self.current_run_samples_per_second = len(X_train.index) * epochsRun / trainingTime
+        print("Training time: %.2fs (%d epochs), throughput: %.0f samples/s\n" % (trainingTime, epochsRun, self.current_run_samples_per_second))
+        self.current_run_training_time = previousTrainingTime + trainingTime
+        if initialEpoch:
+            history = self.current_run_learning_history.history
+            self.current_run_learning_history = CachedHistory({name: list(values) + list(history.get(name, [])) for name, values in previousHistory.items()})
 
-            self.current_run_learning_history = self.nn_model.fit(X_train, y_train, validation_data=(X_validate, y_validate), epochs=epochs, callbacks=[early_stop], batch_size=1)
+        # (early stopping has restored the best weights at this point)
+        with profiler.span('inference snapshot'):
+            self.inference_engine = DenseInferenceEngine.fromKerasModel(self.nn_model)
 
+        if earlyStopping:
             bestEpochCandidate = np.argmin(self.current_run_learning_history.history['val_loss'])
-            if bestEpochCandidate + patience < epochs: bestEpoch = bestEpochCandidate
-        else:
+            if bestEpochCandidate + patience < initialEpoch + epochs: bestEpoch = bestEpochCandidate
 
-            self.current_run_learning_history = self.nn_model.fit(X_train, y_train, validation_data=(X_validate, y_validate), epochs=epochs, batch_size=1)
+        # one prediction pass over the rows of all splits on the NumPy snapshot, every metric is derived from it
+        with profiler.span('evaluate'):
+            self.current_run_evaluation = self.evaluateSplits(X_train, y_train, X_test, y_test, X_validate, y_validate)
+            for name, title in [('train', "Training"), ('validate', "Validation"), ('test', "Testing"), ('holdout', "Holdout (Testing & Validation)")]:
+                print("Accuracy for %s Dataset: %.2f%%\n" % (title, self.current_run_evaluation[name].accuracy()*100))
+            holdout = self.current_run_evaluation['holdout']
+            self.current_run_holdout_accuracy_value = holdout.accuracy()
+            self.current_run_holdout_accuracy = "%.2f%%" % (self.current_run_holdout_accuracy_value*100)
+            print("Holdout loss %.4f, AUC %.4f, confusion matrix %s\n" % (holdout.loss(), holdout.auc(), holdout.confusionMatrix().tolist()))
 
-        # accuracy when applied on training data after training
-        training_scores = self.nn_model.evaluate(X_train, y_train, batch_size=1)
-        print("Accuracy for Training Dataset: %.2f%%\n" % (training_scores[1]*100))
+        # compute and return ROC data (and bestEpoch)
+        with profiler.span('roc curve'):
+            self.current_run_roc_data = holdout.rocCurve()
 
-        # accuracy when applied on validation data after training
-        validation_scores = self.nn_model.evaluate(X_validate, y_validate, batch_size=1)
-        print("Accuracy for Validation Dataset: %.2f%%\n" % (validation_scores[1]*100))
+        return self.current_run_roc_data, bestEpoch
+    
 
-        # accuracy when applied on testing data after training
-        testing_scores = self.nn_model.evaluate(X_test, y_test, batch_size=1)
-        current_run_testing_accuracy = "%.2f%%" % (testing_scores[1]*100)
-        print("Accuracy for Testing Dataset: " + current_run_testing_accuracy + "\n")
+    def evaluateSplits(self, X_train, y_train, X_test, y_test, X_validate, y_validate):
+        return SplitEvaluation.fromSplits(self.inference_engine.predict, X_train, y_train, X_test, y_test, X_validate, y_validate)
 
-        # accuracy when applied on all hold-out data (validation + testing data) after training
-        X_frames = [X_test, X_validate]
-        X_holdout = pd.concat(X_frames, ignore_index=True)
-        y_frames = [y_test, y_validate]
-        y_holdout = pd.concat(y_frames, ignore_index=True)
+    def trainOnStreams(self, streamingDataManager, epochs=50, earlyStopping=False, batchSize=256, prefetch=True, callbacks=None):
+        # out-of-core counterpart of trainAndSupervise: the splits are streamed from the column store of a StreamingDataManager
+        print("training network with supervised learning on streamed data")
+        for name in ['train', 'validate', 'test']:
+            print(f"** {name} set size {streamingDataManager.split_sizes[name]}")
+        self.current_run_batch_size = batchSize
 
-        holdout_scores = self.nn_model.evaluate(X_holdout, y_holdout, batch_size=1)
-        self.current_run_holdout_accuracy = "%.2f%%" % (holdout_scores[1]*100)
-        print("Accuracy for Holdout (Testing & Validation) Dataset: %.2f%%\n" % (holdout_scores[1]*100))
+        train_dataset = streamingDataManager.createDataset('train', batchSize, shuffle=True, prefetch=prefetch)
+        validate_dataset = streamingDataManager.createDataset('validate', batchSize, prefetch=prefetch)
 
-        # compute and return ROC data (and bestEpoch)
-        y_holdout_prediction_probabilities = self.nn_model.predict(X_holdout)
-        self.current_run_roc_data = roc_curve(y_holdout, y_holdout_prediction_probabilities)
+        bestEpoch = -1
+        callbacks = list(callbacks or [])
+        if earlyStopping:
+            patience = 50
+            callbacks.append(keras.callbacks.EarlyStopping(monitor='val_loss', min_delta=0, patience=patience, verbose=1, mode='auto', restore_best_weights=True))
+        callbacks.append(_EpochProfilingCallback(streamingDataManager.split_sizes['train']))
+
+        start = time.perf_counter()
+        self.current_run_learning_history = self.nn_model.fit(train_dataset, validation_data=validate_dataset, epochs=epochs, callbacks=callbacks, verbose=self.verbose)
+        self.current_run_training_time = time.perf_counter() - start
+        profiler.addSpan('fit', start, start + self.current_run_training_time)
+        epochsRun = len(self.current_run_learning_history.history['loss'])
+        self.current_run_samples_per_second = streamingDataManager.split_sizes['train'] * epochsRun / self.current_run_training_time
+        print("Training time: %.2fs (%d epochs), throughput: %.0f samples/s\n" % (self.current_run_training_time, epochsRun, self.current_run_samples_per_second))
 
+        self.inference_engine = DenseInferenceEngine.fromKerasModel(self.nn_model)
+        if earlyStopping:
+            bestEpochCandidate = np.argmin(self.current_run_learning_history.history['val_loss'])
+            if bestEpochCandidate + patience < epochs: bestEpoch = bestEpochCandidate
+
+        # hold-out (validation + testing data) is scored block by block on the NumPy snapshot
+        with profiler.span('evaluate'):
+            probabilities = list()
+            outcomes = list()
+            for X, y in streamingDataManager.batchGenerator('holdout', 65536):
+                probabilities.append(self.inference_engine.predict(X))
+                outcomes.append(y)
+            y_holdout = np.concatenate(outcomes)
+            self.current_run_evaluation = SplitEvaluation(y_holdout, np.concatenate(probabilities), {'holdout': np.arange(len(y_holdout))})
+        holdout = self.current_run_evaluation['holdout']
+        self.current_run_holdout_accuracy_value = holdout.accuracy()
+        self.current_run_holdout_accuracy = "%.2f%%" % (self.current_run_holdout_accuracy_value*100)
+        print("Accuracy for Holdout (Testing & Validation) Dataset: " + self.current_run_holdout_accuracy + "\n")
+
+        with profiler.span('roc curve'):
+            self.current_run_roc_data = holdout.rocCurve()
         return self.current_run_roc_data, bestEpoch
-    
 
-    def predict(self, pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age, scaler):
-        # apply scaling with factors stored in scaler during training
-        np_array = np.array([pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age, 0])
-        np_array = np_array.reshape(1, -1)
-        prognose_X = scaler.transform(np_array)
-        prognose_X = np.delete(prognose_X, 8, axis=1)
-        
-        # call predict
-        return self.nn_model.predict(prognose_X)
+    def createEnsembleModel(self, hiddenLayersConfig : list, replicas, withNonLinearActivation = True, withDropOutLayers = True, precision = None):
+        # `replicas` independently initialized copies of the createNetworkModel network as one model of
+        # StackedDense layers, trained together by trainEnsemble (the output is (batch, replicas))
+        if precision is None:
+            precision = self.precision
+        with profiler.span('create ensemble model', topology=list(hiddenLayersConfig), replicas=replicas, precision=precision):
+            print(f"creating ensemble of {replicas} networks with hidden layers topology of sizes {hiddenLayersConfig} in {precision} precision")
+            self.current_run_topology = hiddenLayersConfig
+            self.current_run_precision = precision
+            self.current_run_replicas = replicas
+
+            # stacked models are not pooled, the session of the pooled ones is cleared with them
+            self._modelPool.clear()
+            keras.backend.clear_session()
+            setPrecision(precision)
+            outputDtype = 'float32' if precision == 'mixed' else None
+            self.nn_model = keras.Sequential()
+            self.nn_model.add(layers.InputLayer(input_shape=(8,), name='input-layer'))
+            for i, units in enumerate(hiddenLayersConfig):
+                self.nn_model.add(StackedDense(replicas, units, 'relu' if withNonLinearActivation else 'linear', name=f"hidden-layer-{i+1}"))
+                if withDropOutLayers:
+                    self.nn_model.add(layers.Dropout(0.5))
+            self.nn_model.add(StackedDense(replicas, 1, 'sigmoid', name='output-layer', dtype=outputDtype))
+            self.nn_model.add(layers.Reshape((replicas,), name='replica-probabilities', dtype=outputDtype))
+            self.nn_model.compile(loss=_stackedBinaryCrossEntropy, optimizer='adam', metrics=[_replicaLoss(replica) for replica in range(replicas)])
+            self.nn_model.summary()
+
+    def trainEnsemble(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False, batchSize=1, shuffleBufferSize=0, prefetch=True, callbacks=None):
+        # trainAndSupervise for a model of createEnsembleModel: all replicas see the same batches in one fit loop,
+        # with early stopping every replica stops and restores its best weights on its own.
+        # Returns the holdout ROC data of every replica, of the ensemble (mean probability) and the best epochs
+        replicas = self.current_run_replicas
+        print(f"training ensemble of {replicas} networks with supervised learning")
+        print(f"** training set size {len(X_train.index)}, validation set size {len(X_validate.index)}, test set size {len(X_test.index)}")
+        self.current_run_batch_size = batchSize
+
+        with profiler.span('create datasets'):
+            train_dataset = self.createDataset(X_train, y_train, batchSize, shuffleBufferSize, prefetch)
+            validate_dataset = self.createDataset(X_validate, y_validate, batchSize, None, prefetch)
+
+        patience = 50
+        callbacks = list(callbacks or []) + [_EpochProfilingCallback(len(X_train.index))]
+        if earlyStopping:
+            early_stop = _ReplicaEarlyStopping(replicas, patience)
+            callbacks.append(early_stop)
+
+        start = time.perf_counter()
+        history = self.nn_model.fit(train_dataset, validation_data=validate_dataset, epochs=epochs, callbacks=callbacks, verbose=self.verbose).history
+        self.current_run_training_time = time.perf_counter() - start
+        profiler.addSpan('fit', start, start + self.current_run_training_time)
+        epochsRun = len(history['loss'])
+        self.current_run_samples_per_second = len(X_train.index) * epochsRun / self.current_run_training_time
+        print("Training time: %.2fs (%d epochs x %d replicas), throughput: %.0f samples/s per replica\n" % (self.current_run_training_time, epochsRun, replicas, self.current_run_samples_per_second))
+
+        # per replica learning histories up to the epoch the replica stopped in, the ensemble's is their mean
+        self.current_run_replica_histories = list()
+        bestEpochs = list()
+        for replica in range(replicas):
+            lastEpoch = epochsRun
+            bestEpoch = -1
+            if earlyStopping:
+                if early_stop.stoppedEpoch[replica] >= 0: lastEpoch = early_stop.stoppedEpoch[replica] + 1
+                if early_stop.bestEpoch[replica] + patience < epochs: bestEpoch = int(early_stop.bestEpoch[replica])
+            self.current_run_replica_histories.append(CachedHistory({name: [float(v) for v in history[f'{prefix}replica_{replica}_loss'][:lastEpoch]] for name, prefix in [('loss', ''), ('val_loss', 'val_')]}))
+            bestEpochs.append(bestEpoch)
+        self.current_run_learning_history = CachedHistory({name: np.nanmean([np.pad(np.array(h.history[name]), (0, epochsRun - len(h.history[name])), constant_values=np.nan)
+            for h in self.current_run_replica_histories], axis=0).tolist() for name in ['loss', 'val_loss']})
+
+        # one NumPy engine per replica from the slices of the stacked weights
+        with profiler.span('inference snapshot'):
+            stackedLayers = [(layer.get_weights(), layer.activation.__name__) for layer in self.nn_model.layers if hasattr(layer, 'kernel')]
+            self.inference_engine = EnsembleInferenceEngine([
+                DenseInferenceEngine([(kernel[replica], bias[replica], activation) for (kernel, bias), activation in stackedLayers])
+                for replica in range(replicas)])
+
+        # one prediction pass for all replicas, the ensemble's evaluation gets the mean and the replica
+        # evaluations share its rows and splits
+        with profiler.span('evaluate'):
+            replicaProbabilities = list()
+            def predict(X):
+                replicaProbabilities.append(self.inference_engine.predictReplicas(X))
+                return replicaProbabilities[0].mean(axis=1)
+            self.current_run_evaluation = SplitEvaluation.fromSplits(predict, X_train, y_train, X_test, y_test, X_validate, y_validate)
+            self.current_run_replica_evaluations = [SplitEvaluation(self.current_run_evaluation.y, replicaProbabilities[0][:, replica], self.current_run_evaluation.splits)
+                for replica in range(replicas)]
+            holdout = self.current_run_evaluation['holdout']
+            self.current_run_holdout_accuracy_value = holdout.accuracy()
+            self.current_run_holdout_accuracy = "%.2f%%" % (self.current_run_holdout_accuracy_value*100)
+            replicaAucs = [evaluation['holdout'].auc() for evaluation in self.current_run_replica_evaluations]
+            print("Holdout AUC of the replicas %.4f +- %.4f (%.4f - %.4f), of the ensemble %.4f, ensemble accuracy %s\n" % (
+                np.mean(replicaAucs), np.std(replicaAucs), np.min(replicaAucs), np.max(replicaAucs), holdout.auc(), self.current_run_holdout_accuracy))
+
+        with profiler.span('roc curve'):
+            self.current_run_roc_data = holdout.rocCurve()
+            self.current_run_replica_roc_data = [evaluation['holdout'].rocCurve() for evaluation in self.current_run_replica_evaluations]
+        return self.current_run_replica_roc_data, self.current_run_roc_data, bestEpochs
+
+    def saveCheckpoint(self, directory, history=None, trainingTime=None):
+        # weights and optimizer state (tf.train.Checkpoint) with the model and training configuration and the
+        # learning history; written next to the old checkpoint and then swapped in, so one always stays readable
+        temporaryPath = directory.rstrip('/\\') + f".{os.getpid()}.tmp"
+        shutil.rmtree(temporaryPath, ignore_errors=True)
+        os.makedirs(temporaryPath)
+        tf.train.Checkpoint(model=self.nn_model, optimizer=self.nn_model.optimizer).write(os.path.join(temporaryPath, 'model'))
+        if history is None:
+            history = {name: [float(v) for v in values] for name, values in self.current_run_learning_history.history.items()}
+        meta = {
+            'backend': self.backend,
+            'model': self.current_run_model_config,
+            'training': self.current_run_training_config,
+            'history': history,
+            'training_time': self.current_run_training_time if trainingTime is None else trainingTime,
+            'metadata': self.checkpoint_metadata,
+            'created': time.time(),
+        }
+        with open(os.path.join(temporaryPath, 'run.json'), 'w') as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporaryPath, directory)
+
+    def loadCheckpoint(self, directory):
+        # recreates the model of a checkpoint with its weights, Adam state and learning history, ready for
+        # continueTraining; returns the stored metadata (run.json) to continue with the same data and settings
+        with open(os.path.join(directory, 'run.json')) as f:
+            meta = json.load(f)
+        self.createNetworkModel(**meta['model'])
+        checkpoint = tf.train.Checkpoint(model=self.nn_model, optimizer=self.nn_model.optimizer)
+        checkpoint.read(os.path.join(directory, 'model'))
+        if hasattr(self.nn_model.optimizer, 'build'):
+            # keras 3 creates the Adam slots lazily, the restored values are assigned when they exist
+            self.nn_model.optimizer.build(self.nn_model.trainable_variables)
+        self.current_run_learning_history = CachedHistory(meta['history'])
+        self.current_run_training_time = meta['training_time']
+        self.current_run_training_config = meta['training']
+        self.current_run_batch_size = meta['training']['batchSize']
+        self.checkpoint_metadata = meta['metadata']
+        self.current_run_evaluation = None
+        self.inference_engine = DenseInferenceEngine.fromKerasModel(self.nn_model)
+        print(f"** checkpoint {directory} loaded after epoch {self.epochsTrained()}")
+        return meta
+
+    def restoreRun(self, learningHistory, roc_data, holdoutAccuracyValue, batchSize, trainingTime, samplesPerSecond):
+        # results of a run restored from the RunCache into the model created by createNetworkModel
+        self.current_run_learning_history = learningHistory
+        self.current_run_roc_data = roc_data
+        self.current_run_holdout_accuracy_value = holdoutAccuracyValue
+        self.current_run_holdout_accuracy = "%.2f%%" % (holdoutAccuracyValue*100)
+        self.current_run_batch_size = batchSize
+        self.current_run_training_time = trainingTime
+        self.current_run_samples_per_second = samplesPerSecond
+        self.current_run_evaluation = None
+        self.current_run_restored = True
+        self.inference_engine = DenseInferenceEngine.fromKerasModel(self.nn_model)
+
+    def predict(self, pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age, dataManager):
+        # a single patient bypasses the keras predict loop and is evaluated on the NumPy snapshot
+        patient = np.array([pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age], dtype=np.float64)
+        return self.inference_engine.predictOne(dataManager.transformFeatures(patient)[0])
+
+    def predictBatch(self, X, dataManager):
+        # apply imputation and scaling with the statistics stored in the DataManager during preprocessing,
+        # then score all rows in one vectorized forward pass
+        return self.inference_engine.predict(dataManager.transformFeatures(X))
+
+    def exportModel(self, path, dataManager, weights='float64'):
+        # the NumPy snapshot together with the preprocessing statistics, loaded by the InferenceServer;
+        # weights float16 or int8 give a compact artifact (PatientModel.weightFormats)
+        if self.current_run_replicas is not None:
+            raise ValueError("a stacked ensemble cannot be exported, only single networks")
+        PatientModel.fromManagers(self, dataManager).save(path, weights)
+        print(f"** model exported to {path} ({weights} weights)")
+
+    def scoreCsvFile(self, inputPath, outputPath, dataManager, chunkSize=100000):
+        # stream a large CSV in fixed-size chunks, only one chunk is held in memory at a time
+        print(f"scoring {inputPath} in chunks of {chunkSize} rows")
+        rows = 0
+        start = time.perf_counter()
+        for i, chunk in enumerate(pd.read_csv(inputPath, chunksize=chunkSize)):
+            chunk['Probability'] = self.predictBatch(chunk, dataManager)
+            chunk.to_csv(outputPath, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            rows += len(chunk.index)
+        duration = time.perf_counter() - start
+        print("** scored %d rows in %.2fs (%.0f rows/s), written to %s" % (rows, duration, rows / max(duration, 1e-9), outputPath))
+        return rows
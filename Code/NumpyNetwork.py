@@ -0,0 +1,448 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+from FastInference import DenseInferenceEngine, PatientModel
+from Evaluation import SplitEvaluation, binaryCrossEntropy
+from Profiling import profiler
+from RunCache import CachedHistory
+
+
+class NumpyMLP:
+
+    # the network of NNManager.addLayers (Dense hidden layers with ReLU or linear activation, each
+    # followed by dropout 0.5 when enabled, one sigmoid output unit) trained with Adam on the binary
+    # cross-entropy, forward and backward pass as a handful of vectorized NumPy operations per step
+
+    """NumpyMLP constructor"""
+    def __init__(self, hiddenLayersConfig, activation='relu', dropoutRate=0.0, inputSize=8, dtype=np.float64, seed=None):
+        self.activation = activation
+        self.dropoutRate = dropoutRate
+        self.dtype = np.dtype(dtype)
+        self._random = np.random.default_rng(seed)
+        sizes = [inputSize] + list(hiddenLayersConfig) + [1]
+        shapes = [shape for fanIn, fanOut in zip(sizes[:-1], sizes[1:]) for shape in ((fanIn, fanOut), (fanOut,))]
+        # all weights (and their gradients) are views into one flat vector, so an Adam step is a few
+        # operations over that vector instead of a few per layer (the per-call overhead dominates here)
+        self._parameters = np.zeros(sum(int(np.prod(shape)) for shape in shapes), dtype=self.dtype)
+        self._gradients = np.zeros_like(self._parameters)
+        weights = self._views(self._parameters, shapes)
+        gradients = self._views(self._gradients, shapes)
+        self.kernels, self.biases = weights[0::2], weights[1::2]
+        self._kernelGradients, self._biasGradients = gradients[0::2], gradients[1::2]
+        for kernel in self.kernels:
+            # glorot uniform kernels and zero biases, the keras Dense defaults
+            limit = np.sqrt(6 / sum(kernel.shape))
+            kernel[...] = self._random.uniform(-limit, limit, kernel.shape)
+        # keras Adam defaults
+        self.learningRate = 0.001
+        self.beta1 = 0.9
+        self.beta2 = 0.999
+        self.epsilon = 1e-7
+        self._moment = np.zeros_like(self._parameters)
+        self._velocity = np.zeros_like(self._parameters)
+        self._update = np.zeros_like(self._parameters)
+        self._iterations = 0
+        # set by callbacks (like keras Model.stop_training) to end fit() after the current step
+        self.stop_training = False
+
+    @staticmethod
+    def _views(vector, shapes):
+        views = list()
+        offset = 0
+        for shape in shapes:
+            size = int(np.prod(shape))
+            views.append(vector[offset:offset + size].reshape(shape))
+            offset += size
+        return views
+
+    def get_weights(self):
+        # [kernel, bias, kernel, bias, ...] copies like keras Model.get_weights (RunCache stores these)
+        return [w.copy() for kernel, bias in zip(self.kernels, self.biases) for w in (kernel, bias)]
+
+    def set_weights(self, weights):
+        for target, w in zip([w for kernel, bias in zip(self.kernels, self.biases) for w in (kernel, bias)], weights):
+            target[...] = w
+
+    def saveState(self, path):
+        # weights and Adam state (moments and step count) in one .npz, see loadState
+        np.savez(path, parameters=self._parameters, moment=self._moment, velocity=self._velocity, iterations=self._iterations)
+
+    def loadState(self, path):
+        with np.load(path) as arrays:
+            self._parameters[...] = arrays['parameters']
+            self._moment[...] = arrays['moment']
+            self._velocity[...] = arrays['velocity']
+            self._iterations = int(arrays['iterations'])
+
+    def layers(self):
+        # (kernel, bias, activation) for the DenseInferenceEngine, dropout is the identity at inference
+        activations = [self.activation] * (len(self.kernels) - 1) + ['sigmoid']
+        return list(zip(self.kernels, self.biases, activations))
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=self.dtype)
+        for kernel, bias, activation in self.layers()[:-1]:
+            X = X @ kernel + bias
+            if activation == 'relu':
+                np.maximum(X, 0, out=X)
+        logits = X @ self.kernels[-1] + self.biases[-1]
+        return np.exp(-np.logaddexp(0, -logits[:, 0]))
+
+    def _step(self, X, y):
+        # one Adam step on a batch, returns the summed loss and the number of correct predictions
+        inputs = list()
+        masks = list()
+        for kernel, bias in zip(self.kernels[:-1], self.biases[:-1]):
+            inputs.append(X)
+            X = X @ kernel + bias
+            if self.activation == 'relu':
+                masks.append(X > 0)
+                X = X * masks[-1]
+            else:
+                masks.append(None)
+            if self.dropoutRate:
+                # inverted dropout, as keras: kept units are scaled by 1 / (1 - rate)
+                keep = self._random.random(X.shape) >= self.dropoutRate
+                X = X * (keep / (1 - self.dropoutRate))
+                masks[-1] = keep if masks[-1] is None else masks[-1] & keep
+        inputs.append(X)
+        logits = X @ self.kernels[-1] + self.biases[-1]
+
+        # loss from the logits (numerically stable), the gradient of the mean loss is (p - y) / rows
+        loss = float(np.sum(np.logaddexp(0, logits) - y * logits))
+        probabilities = np.exp(-np.logaddexp(0, -logits))
+        correct = int(np.sum((probabilities > 0.5) == (y == 1)))
+        delta = (probabilities - y) / len(y)
+
+        for i in range(len(self.kernels) - 1, -1, -1):
+            np.matmul(inputs[i].T, delta, out=self._kernelGradients[i])
+            np.sum(delta, axis=0, out=self._biasGradients[i])
+            if i > 0:
+                delta = delta @ self.kernels[i].T
+                if masks[i - 1] is not None:
+                    delta *= masks[i - 1]
+                if self.dropoutRate:
+                    delta /= 1 - self.dropoutRate
+        self._applyAdam()
+        return loss, correct
+
+    def _applyAdam(self):
+        # the keras update with bias-corrected step size, in place on the flat vectors
+        self._iterations += 1
+        learningRate = float(self.learningRate * np.sqrt(1 - self.beta2 ** self._iterations) / (1 - self.beta1 ** self._iterations))
+        gradients, moment, velocity, update = self._gradients, self._moment, self._velocity, self._update
+        moment *= self.beta1
+        moment += (1 - self.beta1) * gradients
+        np.multiply(gradients, gradients, out=update)
+        velocity *= self.beta2
+        velocity += (1 - self.beta2) * update
+        np.sqrt(velocity, out=update)
+        update += self.epsilon
+        np.divide(moment, update, out=update)
+        update *= learningRate
+        self._parameters -= update
+
+    def fit(self, X, y, validationData=None, epochs=50, batchSize=None, shuffle=True, callbacks=None, patience=None, verbose=0):
+        # keras-like training loop: batchSize None trains full-batch, callbacks get the keras hooks
+        # (on_epoch_begin/end with loss, accuracy, val_loss, val_accuracy and on_train_batch_end);
+        # with a patience, training stops when val_loss has not improved for that many epochs and
+        # the weights of the best epoch are restored
+        X = np.asarray(X, dtype=self.dtype)
+        y = np.asarray(y, dtype=self.dtype).reshape(-1, 1)
+        batchSize = len(X) if not batchSize else min(batchSize, len(X))
+        steps = -(-len(X) // batchSize)
+        callbacks = list(callbacks or [])
+        history = {'loss': [], 'accuracy': []}
+        if validationData is not None:
+            X_validate = np.asarray(validationData[0], dtype=self.dtype)
+            y_validate = np.asarray(validationData[1], dtype=self.dtype)
+            history.update({'val_loss': [], 'val_accuracy': []})
+        for callback in callbacks:
+            callback.set_model(self)
+            callback.set_params({'epochs': epochs, 'steps': steps, 'verbose': verbose})
+            callback.on_train_begin()
+
+        self.stop_training = False
+        bestLoss = np.inf
+        bestWeights = None
+        wait = 0
+        for epoch in range(epochs):
+            for callback in callbacks:
+                callback.on_epoch_begin(epoch)
+            start = time.perf_counter()
+            rows = self._random.permutation(len(X)) if shuffle else np.arange(len(X))
+            lossSum = 0.0
+            correct = 0
+            seen = 0
+            for step in range(steps):
+                batch = rows[step * batchSize:(step + 1) * batchSize]
+                loss, batchCorrect = self._step(X[batch], y[batch])
+                lossSum += loss
+                correct += batchCorrect
+                seen += len(batch)
+                for callback in callbacks:
+                    callback.on_train_batch_end(step)
+                if self.stop_training:
+                    break
+            logs = {'loss': lossSum / seen, 'accuracy': correct / seen}
+            if validationData is not None:
+                probabilities = self.predict(X_validate)
+                logs['val_loss'] = binaryCrossEntropy(y_validate, probabilities)
+                logs['val_accuracy'] = float(np.mean((probabilities > 0.5) == (y_validate == 1)))
+            for name, value in logs.items():
+                history[name].append(value)
+            end = time.perf_counter()
+            profiler.addSpan('epoch', start, end, 'epoch', epoch=epoch, steps=steps,
+                step_time=(end - start) / steps, samples_per_second=seen / (end - start))
+            if verbose:
+                print(f"Epoch {epoch + 1}/{epochs} - {end - start:.3f}s - " + " - ".join(f"{name}: {value:.4f}" for name, value in logs.items()))
+            for callback in callbacks:
+                callback.on_epoch_end(epoch, logs)
+
+            if patience is not None and validationData is not None:
+                if logs['val_loss'] < bestLoss:
+                    bestLoss = logs['val_loss']
+                    bestWeights = self.get_weights()
+                    wait = 0
+                else:
+                    wait += 1
+                    if wait >= patience:
+                        print(f"Epoch {epoch + 1}: early stopping")
+                        self.stop_training = True
+            if self.stop_training:
+                break
+        for callback in callbacks:
+            callback.on_train_end()
+        if bestWeights is not None:
+            self.set_weights(bestWeights)
+        profiler.sampleMemory()
+        return CachedHistory(history)
+
+
+class _CheckpointCallback:
+
+    # the periodic checkpoints of NeuralNetworkManagement._CheckpointCallback for NumpyMLP.fit, every `every`
+    # epochs of the run (counting those before a continueTraining); the final one is written by trainAndSupervise
+    # after fit, when early stopping has restored the best weights
+
+    def __init__(self, networkManager, directory, every, history, trainingTime):
+        self._networkManager = networkManager
+        self._directory = directory
+        self._every = every
+        # learning history and training time of the epochs before this fit
+        self._history = {name: list(values) for name, values in history.items()}
+        self._trainingTime = trainingTime
+        self._start = None
+
+    def set_model(self, model):
+        pass
+
+    def set_params(self, params):
+        pass
+
+    def on_train_begin(self, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        pass
+
+    def on_train_batch_end(self, batch, logs=None):
+        pass
+
+    def on_epoch_end(self, epoch, logs=None):
+        for name, value in (logs or {}).items():
+            self._history.setdefault(name, []).append(float(value))
+        if len(self._history['loss']) % self._every == 0:
+            with profiler.span('checkpoint', epoch=epoch):
+                self._networkManager.saveCheckpoint(self._directory, self._history, self._trainingTime + time.perf_counter() - self._start)
+
+    def on_train_end(self, logs=None):
+        pass
+
+
+class NumpyNNManager:
+
+    # drop-in for NNManager (createNetworkModel, trainAndSupervise, predict, exportModel, ...) that
+    # trains NumpyMLP instead of a keras model: for the small tabular networks of this data set the
+    # per-step overhead of TensorFlow dominates, and nothing here imports TensorFlow
+
+    backend = 'numpy'
+    precisionModes = ['float64', 'float32']
+
+    """NumpyNNManager constructor"""
+    def __init__(self):
+        print("NumpyNNManager initializing")
+        self.current_run_topology = None
+        self.current_run_precision = None
+        # stacked ensembles are a keras backend feature
+        self.current_run_replicas = None
+        self.current_run_learning_history = None
+        self.current_run_holdout_accuracy = None
+        self.current_run_holdout_accuracy_value = None
+        self.current_run_roc_data = None
+        self.current_run_batch_size = None
+        self.current_run_training_time = None
+        self.current_run_samples_per_second = None
+        self.current_run_evaluation = None
+        self.current_run_model_config = None
+        self.current_run_training_config = None
+        # the current model comes from the RunCache (restoreRun): weights only, no Adam state to continue with
+        self.current_run_restored = False
+        self.inference_engine = None
+        self.nn_model = None
+        self.verbose = 1
+        self.precision = 'float64'
+        # checkpoints of the training as in NNManager (every checkpoint_every epochs and at the end, see
+        # saveCheckpoint), off without a directory; checkpoint_metadata is stored with them
+        self.checkpoint_directory = None
+        self.checkpoint_every = 10
+        self.checkpoint_metadata = dict()
+        # seeds weight initialization, shuffling and dropout of the next created model (None: random)
+        self.seed = None
+
+    def createNetworkModel(self, hiddenLayersConfig : list, withNonLinearActivation = True, withDropOutLayers = True, precision = None):
+        if precision is None:
+            precision = self.precision
+        if precision not in self.precisionModes:
+            raise ValueError(f"precision {precision} is not supported by the NumPy backend (one of {self.precisionModes})")
+        with profiler.span('create network model', topology=list(hiddenLayersConfig), precision=precision):
+            print(f"creating NumPy network with hidden layers topology of sizes {hiddenLayersConfig} in {precision} precision")
+            self.current_run_topology = hiddenLayersConfig
+            self.current_run_precision = precision
+            self.current_run_model_config = {'hiddenLayersConfig': list(hiddenLayersConfig), 'withNonLinearActivation': withNonLinearActivation,
+                'withDropOutLayers': withDropOutLayers, 'precision': precision}
+            self.current_run_learning_history = None
+            self.current_run_training_time = None
+            self.current_run_restored = False
+            self.nn_model = NumpyMLP(hiddenLayersConfig, 'relu' if withNonLinearActivation else 'linear',
+                0.5 if withDropOutLayers else 0.0, dtype=precision, seed=self.seed)
+
+    def epochsTrained(self):
+        if self.current_run_learning_history is None:
+            return 0
+        return len(self.current_run_learning_history.history['loss'])
+
+    def continueTraining(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False, batchSize=1, shuffleBufferSize=0, prefetch=True, callbacks=None, profileEpochs=None):
+        # warm start like NNManager.continueTraining: the NumpyMLP keeps its weights and Adam state between fit() calls;
+        # a run restored from the RunCache is refused, the cache keeps no Adam state and it would silently start from zero
+        if self.current_run_restored:
+            raise ValueError("a run restored from the run cache has no optimizer state to continue, train it again without the cache")
+        return self.trainAndSupervise(X_train, y_train, X_test, y_test, X_validate, y_validate, epochs, earlyStopping, batchSize, shuffleBufferSize, prefetch,
+            callbacks, profileEpochs, initialEpoch=self.epochsTrained())
+
+    def trainAndSupervise(self, X_train, y_train, X_test, y_test, X_validate, y_validate, epochs=50, earlyStopping=False, batchSize=1, shuffleBufferSize=0, prefetch=True, callbacks=None, profileEpochs=None, initialEpoch=0):
+        # shuffleBufferSize, prefetch and profileEpochs belong to the tf.data / tf.profiler pipeline and are ignored;
+        # a batch size of 0 (or None) trains full-batch; initialEpoch > 0 continues the current run (see continueTraining)
+        if initialEpoch:
+            print(f"continuing training after epoch {initialEpoch}")
+        print("training NumPy network with supervised learning")
+        print(f"** training set size {len(X_train.index)}, validation set size {len(X_validate.index)}, test set size {len(X_test.index)}")
+        print(f"** batch size {batchSize or 'full'}")
+        self.current_run_batch_size = batchSize
+        self.current_run_training_config = {'earlyStopping': earlyStopping, 'batchSize': batchSize, 'shuffleBufferSize': shuffleBufferSize, 'prefetch': prefetch}
+        previousHistory = self.current_run_learning_history.history if initialEpoch else dict()
+        previousTrainingTime = self.current_run_training_time if initialEpoch else 0.0
+
+        bestEpoch = -1
+        patience = 50 if earlyStopping else None
+        if self.checkpoint_directory:
+            callbacks = list(callbacks or []) + [_CheckpointCallback(self, self.checkpoint_directory, self.checkpoint_every, previousHistory, previousTrainingTime)]
+        start = time.perf_counter()
+        self.current_run_learning_history = self.nn_model.fit(X_train.values, y_train.values, (X_validate.values, y_validate.values),
+            epochs, batchSize, callbacks=callbacks, patience=patience, verbose=self.verbose)
+        trainingTime = time.perf_counter() - start
+        profiler.addSpan('fit', start, start + trainingTime)
+
+        epochsRun = len(self.current_run_learning_history.history['loss'])
+        self.current_run_samples_per_second = len(X_train.index) * epochsRun / trainingTime
+        print("Training time: %.2fs (%d epochs), throughput: %.0f samples/s\n" % (trainingTime, epochsRun, self.current_run_samples_per_second))
+        self.current_run_training_time = previousTrainingTime + trainingTime
+        if initialEpoch:
+            history = self.current_run_learning_history.history
+            self.current_run_learning_history = CachedHistory({name: list(values) + list(history.get(name, [])) for name, values in previousHistory.items()})
+        if self.checkpoint_directory:
+            with profiler.span('checkpoint', epoch=self.epochsTrained() - 1):
+                self.saveCheckpoint(self.checkpoint_directory)
+
+        self.inference_engine = DenseInferenceEngine(self.nn_model.layers())
+        if earlyStopping:
+            bestEpochCandidate = np.argmin(self.current_run_learning_history.history['val_loss'])
+            if bestEpochCandidate + patience < initialEpoch + epochs: bestEpoch = bestEpochCandidate
+
+        with profiler.span('evaluate'):
+            self.current_run_evaluation = self.evaluateSplits(X_train, y_train, X_test, y_test, X_validate, y_validate)
+            holdout = self.current_run_evaluation['holdout']
+            self.current_run_holdout_accuracy_value = holdout.accuracy()
+            self.current_run_holdout_accuracy = "%.2f%%" % (self.current_run_holdout_accuracy_value*100)
+            print("Holdout accuracy %s, loss %.4f, AUC %.4f, confusion matrix %s\n" % (self.current_run_holdout_accuracy, holdout.loss(), holdout.auc(), holdout.confusionMatrix().tolist()))
+
+        with profiler.span('roc curve'):
+            self.current_run_roc_data = holdout.rocCurve()
+        return self.current_run_roc_data, bestEpoch
+
+    def evaluateSplits(self, X_train, y_train, X_test, y_test, X_validate, y_validate):
+        return SplitEvaluation.fromSplits(self.inference_engine.predict, X_train, y_train, X_test, y_test, X_validate, y_validate)
+
+    def saveCheckpoint(self, directory, history=None, trainingTime=None):
+        # the layout of NNManager.saveCheckpoint (model + run.json), the model as NumpyMLP.saveState;
+        # written next to the old checkpoint and then swapped in, so one always stays readable
+        temporaryPath = directory.rstrip('/\\') + f".{os.getpid()}.tmp"
+        shutil.rmtree(temporaryPath, ignore_errors=True)
+        os.makedirs(temporaryPath)
+        self.nn_model.saveState(os.path.join(temporaryPath, 'model.npz'))
+        if history is None:
+            history = {name: [float(v) for v in values] for name, values in self.current_run_learning_history.history.items()}
+        meta = {
+            'backend': self.backend,
+            'model': self.current_run_model_config,
+            'training': self.current_run_training_config,
+            'history': history,
+            'training_time': self.current_run_training_time if trainingTime is None else trainingTime,
+            'metadata': self.checkpoint_metadata,
+            'created': time.time(),
+        }
+        with open(os.path.join(temporaryPath, 'run.json'), 'w') as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temporaryPath, directory)
+
+    def loadCheckpoint(self, directory):
+        # recreates the network of a checkpoint with weights, Adam state and learning history, ready for continueTraining
+        with open(os.path.join(directory, 'run.json')) as f:
+            meta = json.load(f)
+        self.createNetworkModel(**meta['model'])
+        self.nn_model.loadState(os.path.join(directory, 'model.npz'))
+        self.current_run_learning_history = CachedHistory(meta['history'])
+        self.current_run_training_time = meta['training_time']
+        self.current_run_training_config = meta['training']
+        self.current_run_batch_size = meta['training']['batchSize']
+        self.checkpoint_metadata = meta.get('metadata', dict())
+        self.current_run_evaluation = None
+        self.inference_engine = DenseInferenceEngine(self.nn_model.layers())
+        print(f"** checkpoint {directory} loaded after epoch {self.epochsTrained()}")
+        return meta
+
+    def restoreRun(self, learningHistory, roc_data, holdoutAccuracyValue, batchSize, trainingTime, samplesPerSecond):
+        self.current_run_learning_history = learningHistory
+        self.current_run_roc_data = roc_data
+        self.current_run_holdout_accuracy_value = holdoutAccuracyValue
+        self.current_run_holdout_accuracy = "%.2f%%" % (holdoutAccuracyValue*100)
+        self.current_run_batch_size = batchSize
+        self.current_run_training_time = trainingTime
+        self.current_run_samples_per_second = samplesPerSecond
+        self.current_run_evaluation = None
+        self.current_run_restored = True
+        self.inference_engine = DenseInferenceEngine(self.nn_model.layers())
+
+    def predict(self, pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age, dataManager):
+        patient = np.array([pregnancies, glucose, bloodPressure, skinThickness, insulin, bmi, pedigree, age], dtype=np.float64)
+        return self.inference_engine.predictOne(dataManager.transformFeatures(patient)[0])
+
+    def predictBatch(self, X, dataManager):
+        return self.inference_engine.predict(dataManager.transformFeatures(X))
+
+    def exportModel(self, path, dataManager, weights='float64'):
+        PatientModel.fromManagers(self, dataManager).save(path, weights)
+        print(f"** model exported to {path} ({weights} weights)")
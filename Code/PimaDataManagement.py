@@ -1,12 +1,47 @@
+import hashlib
+import json
+import os
 import pandas
 import numpy as np
 from sklearn import preprocessing
 from sklearn.model_selection import train_test_split
+from sklearn.model_selection import RepeatedStratifiedKFold
+from Histograms import ColumnHistograms
+from Profiling import profiler
+
+def _writeAtomically(path, write, mode='wb'):
+    # written under a per-process temporary name and swapped in, readers never see a partial file;
+    # concurrent processes (sweep workers on a cold cache) write the same content, one that loses
+    # the race (os.replace fails where the target is in use) keeps the file of the other
+    temporaryPath = path + f".{os.getpid()}.tmp"
+    with open(temporaryPath, mode) as f:
+        write(f)
+    try:
+        os.replace(temporaryPath, path)
+    except OSError:
+        os.remove(temporaryPath)
+
 
 class DataManager:
 
+    data_file = 'data/diabetes.csv'
+    # sha256 of the data file, identifies the data a run was trained on
+    data_checksum = None
+    # cleaned and scaled data is stored here as memory-mappable .npy files
+    artifact_directory = 'cache/preprocessed'
+    # part of the key of the stored preprocessed data (preprocessingKey): increase it with every change
+    # of preprocessData, so artifacts of the old preprocessing are not loaded any more
+    preprocessing_version = 1
+
     scaler = None
 
+    # input columns of the network, in the order the scaler was fitted
+    feature_columns = ['Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness', 'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age']
+    # columns in which a 0 stands for a missing value
+    missing_value_columns = ['Glucose', 'BloodPressure', 'SkinThickness', 'Insulin', 'BMI']
+    # medians of the missing value columns over both classes, used when the outcome is unknown (prognosis)
+    feature_medians = None
+
     # original data in panda DataFrame 
     odf = None
     # cleaned and scaled panda DataFrame
@@ -19,47 +54,58 @@ class DataManager:
     y_validate = None
     y_test = None
 
-    def __init__(self): 
+    # (training, validation, testing) row positions per fold of a (repeated) k-fold
+    folds = None
+
+    # bin counts of the raw and of the imputed data, stored with the preprocessed data
+    histograms = None
+    histogram_bins = 10
+
+    def __init__(self, usePreprocessedArtifact=True): 
         print("DataManager initializing")
+        if usePreprocessedArtifact:
+            with profiler.span('load preprocessed data', 'data'):
+                if self._loadPreprocessedArtifact():
+                    return
         print("** loading Pima Indians data from file")
-        self.odf = pandas.read_csv('data/diabetes.csv')
+        with profiler.span('read data file', 'data'):
+            self.data_checksum = self._fileChecksum(self.data_file)
+            self.odf = pandas.read_csv(self.data_file)
         self.preprocessData(self.odf)
+        if usePreprocessedArtifact:
+            with profiler.span('store preprocessed data', 'data'):
+                self._storePreprocessedArtifact()
         #self._splitDataIntoTrainingValidationAndTestingSets(self.odf_cleansed)
 
+    def _fileChecksum(self, path):
+        checksum = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                checksum.update(block)
+        return checksum.hexdigest()
+
     def preprocessData(self, odf):
-        self._handleMissingValues(odf)
-        self._standardizeScales(odf)
+        # the raw data is only seen here, both histograms share the bins of the raw data
+        with profiler.span('histograms', 'data'):
+            self.histograms = ColumnHistograms.fromValues(odf.columns, odf.values, self.histogram_bins)
+            self.histograms.update('raw', odf.values)
+        with profiler.span('handle missing values', 'data'):
+            self._handleMissingValues(odf)
+        self.histograms.update('imputed', odf.values)
+        with profiler.span('standardize scales', 'data'):
+            self._standardizeScales(odf)
 
     def _handleMissingValues(self, odf):
         print("*** handling missing values")
+        columns = self.missing_value_columns
         # replace 0 values with NaN
-        odf["Glucose"] = odf["Glucose"].replace(0, np.nan)
-        odf['BloodPressure'] = odf['BloodPressure'].replace(0, np.nan)
-        odf['SkinThickness'] = odf['SkinThickness'].replace(0, np.nan)
-        odf['Insulin'] = odf['Insulin'].replace(0, np.nan)
-        odf['BMI'] = odf['BMI'].replace(0, np.nan)
+        odf[columns] = odf[columns].replace(0, np.nan)
+        self.feature_medians = odf[columns].median()
 
         # replace NaN according to https://www.kaggle.com/vincentlugat/pima-indians-diabetes-eda-prediction-0-906/notebook
-
-        medianTargetTable = self._median_target('Insulin')
-        odf.loc[(odf['Outcome'] == 0 ) & (odf['Insulin'].isnull()), 'Insulin'] = medianTargetTable['Insulin'][0]
-        odf.loc[(odf['Outcome'] == 1 ) & (odf['Insulin'].isnull()), 'Insulin'] = medianTargetTable['Insulin'][1]
-
-        medianTargetTable = self._median_target('Glucose')
-        odf.loc[(odf['Outcome'] == 0 ) & (odf['Glucose'].isnull()), 'Glucose'] = medianTargetTable['Glucose'][0]
-        odf.loc[(odf['Outcome'] == 1 ) & (odf['Glucose'].isnull()), 'Glucose'] = medianTargetTable['Glucose'][1]
-
-        medianTargetTable = self._median_target('SkinThickness')
-        odf.loc[(odf['Outcome'] == 0 ) & (odf['SkinThickness'].isnull()), 'SkinThickness'] = medianTargetTable['SkinThickness'][0]
-        odf.loc[(odf['Outcome'] == 1 ) & (odf['SkinThickness'].isnull()), 'SkinThickness'] = medianTargetTable['SkinThickness'][1]
-
-        medianTargetTable = self._median_target('BloodPressure')
-        odf.loc[(odf['Outcome'] == 0 ) & (odf['BloodPressure'].isnull()), 'BloodPressure'] = medianTargetTable['BloodPressure'][0]
-        odf.loc[(odf['Outcome'] == 1 ) & (odf['BloodPressure'].isnull()), 'BloodPressure'] = medianTargetTable['BloodPressure'][1]
-
-        medianTargetTable = self._median_target('BMI')
-        odf.loc[(odf['Outcome'] == 0 ) & (odf['BMI'].isnull()), 'BMI'] = medianTargetTable['BMI'][0]
-        odf.loc[(odf['Outcome'] == 1 ) & (odf['BMI'].isnull()), 'BMI'] = medianTargetTable['BMI'][1]
+        # with the median of the same outcome class, one grouped transform for all columns
+        classMedians = odf.groupby('Outcome')[columns].transform('median')
+        odf[columns] = odf[columns].fillna(classMedians)
 
         print(odf.describe())
 
@@ -71,31 +117,115 @@ class DataManager:
         self.odf_cleansed['Outcome'] = odf['Outcome']
         #print(self.odf_cleansed.describe())
 
-    def _median_target(self, var):   
-        temp = self.odf[self.odf[var].notnull()]
-        temp = temp[[var, 'Outcome']].groupby(['Outcome'])[[var]].median().reset_index()
-        #print median target table
-        #print(temp)
-        return temp
+    def transformFeatures(self, X):
+        # vectorized imputation and scaling of patients with unknown outcome (DataFrame or array with 8 columns)
+        if isinstance(X, pandas.DataFrame):
+            X = X[self.feature_columns]
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        missing = [self.feature_columns.index(column) for column in self.missing_value_columns]
+        values = X[:, missing]
+        X[:, missing] = np.where((values == 0) | np.isnan(values), self.feature_medians.values, values)
+        # the scaler was fitted including 'Outcome' as last column, only the feature statistics are applied
+        n = len(self.feature_columns)
+        return (X - self.scaler.mean_[:n]) / self.scaler.scale_[:n]
+
+    def preprocessingKey(self):
+        # hash of the preprocessing version and configuration, stored with the preprocessed data next to the data file checksum
+        config = {'version': self.preprocessing_version, 'feature_columns': self.feature_columns,
+            'missing_value_columns': self.missing_value_columns, 'histogram_bins': self.histogram_bins}
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _artifactPaths(self):
+        name = os.path.splitext(os.path.basename(self.data_file))[0]
+        base = os.path.join(self.artifact_directory, name)
+        return base + '.json', base + '-imputed.npy', base + '-cleansed.npy'
+
+    def _storePreprocessedArtifact(self):
+        # persist the cleaned and the cleaned+scaled data together with the scaler parameters
+        metaPath, imputedPath, cleansedPath = self._artifactPaths()
+        os.makedirs(self.artifact_directory, exist_ok=True)
+        for path, df in [(imputedPath, self.odf), (cleansedPath, self.odf_cleansed)]:
+            _writeAtomically(path, lambda f: np.save(f, df.values.astype(np.float64)))
+        stat = os.stat(self.data_file)
+        meta = {
+            'data_file': self.data_file,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': self.data_checksum,
+            'preprocessing': self.preprocessingKey(),
+            'columns': list(self.odf.columns),
+            'dtypes': {column: str(dtype) for column, dtype in self.odf.dtypes.items()},
+            'feature_medians': [float(v) for v in self.feature_medians.values],
+            'scaler_mean': self.scaler.mean_.tolist(),
+            'scaler_var': self.scaler.var_.tolist(),
+            'scaler_scale': self.scaler.scale_.tolist(),
+            'scaler_n_samples_seen': int(self.scaler.n_samples_seen_),
+            'histograms': self.histograms.toDict(),
+        }
+        # the meta file is written last, it marks the artifact as complete
+        _writeAtomically(metaPath, lambda f: json.dump(meta, f), 'w')
+        print(f"** preprocessed data stored in {self.artifact_directory}")
 
-    def splitDataIntoTrainingValidationAndTestingSets(self):
-        self._splitDataIntoTrainingValidationAndTestingSets(self.odf_cleansed)
+    def _loadPreprocessedArtifact(self):
+        metaPath, imputedPath, cleansedPath = self._artifactPaths()
+        try:
+            with open(metaPath) as f:
+                meta = json.load(f)
+            stat = os.stat(self.data_file)
+        except (OSError, ValueError):
+            return False
+        if meta.get('preprocessing') != self.preprocessingKey():
+            print("** preprocessed data was made with another preprocessing version or configuration")
+            return False
+        # size and modification time decide quickly, a touched file is compared by content
+        if (meta['size'], meta['mtime']) != (stat.st_size, stat.st_mtime):
+            if meta['size'] != stat.st_size or self._fileChecksum(self.data_file) != meta['sha256']:
+                print("** preprocessed data is outdated")
+                return False
+            meta['mtime'] = stat.st_mtime
+            _writeAtomically(metaPath, lambda f: json.dump(meta, f), 'w')
+        try:
+            imputed = np.load(imputedPath, mmap_mode='c')
+            cleansed = np.load(cleansedPath, mmap_mode='c')
+        except (OSError, ValueError):
+            return False
+        print(f"** loading preprocessed Pima Indians data from {self.artifact_directory}")
 
-    def _splitDataIntoTrainingValidationAndTestingSets(self, dataset):
+        columns = meta['columns']
+        self.data_checksum = meta['sha256']
+        self.odf = pandas.DataFrame(imputed, columns=columns).astype(meta['dtypes'])
+        self.odf_cleansed = pandas.DataFrame(cleansed, columns=columns)
+        self.odf_cleansed['Outcome'] = self.odf['Outcome']
+        self.feature_medians = pandas.Series(meta['feature_medians'], index=self.missing_value_columns)
+        self.histograms = ColumnHistograms.fromDict(meta['histograms'])
+
+        self.scaler = preprocessing.StandardScaler()
+        self.scaler.mean_ = np.array(meta['scaler_mean'])
+        self.scaler.var_ = np.array(meta['scaler_var'])
+        self.scaler.scale_ = np.array(meta['scaler_scale'])
+        self.scaler.n_samples_seen_ = meta['scaler_n_samples_seen']
+        self.scaler.n_features_in_ = len(columns)
+        return True
+
+    def splitDataIntoTrainingValidationAndTestingSets(self, seed=None):
+        with profiler.span('split data', 'data', seed=seed):
+            self._splitDataIntoTrainingValidationAndTestingSets(self.odf_cleansed, seed)
+
+    def _splitDataIntoTrainingValidationAndTestingSets(self, dataset, seed=None):
         print("** splitting data into training, validation and testing sets")
         # seperate into input (x) and outcome (y)
         X = dataset.loc[:, dataset.columns != "Outcome"]
         y = dataset.loc[:, "Outcome"]
 
         # first split: training(90%) and testing set(10%)
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, stratify=y)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, stratify=y, random_state=seed)
         # self.X_train = X_train
         # self.y_train = y_train
         self.X_test = X_test
         self.y_test = y_test
 
         # second split: final training(80%) and validation set(20%)
-        X_train_final, X_validation, y_train_final, y_validation = train_test_split(X_train, y_train, test_size=0.2, stratify=y_train)
+        X_train_final, X_validation, y_train_final, y_validation = train_test_split(X_train, y_train, test_size=0.2, stratify=y_train, random_state=seed)
         self.X_train = X_train_final
         self.y_train = y_train_final
         self.X_validate = X_validation
@@ -103,3 +233,25 @@ class DataManager:
         
         #print(self.X_train.describe())
 
+    def createStratifiedFolds(self, k=5, repeats=1, seed=None):
+        # generate all fold indices once: every row is in the testing set of exactly one fold per repeat,
+        # the remaining rows are split into final training(80%) and validation set(20%) as above
+        print(f"** creating {repeats}x {k}-fold stratified cross-validation indices")
+        y = self.odf_cleansed.loc[:, "Outcome"]
+        splitter = RepeatedStratifiedKFold(n_splits=k, n_repeats=repeats, random_state=seed)
+        self.folds = list()
+        for trainIndices, testIndices in splitter.split(np.zeros(len(y)), y):
+            trainIndicesFinal, validationIndices = train_test_split(trainIndices, test_size=0.2, stratify=y.iloc[trainIndices], random_state=seed)
+            self.folds.append((trainIndicesFinal, validationIndices, testIndices))
+        return self.folds
+
+    def splitDataByFold(self, fold):
+        trainIndices, validationIndices, testIndices = fold
+        X = self.odf_cleansed.loc[:, self.odf_cleansed.columns != "Outcome"]
+        y = self.odf_cleansed.loc[:, "Outcome"]
+        self.X_train = X.iloc[trainIndices]
+        self.y_train = y.iloc[trainIndices]
+        self.X_validate = X.iloc[validationIndices]
+        self.y_validate = y.iloc[validationIndices]
+        self.X_test = X.iloc[testIndices]
+        self.y_test = y.iloc[testIndices]
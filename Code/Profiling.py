@@ -0,0 +1,95 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+from MemoryUsage import peakRss, currentRss
+
+
+class Profiler:
+
+    # timing spans around the phases of the pipeline and counter samples, kept in memory
+    # (the oldest events are dropped after maxEvents) and exportable as a Chrome trace
+    # (chrome://tracing, https://ui.perfetto.dev)
+
+    """Profiler constructor"""
+    def __init__(self, maxEvents=100000):
+        self._events = collections.deque(maxlen=maxEvents)
+        self._lock = threading.Lock()
+        # running number of the recorded events, marks the start of a run with mark()
+        self._recorded = 0
+        self._origin = time.perf_counter()
+
+    def _timestamp(self, t):
+        # microseconds since the profiler was created
+        return (t - self._origin) * 1e6
+
+    def _record(self, event):
+        with self._lock:
+            self._events.append(event)
+            self._recorded += 1
+
+    @contextlib.contextmanager
+    def span(self, name, category='phase', **args):
+        # `with profiler.span('fit'):` records the duration of the block and the peak RSS at its end
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            self.addSpan(name, start, time.perf_counter(), category, **args)
+
+    def addSpan(self, name, start, end, category='phase', **args):
+        # a span measured elsewhere (perf_counter start and end)
+        args['peak_rss'] = peakRss()
+        self._record({'name': name, 'cat': category, 'ph': 'X', 'ts': self._timestamp(start), 'dur': (end - start) * 1e6,
+            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+    def counter(self, name, **values):
+        self._record({'name': name, 'ph': 'C', 'ts': self._timestamp(time.perf_counter()), 'pid': os.getpid(), 'args': values})
+
+    def sampleMemory(self):
+        self.counter('memory', rss=currentRss(), peak_rss=peakRss())
+
+    def mark(self):
+        # position in the event stream, events(since=mark) returns everything recorded afterwards
+        with self._lock:
+            return self._recorded
+
+    def events(self, since=0):
+        with self._lock:
+            skip = max(0, since - (self._recorded - len(self._events)))
+            return list(self._events)[skip:]
+
+    def summary(self, events=None):
+        # per span name: count, total and last duration in seconds and the highest peak RSS
+        if events is None:
+            events = self.events()
+        summary = collections.OrderedDict()
+        for event in events:
+            if event['ph'] != 'X':
+                continue
+            entry = summary.setdefault(event['name'], {'count': 0, 'total': 0.0, 'last': 0.0, 'peak_rss': 0})
+            entry['count'] += 1
+            entry['total'] += event['dur'] / 1e6
+            entry['last'] = event['dur'] / 1e6
+            entry['peak_rss'] = max(entry['peak_rss'], event['args'].get('peak_rss', 0))
+        return summary
+
+    def toChromeTrace(self, events=None):
+        if events is None:
+            events = self.events()
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def exportChromeTrace(self, path, events=None):
+        with open(path, 'w') as f:
+            json.dump(self.toChromeTrace(events), f)
+        print(f"** chrome trace written to {path}")
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+
+# the profiler of the process, every module records into it
+profiler = Profiler()
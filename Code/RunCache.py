@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+
+class CachedHistory:
+
+    # stands in for keras.callbacks.History, the learning graph only reads .history
+    def __init__(self, history):
+        self.history = history
+
+
+class StoredHistory:
+
+    # stands in for keras.callbacks.History like CachedHistory, but the values stay on disk (HistoryStore)
+    # and are read on every access of .history; only the number of epochs is kept in memory
+    def __init__(self, path, epochs):
+        self.path = path
+        self.epochs = epochs
+
+    @property
+    def history(self):
+        with np.load(self.path) as columns:
+            return {name: columns[name].tolist() for name in columns.files}
+
+
+class HistoryStore:
+
+    # learning histories of the finished runs of a session, one .npz per run with a float32 column per
+    # metric; a keras History also keeps its model alive, a StoredHistory only the file name
+
+    """HistoryStore constructor"""
+    def __init__(self, directory='cache/histories'):
+        self.directory = os.path.join(directory, str(os.getpid()))
+        os.makedirs(self.directory, exist_ok=True)
+        self._stored = 0
+
+    def store(self, history):
+        columns = {name: np.asarray(values, dtype=np.float32) for name, values in history.history.items()}
+        path = os.path.join(self.directory, f"run-{self._stored}.npz")
+        np.savez(path, **columns)
+        self._stored += 1
+        return StoredHistory(path, len(columns.get('loss', ())))
+
+    def clear(self):
+        # the histories are only valid for the session
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class RunCache:
+
+    """RunCache constructor"""
+    def __init__(self, directory='cache/runs', maxSizeBytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.maxSizeBytes = maxSizeBytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def runKey(self, **config):
+        # content address of a run: hash over everything that determines its outcome
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entryPath(self, key):
+        return os.path.join(self.directory, key)
+
+    def restore(self, key, networkManager):
+        # loads a cached run into the (already created) model of the networkManager,
+        # returns (roc_data, bestEpoch) like trainAndSupervise or None on a cache miss
+        entryPath = self._entryPath(key)
+        metaPath = os.path.join(entryPath, 'run.json')
+        if not os.path.exists(metaPath):
+            return None
+        try:
+            with open(metaPath) as f:
+                meta = json.load(f)
+            with np.load(os.path.join(entryPath, 'weights.npz')) as weights:
+                networkManager.nn_model.set_weights([weights[f"w{i}"] for i in range(len(weights.files))])
+            with np.load(os.path.join(entryPath, 'roc.npz')) as roc:
+                roc_data = (roc['fpr'], roc['tpr'], roc['thresholds'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"### cached run {key[:12]} is unreadable, training again ###: {e}")
+            shutil.rmtree(entryPath, ignore_errors=True)
+            return None
+        # last access time drives the LRU eviction
+        os.utime(metaPath)
+        print(f"** restored run {key[:12]} from cache")
+
+        networkManager.restoreRun(CachedHistory(meta['history']), roc_data, meta['holdout_accuracy_value'],
+            meta['batch_size'], meta['training_time'], meta['samples_per_second'])
+        return roc_data, meta['bestEpoch']
+
+    def store(self, key, networkManager, bestEpoch, config):
+        entryPath = self._entryPath(key)
+        # write into a temporary directory first, so a half written entry is never visible
+        temporaryPath = entryPath + f".{os.getpid()}.tmp"
+        shutil.rmtree(temporaryPath, ignore_errors=True)
+        os.makedirs(temporaryPath)
+        weights = networkManager.nn_model.get_weights()
+        np.savez(os.path.join(temporaryPath, 'weights.npz'), **{f"w{i}": w for i, w in enumerate(weights)})
+        FPR, TPR, thresholds = networkManager.current_run_roc_data
+        np.savez(os.path.join(temporaryPath, 'roc.npz'), fpr=FPR, tpr=TPR, thresholds=thresholds)
+        meta = {
+            'config': config,
+            'bestEpoch': int(bestEpoch),
+            'history': {name: [float(v) for v in values] for name, values in networkManager.current_run_learning_history.history.items()},
+            'holdout_accuracy_value': float(networkManager.current_run_holdout_accuracy_value),
+            'batch_size': networkManager.current_run_batch_size,
+            'training_time': networkManager.current_run_training_time,
+            'samples_per_second': networkManager.current_run_samples_per_second,
+            'created': time.time(),
+        }
+        with open(os.path.join(temporaryPath, 'run.json'), 'w') as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(entryPath, ignore_errors=True)
+        try:
+            os.replace(temporaryPath, entryPath)
+        except OSError:
+            # another process stored the same run in the meantime
+            shutil.rmtree(temporaryPath, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        # least recently used entries go first until the cache fits into maxSizeBytes
+        entries = list()
+        totalSize = 0
+        for key in os.listdir(self.directory):
+            entryPath = self._entryPath(key)
+            metaPath = os.path.join(entryPath, 'run.json')
+            if not os.path.exists(metaPath):
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(entryPath))
+            entries.append((os.path.getmtime(metaPath), size, entryPath))
+            totalSize += size
+        for lastAccess, size, entryPath in sorted(entries):
+            if totalSize <= self.maxSizeBytes:
+                break
+            shutil.rmtree(entryPath, ignore_errors=True)
+            totalSize -= size
+            print(f"** evicted cached run {os.path.basename(entryPath)[:12]}")
@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas
+from sklearn import preprocessing
+from PimaDataManagement import DataManager
+from Histograms import ColumnHistograms
+from MemoryUsage import peakRss, formatBytes
+
+
+class QuantileSketch:
+
+    # mergeable compactor sketch (KLL style): items on level h stand for 2^h values,
+    # a level holding more than `capacity` items is sorted and every second item is promoted
+
+    """QuantileSketch constructor"""
+    def __init__(self, capacity=2048, seed=None):
+        self._capacity = capacity
+        self._levels = [np.empty(0)]
+        self._random = np.random.default_rng(seed)
+        self.count = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        level = 0
+        while level < len(self._levels):
+            if len(self._levels[level]) > self._capacity:
+                items = np.sort(self._levels[level])
+                # an odd item stays on its level
+                leftover = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], items[self._random.integers(2)::2]])
+                self._levels[level] = leftover
+            level += 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return np.nan
+        if len(self._levels) == 1:
+            # nothing was compacted yet, the answer is exact
+            return float(np.quantile(self._levels[0], q))
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(levelItems), 2.0**level) for level, levelItems in enumerate(self._levels)])
+        order = np.argsort(items)
+        cumulativeWeights = np.cumsum(weights[order])
+        return float(items[order][np.searchsorted(cumulativeWeights, q * cumulativeWeights[-1])])
+
+
+class StreamingDataManager(DataManager):
+
+    # split codes in the column store
+    TRAIN, VALIDATE, TEST = 0, 1, 2
+    # stored in the meta file, a column store written with another split is ingested again
+    split_method = 'stratified'
+    _splitCodes = {'train': (0,), 'validate': (1,), 'test': (2,), 'holdout': (2, 1)}
+
+    """StreamingDataManager constructor"""
+    def __init__(self, dataFile, storeDirectory=None, chunkSize=100000, seed=None):
+        # out-of-core variant of the DataManager: the CSV is read in chunks and the preprocessed
+        # data lives in a memory-mapped column store, nothing is held in memory as a whole
+        print("StreamingDataManager initializing")
+        self.data_file = dataFile
+        self.chunkSize = chunkSize
+        self.seed = seed
+        if storeDirectory is None:
+            storeDirectory = os.path.join('cache', 'streaming', os.path.splitext(os.path.basename(dataFile))[0])
+        self.storeDirectory = storeDirectory
+        self._columns = None
+        self._split = None
+        if not self._loadColumnStore():
+            self.ingest()
+
+    def ingest(self):
+        start = time.perf_counter()
+        self._collectStatistics()
+        self._writeColumnStore()
+        print("** ingested %d rows in %.1fs, peak RSS %s" % (self.rows, time.perf_counter() - start, formatBytes(peakRss())))
+
+    def _readChunks(self):
+        return pandas.read_csv(self.data_file, chunksize=self.chunkSize)
+
+    def _collectStatistics(self):
+        # first pass: row count, value ranges (the histogram bins) and approximate medians
+        # (overall and per outcome class) of the missing value columns
+        print("*** first pass: counting rows and sketching medians")
+        columns = self.missing_value_columns
+        allColumns = self.feature_columns + ['Outcome']
+        overallSketches = {column: QuantileSketch(seed=self.seed) for column in columns}
+        classSketches = {(outcome, column): QuantileSketch(seed=self.seed) for outcome in (0, 1) for column in columns}
+        self.rows = 0
+        minimums = np.full(len(allColumns), np.inf)
+        maximums = np.full(len(allColumns), -np.inf)
+        for chunk in self._readChunks():
+            self.rows += len(chunk.index)
+            chunkValues = chunk[allColumns].values.astype(np.float64)
+            minimums = np.fmin(minimums, np.nanmin(chunkValues, axis=0))
+            maximums = np.fmax(maximums, np.nanmax(chunkValues, axis=0))
+            outcome = chunk['Outcome'].values
+            for column in columns:
+                values = chunk[column].values.astype(np.float64)
+                values[values == 0] = np.nan
+                overallSketches[column].update(values)
+                for c in (0, 1):
+                    classSketches[(c, column)].update(values[outcome == c])
+        self.feature_medians = pandas.Series([overallSketches[column].quantile(0.5) for column in columns], index=columns)
+        # rows: outcome 0/1, columns: missing value columns
+        self.class_medians = np.array([[classSketches[(c, column)].quantile(0.5) for column in columns] for c in (0, 1)])
+        self.histograms = ColumnHistograms(allColumns, minimums, maximums, self.histogram_bins)
+
+    def _writeColumnStore(self):
+        # second pass: impute, update the scaler statistics with partial_fit and write the
+        # imputed (unscaled) values into one memory-mapped .npy per column; scaling happens when batches are read
+        print("*** second pass: imputing and writing the column store")
+        os.makedirs(self.storeDirectory, exist_ok=True)
+        # the meta file marks a complete store, it is written again at the end
+        metaPath = os.path.join(self.storeDirectory, 'meta.json')
+        if os.path.exists(metaPath):
+            os.remove(metaPath)
+        allColumns = self.feature_columns + ['Outcome']
+        self._columns = {column: np.lib.format.open_memmap(self._columnPath(column), mode='w+', dtype=np.float64, shape=(self.rows,)) for column in allColumns}
+        self._split = np.lib.format.open_memmap(self._columnPath('split'), mode='w+', dtype=np.uint8, shape=(self.rows,))
+        self.scaler = preprocessing.StandardScaler()
+        random = np.random.default_rng(self.seed)
+        missing = [allColumns.index(column) for column in self.missing_value_columns]
+
+        offset = 0
+        for chunk in self._readChunks():
+            values = chunk[allColumns].values.astype(np.float64)
+            self.histograms.update('raw', values)
+            outcome = values[:, -1].astype(np.intp)
+            imputed = values[:, missing]
+            values[:, missing] = np.where((imputed == 0) | np.isnan(imputed), self.class_medians[outcome], imputed)
+            self.histograms.update('imputed', values)
+            self.scaler.partial_fit(values)
+            for i, column in enumerate(allColumns):
+                self._columns[column][offset:offset + len(values)] = values[:, i]
+            self._split[offset:offset + len(values)] = self._splitChunk(outcome, random)
+            offset += len(values)
+
+        for memmap in list(self._columns.values()) + [self._split]:
+            memmap.flush()
+        self.split_sizes = {name: int(np.count_nonzero(np.isin(self._split, codes))) for name, codes in self._splitCodes.items()}
+        self._storeMeta()
+
+    def _splitChunk(self, outcome, random):
+        # testing(10%), validation(20% of the remaining 90%) and final training set, stratified
+        # per chunk: every outcome class is split in these shares (rounded as train_test_split does)
+        split = np.full(len(outcome), self.TRAIN, dtype=np.uint8)
+        for c in (0, 1):
+            rows = random.permutation(np.flatnonzero(outcome == c))
+            testRows = int(np.ceil(0.1 * len(rows)))
+            validateRows = int(np.ceil(0.2 * (len(rows) - testRows)))
+            split[rows[:testRows]] = self.TEST
+            split[rows[testRows:testRows + validateRows]] = self.VALIDATE
+        return split
+
+    def _columnPath(self, column):
+        return os.path.join(self.storeDirectory, column + '.npy')
+
+    def _storeMeta(self):
+        stat = os.stat(self.data_file)
+        meta = {
+            'data_file': self.data_file,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'rows': self.rows,
+            'preprocessing': self.preprocessingKey(),
+            'split': self.split_method,
+            'split_sizes': self.split_sizes,
+            'feature_medians': [float(v) for v in self.feature_medians.values],
+            'class_medians': self.class_medians.tolist(),
+            'scaler_mean': self.scaler.mean_.tolist(),
+            'scaler_var': self.scaler.var_.tolist(),
+            'scaler_scale': self.scaler.scale_.tolist(),
+            'scaler_n_samples_seen': int(self.scaler.n_samples_seen_),
+            'histograms': self.histograms.toDict(),
+        }
+        with open(os.path.join(self.storeDirectory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def _loadColumnStore(self):
+        try:
+            with open(os.path.join(self.storeDirectory, 'meta.json')) as f:
+                meta = json.load(f)
+            stat = os.stat(self.data_file)
+            if (meta['size'], meta['mtime']) != (stat.st_size, stat.st_mtime) or meta.get('preprocessing') != self.preprocessingKey() or meta.get('split') != self.split_method:
+                return False
+            self._columns = {column: np.load(self._columnPath(column), mmap_mode='r') for column in self.feature_columns + ['Outcome']}
+            self._split = np.load(self._columnPath('split'), mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return False
+        print(f"** using column store {self.storeDirectory}")
+        self.rows = meta['rows']
+        self.split_sizes = meta['split_sizes']
+        self.feature_medians = pandas.Series(meta['feature_medians'], index=self.missing_value_columns)
+        self.class_medians = np.array(meta['class_medians'])
+        self.histograms = ColumnHistograms.fromDict(meta['histograms'])
+        self.scaler = preprocessing.StandardScaler()
+        self.scaler.mean_ = np.array(meta['scaler_mean'])
+        self.scaler.var_ = np.array(meta['scaler_var'])
+        self.scaler.scale_ = np.array(meta['scaler_scale'])
+        self.scaler.n_samples_seen_ = meta['scaler_n_samples_seen']
+        self.scaler.n_features_in_ = len(self.feature_columns) + 1
+        return True
+
+    def batchGenerator(self, split, batchSize, shuffle=False, blockSize=65536, random=None):
+        # yields scaled (X, y) batches of one split ('train', 'validate', 'test' or 'holdout'),
+        # only one block of rows is read from the column store at a time
+        codes = self._splitCodes[split]
+        if random is None:
+            random = np.random.default_rng(self.seed)
+        n = len(self.feature_columns)
+        mean, scale = self.scaler.mean_[:n], self.scaler.scale_[:n]
+        blockStarts = np.arange(0, self.rows, blockSize)
+        if shuffle:
+            random.shuffle(blockStarts)
+        for blockStart in blockStarts:
+            blockStop = min(blockStart + blockSize, self.rows)
+            indices = np.flatnonzero(np.isin(self._split[blockStart:blockStop], codes)) + blockStart
+            if shuffle:
+                random.shuffle(indices)
+            X = (np.column_stack([self._columns[column][indices] for column in self.feature_columns]) - mean) / scale
+            y = self._columns['Outcome'][indices]
+            for i in range(0, len(indices), batchSize):
+                yield X[i:i + batchSize], y[i:i + batchSize]
+
+    def createDataset(self, split, batchSize, shuffle=False, prefetch=True):
+        # tf.data pipeline over the batch generator, reshuffled in every epoch
+        import tensorflow as tf
+        floatx = tf.keras.backend.floatx()
+        random = np.random.default_rng(self.seed)
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self.batchGenerator(split, batchSize, shuffle, random=random),
+            output_types=(floatx, floatx),
+            output_shapes=(tf.TensorShape([None, len(self.feature_columns)]), tf.TensorShape([None])))
+        if prefetch:
+            dataset = dataset.prefetch(tf.data.experimental.AUTOTUNE)
+        return dataset
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="out-of-core ingestion and training of a large Pima Indians style CSV")
+    parser.add_argument('csv')
+    parser.add_argument('--store', default=None, help="column store directory")
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--epochs', type=int, default=0, help="train a [12, 8] network on the stream (0 = ingest only)")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataManager = StreamingDataManager(args.csv, args.store, args.chunk_size, args.seed)
+    result = {'rows': dataManager.rows, 'ingest_time': time.perf_counter() - start}
+    if args.epochs:
+        from NeuralNetworkManagement import NNManager
+        networkManager = NNManager()
+        networkManager.verbose = 2
+        networkManager.createNetworkModel([12, 8])
+        start = time.perf_counter()
+        networkManager.trainOnStreams(dataManager, args.epochs, batchSize=args.batch_size)
+        result['train_time'] = time.perf_counter() - start
+        result['holdout_accuracy'] = float(networkManager.current_run_holdout_accuracy_value)
+    result['peak_rss'] = peakRss()
+    print("STREAMING-RESULT " + json.dumps(result))
@@ -0,0 +1,280 @@
+import queue
+import threading
+import time
+import numpy as np
+from PyQt5 import QtCore as qtc
+from tensorflow import keras
+from Profiling import profiler
+
+
+class TrainingJob:
+
+    """TrainingJob constructor"""
+    def __init__(self, hiddenLayersConfig, epochs, linear, dropout, earlyStopping, batchSize, shuffleBufferSize, prefetch, dataSplits, seed=None, dataChecksum=None, useCache=False, profileEpochs=None, precision='float64', initialEpoch=0, checkpointDirectory=None, resume=False, preprocessingKey=None):
+        # run parameters
+        self.hiddenLayersConfig = hiddenLayersConfig
+        self.epochs = epochs
+        self.linear = linear
+        self.dropout = dropout
+        self.earlyStopping = earlyStopping
+        self.batchSize = batchSize
+        self.shuffleBufferSize = shuffleBufferSize
+        self.prefetch = prefetch
+        # training precision, one of NeuralNetworkManagement.precisionModes
+        self.precision = precision
+        # (X_train, y_train, X_test, y_test, X_validate, y_validate) in the order of NNManager.trainAndSupervise
+        self.dataSplits = dataSplits
+        # split seed, data file checksum and DataManager.preprocessingKey identify the data of the run in the RunCache
+        self.seed = seed
+        self.dataChecksum = dataChecksum
+        self.preprocessingKey = preprocessingKey
+        self.useCache = useCache
+        # (first, last) epoch of an opt-in tf.profiler capture
+        self.profileEpochs = profileEpochs
+        # > 0: the run continues the model the worker trained last (its splits) for `epochs` more epochs
+        self.initialEpoch = initialEpoch
+        # checkpoints of the run are written there (NNManager.saveCheckpoint); with resume the model
+        # is first loaded from there instead of continuing the worker's current one
+        self.checkpointDirectory = checkpointDirectory
+        self.resume = resume
+
+        # run results, copied from the NNManager before the worker starts the next job
+        self.topology = None
+        self.roc_data = None
+        self.bestEpoch = -1
+        self.holdout_accuracy = None
+        self.learning_history = None
+        self.batch_size = None
+        self.training_time = None
+        self.samples_per_second = None
+        self.cached = False
+        # profiler events recorded while the run was in the worker
+        self.profile_events = None
+
+    def runConfig(self):
+        # everything that determines the outcome of the run, hashed into the RunCache key
+        return {
+            'topology': list(self.hiddenLayersConfig),
+            'linear': self.linear,
+            'dropout': self.dropout,
+            'earlyStopping': self.earlyStopping,
+            'epochs': self.epochs,
+            'batchSize': self.batchSize,
+            'shuffleBufferSize': self.shuffleBufferSize,
+            'precision': self.precision,
+            'seed': self.seed,
+            'dataChecksum': self.dataChecksum,
+            'preprocessingKey': self.preprocessingKey,
+        }
+
+    def takeResults(self, networkManager, roc_data, bestEpoch):
+        self.topology = networkManager.current_run_topology
+        self.roc_data = roc_data
+        self.bestEpoch = bestEpoch
+        self.holdout_accuracy = networkManager.current_run_holdout_accuracy
+        self.learning_history = networkManager.current_run_learning_history
+        self.batch_size = networkManager.current_run_batch_size
+        self.training_time = networkManager.current_run_training_time
+        self.samples_per_second = networkManager.current_run_samples_per_second
+
+
+class LearningCurveBuffer:
+
+    # ring buffer of the per-epoch (loss, val_loss) of the run in training: written by the
+    # training thread, read by the learning window on a timer; reset() starts the next run
+
+    """LearningCurveBuffer constructor"""
+    def __init__(self, capacity=10000):
+        self._lock = threading.Lock()
+        self._values = np.full((capacity, 2), np.nan)
+        self._count = 0
+        self.runId = 0
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self.runId += 1
+
+    def append(self, loss, valLoss):
+        with self._lock:
+            self._values[self._count % len(self._values)] = (loss, valLoss)
+            self._count += 1
+
+    def read(self, start=0):
+        # (run id, epoch indices, (epochs, 2) values) of the epochs from start on,
+        # at most the last `capacity` epochs are still in the buffer
+        with self._lock:
+            epochs = np.arange(max(start, self._count - len(self._values)), self._count)
+            return self.runId, epochs, self._values[epochs % len(self._values)]
+
+
+class _LearningCurveCallback(keras.callbacks.Callback):
+
+    def __init__(self, learningCurve):
+        super().__init__()
+        self._learningCurve = learningCurve
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        self._learningCurve.append(logs.get('loss', np.nan), logs.get('val_loss', np.nan))
+
+
+class _ProgressCallback(keras.callbacks.Callback):
+
+    def __init__(self, worker, epochs):
+        super().__init__()
+        self._worker = worker
+        self._epochs = epochs
+        self._epochStart = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epochStart = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        progress = {name: float(value) for name, value in (logs or {}).items()}
+        progress['time'] = time.perf_counter() - self._epochStart
+        self._worker.epochFinished.emit(epoch, self._epochs, progress)
+        self._stopIfCancelled()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._stopIfCancelled()
+
+    def _stopIfCancelled(self):
+        if self._worker.isCancelRequested():
+            self.model.stop_training = True
+
+
+class TrainingWorker(qtc.QThread):
+
+    runStarted = qtc.pyqtSignal(object)
+    # epoch index, total epochs, logs with loss/val_loss/... and the epoch time in seconds
+    epochFinished = qtc.pyqtSignal(int, int, dict)
+    runFinished = qtc.pyqtSignal(object)
+    runCancelled = qtc.pyqtSignal(object)
+    runFailed = qtc.pyqtSignal(object, str)
+    queueChanged = qtc.pyqtSignal(int)
+
+    """TrainingWorker constructor"""
+    def __init__(self, networkManager, runCache=None, historyStore=None):
+        super().__init__()
+        self._networkManager = networkManager
+        self._runCache = runCache
+        # with a RunCache.HistoryStore the learning histories of the finished runs are kept on disk
+        self._historyStore = historyStore
+        self._jobs = queue.Queue()
+        self._cancelRequested = False
+        # losses of the run in training for the live learning graph
+        self.learningCurve = LearningCurveBuffer()
+
+    def enqueue(self, job):
+        self._jobs.put(job)
+        self.queueChanged.emit(self.pendingJobs())
+
+    def pendingJobs(self):
+        return self._jobs.qsize()
+
+    def isBusy(self):
+        # queued or in training: a job counts from enqueue until the worker has called task_done() for it,
+        # there is no moment between taking it from the queue and starting it where the worker looks idle
+        return self._jobs.unfinished_tasks > 0
+
+    def isCancelRequested(self):
+        return self._cancelRequested
+
+    def cancelCurrentRun(self):
+        self._cancelRequested = True
+
+    def cancelAll(self):
+        # drop the queued runs, then stop the one in progress
+        while True:
+            try:
+                self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            self._jobs.task_done()
+        self.queueChanged.emit(0)
+        self.cancelCurrentRun()
+
+    def stop(self):
+        self.cancelAll()
+        self._jobs.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            self._cancelRequested = False
+            self.learningCurve.reset()
+            self.queueChanged.emit(self.pendingJobs())
+            self.runStarted.emit(job)
+            profileMark = profiler.mark()
+            try:
+                with profiler.span('training run', 'run', topology=list(job.hiddenLayersConfig), seed=job.seed):
+                    self._train(job)
+            except Exception as e:
+                print(f"### training run failed ###: {e}")
+                self._jobs.task_done()
+                self.runFailed.emit(job, str(e))
+                continue
+            job.profile_events = profiler.events(since=profileMark)
+            if self._historyStore is not None and job.learning_history is not None:
+                job.learning_history = self._historyStore.store(job.learning_history)
+            # done before the result is signalled, the receiver sees the worker idle unless more jobs are queued
+            self._jobs.task_done()
+            if self._cancelRequested:
+                self.runCancelled.emit(job)
+            else:
+                self.runFinished.emit(job)
+
+    def _train(self, job):
+        # the NNManager is shared by all jobs, a job without a directory writes no checkpoints
+        self._networkManager.checkpoint_directory = job.checkpointDirectory
+        self._networkManager.checkpoint_metadata = {'seed': job.seed, 'dataChecksum': job.dataChecksum}
+        if job.resume:
+            with profiler.span('load checkpoint'):
+                self._networkManager.loadCheckpoint(job.checkpointDirectory)
+        if job.initialEpoch:
+            self._continue(job)
+            return
+        self._networkManager.createNetworkModel(job.hiddenLayersConfig, not job.linear, job.dropout, job.precision)
+
+        runKey = None
+        if self._runCache is not None and job.useCache:
+            runKey = self._runCache.runKey(**job.runConfig())
+            with profiler.span('restore cached run'):
+                restored = self._runCache.restore(runKey, self._networkManager)
+            if restored is not None:
+                job.cached = True
+                job.takeResults(self._networkManager, *restored)
+                return
+
+        X_train, y_train, X_test, y_test, X_validate, y_validate = job.dataSplits
+        roc_data, bestEpoch = self._networkManager.trainAndSupervise(
+            X_train, y_train,
+            X_test, y_test,
+            X_validate, y_validate,
+            job.epochs, job.earlyStopping, job.batchSize, job.shuffleBufferSize, job.prefetch,
+            callbacks=[_ProgressCallback(self, job.epochs), _LearningCurveCallback(self.learningCurve)],
+            profileEpochs=job.profileEpochs)
+        if runKey is not None and not self._cancelRequested:
+            self._runCache.store(runKey, self._networkManager, bestEpoch, job.runConfig())
+        job.takeResults(self._networkManager, roc_data, bestEpoch)
+
+    def _continue(self, job):
+        # warm start of the current model, the live learning graph starts with the epochs it already has
+        if self._networkManager.epochsTrained() != job.initialEpoch:
+            raise RuntimeError(f"the current model has {self._networkManager.epochsTrained()} epochs, not {job.initialEpoch}")
+        history = self._networkManager.current_run_learning_history.history
+        for loss, valLoss in zip(history['loss'], history.get('val_loss', [np.nan] * job.initialEpoch)):
+            self.learningCurve.append(loss, valLoss)
+        X_train, y_train, X_test, y_test, X_validate, y_validate = job.dataSplits
+        roc_data, bestEpoch = self._networkManager.continueTraining(
+            X_train, y_train,
+            X_test, y_test,
+            X_validate, y_validate,
+            job.epochs, job.earlyStopping, job.batchSize, job.shuffleBufferSize, job.prefetch,
+            callbacks=[_ProgressCallback(self, job.initialEpoch + job.epochs), _LearningCurveCallback(self.learningCurve)],
+            profileEpochs=job.profileEpochs)
+        job.takeResults(self._networkManager, roc_data, bestEpoch)
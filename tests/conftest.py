@@ -0,0 +1,18 @@
+import os
+import sys
+import pytest
+
+# the modules import each other by name and read data/ and write cache/ relative to Code,
+# so the tests run from there like `python MainWindow.py` does
+CODE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Code')
+sys.path.insert(0, CODE_DIRECTORY)
+os.chdir(CODE_DIRECTORY)
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+@pytest.fixture(scope='session')
+def trainedNetwork():
+    # one small network on a fixed split, shared by the tests that only read it
+    import Headless
+    dataManager, networkManager, _ = Headless.train([12, 8], epochs=5, batchSize=32, seed=1)
+    return dataManager, networkManager
@@ -0,0 +1,65 @@
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pytest
+from PimaDataManagement import DataManager
+
+
+@pytest.fixture
+def artifactDirectory(tmp_path, monkeypatch):
+    monkeypatch.setattr(DataManager, 'artifact_directory', str(tmp_path / 'preprocessed'))
+
+
+def loadsArtifact(capsys):
+    return "loading preprocessed Pima Indians data" in capsys.readouterr().out
+
+
+def test_preprocessed_artifact_is_reused(artifactDirectory, capsys):
+    stored = DataManager()
+    assert not loadsArtifact(capsys)
+    loaded = DataManager()
+    assert loadsArtifact(capsys)
+    assert loaded.data_checksum == stored.data_checksum
+    np.testing.assert_array_equal(loaded.odf_cleansed.values, stored.odf_cleansed.values)
+    np.testing.assert_array_equal(loaded.scaler.scale_, stored.scaler.scale_)
+
+
+@pytest.mark.parametrize('attribute, value', [('preprocessing_version', 2), ('histogram_bins', 20), ('missing_value_columns', ['Glucose', 'BMI'])])
+def test_preprocessing_change_invalidates_the_artifact(artifactDirectory, capsys, monkeypatch, attribute, value):
+    # the data file is unchanged, the artifact of another preprocessing must not be loaded
+    DataManager()
+    monkeypatch.setattr(DataManager, attribute, value)
+    DataManager()
+    assert not loadsArtifact(capsys)
+    DataManager()
+    assert loadsArtifact(capsys)
+
+
+def test_concurrent_processes_store_the_artifact(artifactDirectory, capsys):
+    # sweep workers start on a cold cache at the same time, every one of them stores the artifact
+    script = ("import sys; from PimaDataManagement import DataManager; DataManager.artifact_directory = sys.argv[1]; "
+        "assert DataManager().odf_cleansed is not None")
+    processes = [subprocess.Popen([sys.executable, '-c', script, DataManager.artifact_directory], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for _ in range(6)]
+    for process in processes:
+        output = process.communicate()[0]
+        assert process.returncode == 0, output
+    assert not [name for name in os.listdir(DataManager.artifact_directory) if name.endswith('.tmp')]
+    DataManager()
+    assert loadsArtifact(capsys)
+
+
+def test_touched_data_file_keeps_the_artifact(artifactDirectory, capsys, tmp_path, monkeypatch):
+    # only the modification time changed: the content is compared and the meta file is updated
+    dataFile = str(tmp_path / 'diabetes.csv')
+    shutil.copy(DataManager.data_file, dataFile)
+    monkeypatch.setattr(DataManager, 'data_file', dataFile)
+    DataManager()
+    os.utime(dataFile, (1e9, 1e9))
+    DataManager()
+    assert loadsArtifact(capsys)
+    assert not [name for name in os.listdir(DataManager.artifact_directory) if name.endswith('.tmp')]
+    DataManager()
+    assert loadsArtifact(capsys)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from Benchmarks import legacyEvaluation
+
+
+@pytest.fixture(scope='module')
+def evaluations(trainedNetwork):
+    dataManager, networkManager = trainedNetwork
+    evaluation = networkManager.evaluateSplits(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test, dataManager.X_validate, dataManager.y_validate)
+    return evaluation, legacyEvaluation(networkManager, dataManager)
+
+
+@pytest.mark.parametrize('name', ['train', 'validate', 'test', 'holdout'])
+def test_single_pass_matches_keras_evaluate(evaluations, name):
+    # the single-pass evaluation has to reproduce the numbers of keras evaluate on every split
+    evaluation, legacy = evaluations
+    np.testing.assert_allclose(evaluation[name].accuracy(), legacy[name]['accuracy'], atol=1e-12)
+    np.testing.assert_allclose(evaluation[name].loss(), legacy[name]['loss'], rtol=1e-6)
+
+
+def test_single_pass_roc_matches_keras_predict(evaluations):
+    evaluation, legacy = evaluations
+    for new, old in zip(evaluation['holdout'].rocCurve(), legacy['roc_data']):
+        np.testing.assert_allclose(new, old, rtol=1e-9, atol=1e-12)
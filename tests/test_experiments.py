@@ -0,0 +1,168 @@
+import json
+import os
+import numpy as np
+import pytest
+import Headless
+from ExperimentManagement import _createWorkerPool, _hyperbandBracketSizes
+from NeuralNetworkManagement import NNManager, _optimizerVariables
+from NumpyNetwork import NumpyNNManager
+
+
+def trainNumpyNetwork(dataManager, epochs, checkpoint=None):
+    networkManager = NumpyNNManager()
+    networkManager.verbose = 0
+    networkManager.seed = 1
+    if checkpoint is None:
+        networkManager.createNetworkModel([12, 8], True, False)
+        train = networkManager.trainAndSupervise
+    else:
+        networkManager.loadCheckpoint(checkpoint)
+        train = networkManager.continueTraining
+    train(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, epochs, False, 0)
+    return networkManager
+
+
+def test_continuing_from_a_checkpoint_equals_training_through(trainedNetwork, tmp_path):
+    # full-batch training: 3 epochs, checkpoint, 3 more epochs in another manager is the same as 6 epochs,
+    # which needs the Adam moments and step count as well as the weights
+    dataManager, _ = trainedNetwork
+    checkpoint = str(tmp_path / 'candidate')
+    trainNumpyNetwork(dataManager, 3).saveCheckpoint(checkpoint)
+    continued = trainNumpyNetwork(dataManager, 3, checkpoint)
+    through = trainNumpyNetwork(dataManager, 6)
+    assert continued.epochsTrained() == 6
+    for a, b in zip(continued.nn_model.get_weights(), through.nn_model.get_weights()):
+        np.testing.assert_allclose(a, b, rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(continued.current_run_learning_history.history['loss'], through.current_run_learning_history.history['loss'], rtol=1e-10)
+
+
+def trainKerasNetwork(dataManager, epochs, networkManager=None):
+    # a fixed batch order without dropout, so two networks with the same weights and Adam state train alike
+    if networkManager is None:
+        networkManager = NNManager()
+        networkManager.verbose = 0
+        networkManager.createNetworkModel([12, 8], True, False)
+        train = networkManager.trainAndSupervise
+    else:
+        train = networkManager.continueTraining
+    train(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, epochs, False, 32, None)
+    return networkManager
+
+
+def test_keras_continuing_equals_training_through(trainedNetwork):
+    dataManager, _ = trainedNetwork
+    continued = NNManager()
+    continued.verbose = 0
+    continued.createNetworkModel([12, 8], True, False)
+    through = NNManager()
+    through.verbose = 0
+    through.createNetworkModel([12, 8], True, False)
+    through.nn_model.set_weights(continued.nn_model.get_weights())
+    trainKerasNetwork(dataManager, 2, trainKerasNetwork(dataManager, 2, continued))
+    trainKerasNetwork(dataManager, 4, through)
+    assert continued.epochsTrained() == 4
+    for a, b in zip(continued.nn_model.get_weights(), through.nn_model.get_weights()):
+        np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(continued.current_run_learning_history.history['loss'], through.current_run_learning_history.history['loss'], rtol=1e-6)
+
+
+def test_keras_checkpoint_round_trip(trainedNetwork, tmp_path):
+    # weights and Adam state come back, so the loaded run continues as the saved one does
+    dataManager, _ = trainedNetwork
+    checkpoint = str(tmp_path / 'candidate')
+    saved = trainKerasNetwork(dataManager, 2)
+    saved.saveCheckpoint(checkpoint)
+    loaded = NNManager()
+    loaded.verbose = 0
+    loaded.loadCheckpoint(checkpoint)
+    assert loaded.epochsTrained() == 2
+    for a, b in zip(loaded.nn_model.get_weights(), saved.nn_model.get_weights()):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(_optimizerVariables(loaded.nn_model.optimizer), _optimizerVariables(saved.nn_model.optimizer)):
+        np.testing.assert_array_equal(a.numpy(), b.numpy())
+    trainKerasNetwork(dataManager, 1, saved)
+    trainKerasNetwork(dataManager, 1, loaded)
+    for a, b in zip(loaded.nn_model.get_weights(), saved.nn_model.get_weights()):
+        np.testing.assert_allclose(a, b, rtol=1e-6, atol=1e-9)
+
+
+def test_keras_restored_run_is_not_continued(trainedNetwork):
+    dataManager, _ = trainedNetwork
+    networkManager = trainKerasNetwork(dataManager, 1)
+    networkManager.restoreRun(networkManager.current_run_learning_history, networkManager.current_run_roc_data, 0.5, 32, 1.0, 1.0)
+    with pytest.raises(ValueError):
+        trainKerasNetwork(dataManager, 1, networkManager)
+
+
+def test_numpy_checkpoints_are_resumed_with_numpy(tmp_path, monkeypatch):
+    checkpoint = str(tmp_path / 'candidate')
+    saved = list()
+    saveCheckpoint = NumpyNNManager.saveCheckpoint
+
+    def recordingSaveCheckpoint(self, directory, history=None, trainingTime=None):
+        saveCheckpoint(self, directory, history, trainingTime)
+        with open(os.path.join(directory, 'run.json')) as f:
+            saved.append(len(json.load(f)['history']['loss']))
+    monkeypatch.setattr(NumpyNNManager, 'saveCheckpoint', recordingSaveCheckpoint)
+    Headless.train([4], epochs=5, batchSize=0, seed=1, backend='numpy', checkpointDirectory=checkpoint, checkpointEvery=2)
+    assert saved == [2, 4, 5]
+    _, networkManager, _ = Headless.resume(checkpoint, 7, checkpointEvery=2)
+    assert isinstance(networkManager, NumpyNNManager)
+    assert networkManager.epochsTrained() == 7
+    assert saved == [2, 4, 5, 6, 7]
+
+
+@pytest.mark.parametrize('candidates', [1, 5, 12, 27, 49, 200])
+def test_hyperband_brackets_partition_the_candidates(candidates):
+    sizes = _hyperbandBracketSizes(candidates, 3, 3)
+    assert sizes == sorted(sizes, reverse=True)
+    assert sum(sizes) == min(candidates, 27 + 12 + 6 + 4)
+
+
+def test_interrupted_checkpoint_keeps_the_previous_one(trainedNetwork, tmp_path, monkeypatch):
+    # a save that dies after the weights were written must leave the earlier checkpoint readable and unchanged
+    dataManager, _ = trainedNetwork
+    checkpoint = str(tmp_path / 'candidate')
+    networkManager = trainNumpyNetwork(dataManager, 3)
+    networkManager.saveCheckpoint(checkpoint)
+    saved = networkManager.nn_model.get_weights()
+    networkManager.continueTraining(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, 2, False, 0)
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+    monkeypatch.setattr('json.dump', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        networkManager.saveCheckpoint(checkpoint)
+    monkeypatch.undo()
+    restored = NumpyNNManager()
+    restored.loadCheckpoint(checkpoint)
+    assert restored.epochsTrained() == 3
+    for a, b in zip(restored.nn_model.get_weights(), saved):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_numpy_restored_run_is_not_continued(trainedNetwork):
+    # a run from the RunCache has no Adam state
+    dataManager, _ = trainedNetwork
+    networkManager = trainNumpyNetwork(dataManager, 1)
+    networkManager.restoreRun(networkManager.current_run_learning_history, networkManager.current_run_roc_data, 0.5, 0, 1.0, 1.0)
+    assert networkManager.current_run_restored
+    with pytest.raises(ValueError):
+        networkManager.continueTraining(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+            dataManager.X_validate, dataManager.y_validate, 1, False, 0)
+    networkManager.createNetworkModel([4])
+    assert not networkManager.current_run_restored
+
+
+def test_worker_pool_limits_threads_of_its_workers_only(monkeypatch):
+    monkeypatch.setenv('OMP_NUM_THREADS', '3')
+    monkeypatch.delenv('OPENBLAS_NUM_THREADS', raising=False)
+    _, pool = _createWorkerPool(None, 2, 'numpy', 1)
+    with pool as executor:
+        assert executor.submit(os.getenv, 'OPENBLAS_NUM_THREADS').result() == '2'
+        assert executor.submit(os.getenv, 'OMP_NUM_THREADS').result() == '2'
+    assert os.environ['OMP_NUM_THREADS'] == '3'
+    assert 'OPENBLAS_NUM_THREADS' not in os.environ
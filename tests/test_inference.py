@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def test_engine_matches_keras_predict(trainedNetwork):
+    # the NumPy snapshot has to reproduce keras predict on every row of the data set
+    dataManager, networkManager = trainedNetwork
+    X = dataManager.transformFeatures(dataManager.odf)
+    keras_probabilities = networkManager.nn_model.predict(X, verbose=0)[:, 0]
+    np.testing.assert_allclose(networkManager.inference_engine.predict(X), keras_probabilities, rtol=1e-9, atol=1e-12)
+
+
+def test_single_row_matches_keras_predict(trainedNetwork):
+    dataManager, networkManager = trainedNetwork
+    X = dataManager.transformFeatures(dataManager.odf)
+    keras_probabilities = networkManager.nn_model.predict(X, verbose=0)[:, 0]
+    single_probabilities = np.array([networkManager.inference_engine.predictOne(x) for x in X])
+    np.testing.assert_allclose(single_probabilities, keras_probabilities, rtol=1e-9, atol=1e-12)
+
+
+def test_predict_applies_preprocessing(trainedNetwork):
+    # the GUI path with raw patient values goes through the stored medians and scaler
+    dataManager, networkManager = trainedNetwork
+    patient = dataManager.odf.iloc[0, :8].tolist()
+    expected = networkManager.nn_model.predict(dataManager.transformFeatures(dataManager.odf.iloc[:1]), verbose=0)[0, 0]
+    np.testing.assert_allclose(networkManager.predict(*patient, dataManager), expected, rtol=1e-9, atol=1e-12)
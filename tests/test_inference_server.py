@@ -0,0 +1,70 @@
+import asyncio
+import json
+import numpy as np
+import pytest
+from FastInference import PatientModel
+from InferenceServer import InferenceServer
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write(b"%s %s HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Length: %d\r\n\r\n" % (method.encode(), path.encode(), len(body)) + body)
+    await writer.drain()
+    headers = await reader.readuntil(b"\r\n\r\n")
+    status = int(headers.split(b" ", 2)[1])
+    length = int([line for line in headers.split(b"\r\n") if line.lower().startswith(b"content-length:")][0].split(b":")[1])
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def serveConcurrently(model, patients, concurrency, maxDelay):
+    # every client sends its share of the patients one by one over its own keep-alive connection
+    server = InferenceServer(model, maxDelay=maxDelay)
+    await server.start('127.0.0.1', 0)
+    probabilities = [None] * len(patients)
+
+    async def client(indices):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        for i in indices:
+            status, response = await request(reader, writer, 'POST', '/predict', {'patient': patients[i]})
+            assert status == 200, response
+            probabilities[i] = response['probability']
+        writer.close()
+
+    try:
+        await asyncio.gather(*[client(range(c, len(patients), concurrency)) for c in range(concurrency)])
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        batch = await request(reader, writer, 'POST', '/predict', {'patients': patients})
+        invalid = await request(reader, writer, 'POST', '/predict', {'patient': patients[0][:5]})
+        writer.close()
+    finally:
+        server.close()
+    return np.array(probabilities), batch, invalid, server.batcher
+
+
+@pytest.fixture(scope='module')
+def exportedModel(trainedNetwork, tmp_path_factory):
+    dataManager, networkManager = trainedNetwork
+    path = str(tmp_path_factory.mktemp('server') / 'model.npz')
+    networkManager.exportModel(path, dataManager)
+    return PatientModel.load(path)
+
+
+def test_concurrent_requests_match_predict_batch(trainedNetwork, exportedModel):
+    dataManager, networkManager = trainedNetwork
+    X = dataManager.odf[dataManager.feature_columns]
+    expected = networkManager.predictBatch(X, dataManager)
+    probabilities, (batchStatus, batch), _, batcher = asyncio.run(serveConcurrently(exportedModel, X.values.tolist(), concurrency=32, maxDelay=0.01))
+    np.testing.assert_allclose(probabilities, expected, rtol=1e-9, atol=1e-12)
+    assert batchStatus == 200
+    np.testing.assert_allclose(batch['probabilities'], expected, rtol=1e-9, atol=1e-12)
+    # the concurrent requests were really scored together
+    assert batcher.requests == len(X)
+    assert batcher.batches < len(X) / 4
+
+
+def test_invalid_patient_is_rejected(trainedNetwork, exportedModel):
+    dataManager, _ = trainedNetwork
+    patients = dataManager.odf[dataManager.feature_columns].values[:4].tolist()
+    _, _, (status, response), _ = asyncio.run(serveConcurrently(exportedModel, patients, concurrency=2, maxDelay=0.001))
+    assert status == 400
+    assert 'error' in response
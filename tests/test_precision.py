@@ -0,0 +1,57 @@
+import os
+import numpy as np
+import pytest
+import tensorflow as tf
+from FastInference import PatientModel
+from NeuralNetworkManagement import NNManager, setPrecision
+
+# largest difference of a probability to the float64 network (measured: float32 ~5e-7, mixed ~6e-3,
+# float16 weights ~3e-4, int8 weights ~8e-3)
+trainingTolerances = {'float32': 1e-5, 'mixed': 0.03}
+exportTolerances = {'float32': 1e-5, 'float16': 3e-3, 'int8': 0.05}
+
+
+@pytest.fixture(scope='module')
+def precisionRuns(trainedNetwork):
+    # the same initial weights and batch order in every precision mode, so only the arithmetic differs
+    dataManager, _ = trainedNetwork
+    X = dataManager.transformFeatures(dataManager.odf)
+    runs = dict()
+    initialWeights = None
+    try:
+        for precision in ['float64'] + list(trainingTolerances):
+            networkManager = NNManager()
+            networkManager.verbose = 0
+            networkManager.createNetworkModel([12, 8], True, False, precision)
+            if initialWeights is None:
+                initialWeights = networkManager.nn_model.get_weights()
+            else:
+                networkManager.nn_model.set_weights(initialWeights)
+            tf.random.set_seed(1)
+            networkManager.trainAndSupervise(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+                dataManager.X_validate, dataManager.y_validate, 30, False, 32, 0, True)
+            runs[precision] = (networkManager.inference_engine.predict(X), networkManager.current_run_evaluation['holdout'])
+    finally:
+        setPrecision('float64')
+    return runs
+
+
+@pytest.mark.parametrize('precision', list(trainingTolerances))
+def test_training_precision_matches_float64(precisionRuns, precision):
+    probabilities, holdout = precisionRuns[precision]
+    referenceProbabilities, referenceHoldout = precisionRuns['float64']
+    assert np.max(np.abs(probabilities - referenceProbabilities)) < trainingTolerances[precision]
+    assert abs(holdout.auc() - referenceHoldout.auc()) < 0.01
+    assert abs(holdout.accuracy() - referenceHoldout.accuracy()) < 0.02
+
+
+@pytest.mark.parametrize('weights', list(exportTolerances))
+def test_exported_weights_match_float64(trainedNetwork, tmp_path, weights):
+    dataManager, networkManager = trainedNetwork
+    X = dataManager.odf[dataManager.feature_columns].values
+    reference = networkManager.predictBatch(X, dataManager)
+    path = os.path.join(str(tmp_path), f'model-{weights}.npz')
+    networkManager.exportModel(path, dataManager, weights)
+    for computeDtype in (np.float64, np.float32):
+        probabilities = PatientModel.load(path, computeDtype).predict(X)
+        assert np.max(np.abs(probabilities - reference)) < exportTolerances[weights]
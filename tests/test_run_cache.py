@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+from NeuralNetworkManagement import NNManager
+from RunCache import RunCache
+from TrainingWorker import TrainingJob
+
+
+def runConfig(dataManager, **changes):
+    job = TrainingJob([12, 8], 5, False, False, False, 32, 0, True, None, 1, dataManager.data_checksum, True,
+        preprocessingKey=dataManager.preprocessingKey())
+    return dict(job.runConfig(), **changes)
+
+
+def emptyNetwork():
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    networkManager.createNetworkModel([12, 8], True, False)
+    return networkManager
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RunCache(str(tmp_path / 'runs'))
+
+
+def test_store_and_restore(trainedNetwork, cache):
+    dataManager, networkManager = trainedNetwork
+    config = runConfig(dataManager)
+    key = cache.runKey(**config)
+    cache.store(key, networkManager, 3, config)
+    restoredNetwork = emptyNetwork()
+    roc_data, bestEpoch = cache.restore(key, restoredNetwork)
+    assert bestEpoch == 3
+    for a, b in zip(restoredNetwork.nn_model.get_weights(), networkManager.nn_model.get_weights()):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(roc_data, networkManager.current_run_roc_data):
+        np.testing.assert_array_equal(a, b)
+    assert restoredNetwork.current_run_learning_history.history['loss'] == pytest.approx(networkManager.current_run_learning_history.history['loss'])
+    assert restoredNetwork.current_run_holdout_accuracy_value == networkManager.current_run_holdout_accuracy_value
+    assert restoredNetwork.current_run_restored
+
+
+def test_key_covers_data_and_preprocessing(trainedNetwork, cache):
+    # another data file or another preprocessing of the same file is another run
+    dataManager, networkManager = trainedNetwork
+    config = runConfig(dataManager)
+    cache.store(cache.runKey(**config), networkManager, -1, config)
+    for changes in [{'dataChecksum': '0' * 64}, {'preprocessingKey': '0' * 64}, {'seed': 2}]:
+        assert cache.runKey(**runConfig(dataManager, **changes)) != cache.runKey(**config)
+        assert cache.restore(cache.runKey(**runConfig(dataManager, **changes)), emptyNetwork()) is None
+
+
+def test_corrupt_entry_is_a_miss_and_removed(trainedNetwork, cache):
+    dataManager, networkManager = trainedNetwork
+    config = runConfig(dataManager)
+    key = cache.runKey(**config)
+    cache.store(key, networkManager, -1, config)
+    with open(os.path.join(cache.directory, key, 'weights.npz'), 'wb') as f:
+        f.write(b'not a zip file')
+    assert cache.restore(key, emptyNetwork()) is None
+    assert not os.path.exists(os.path.join(cache.directory, key))
+
+
+def test_least_recently_used_entries_are_evicted(trainedNetwork, cache):
+    dataManager, networkManager = trainedNetwork
+    keys = list()
+    for seed in range(3):
+        config = runConfig(dataManager, seed=seed)
+        keys.append(cache.runKey(**config))
+        cache.store(keys[-1], networkManager, -1, config)
+        # distinct access times, oldest first
+        os.utime(os.path.join(cache.directory, keys[-1], 'run.json'), (1e9 + seed, 1e9 + seed))
+    entrySize = sum(entry.stat().st_size for entry in os.scandir(os.path.join(cache.directory, keys[0])))
+    # the oldest entry is used again, the second one becomes the least recently used
+    assert cache.restore(keys[0], emptyNetwork()) is not None
+    cache.maxSizeBytes = int(2.5 * entrySize)
+    config = runConfig(dataManager, seed=3)
+    cache.store(cache.runKey(**config), networkManager, -1, config)
+    assert sorted(os.listdir(cache.directory)) == sorted([keys[0], cache.runKey(**config)])
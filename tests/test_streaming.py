@@ -0,0 +1,81 @@
+import subprocess
+import sys
+import numpy as np
+import pandas
+import pytest
+from Histograms import ColumnHistograms
+from PimaDataManagement import DataManager
+from StreamingDataManagement import QuantileSketch, StreamingDataManager
+from Benchmarks import createSyntheticCsv
+
+
+def assertMatchesNumpyHistogram(histograms, variant, values):
+    for i, column in enumerate(histograms.columns):
+        columnValues = values[:, i]
+        expected, _ = np.histogram(columnValues[~np.isnan(columnValues)], bins=histograms.edges[i])
+        np.testing.assert_array_equal(histograms.counts[variant][i], expected, err_msg=column)
+
+
+def test_histograms_match_numpy_on_pima_data():
+    # integer valued columns put many values exactly on bin edges
+    values = pandas.read_csv(DataManager.data_file).values.astype(np.float64)
+    histograms = ColumnHistograms.fromValues(DataManager.feature_columns + ['Outcome'], values)
+    histograms.update('raw', values)
+    assertMatchesNumpyHistogram(histograms, 'raw', values)
+
+
+def test_histograms_match_numpy_chunk_by_chunk():
+    random = np.random.default_rng(1)
+    values = np.column_stack([random.normal(size=10000), random.integers(0, 17, size=10000), np.full(10000, 3.0), random.lognormal(size=10000)])
+    values[random.random(values.shape) < 0.05] = np.nan
+    histograms = ColumnHistograms.fromValues(['normal', 'integers', 'constant', 'lognormal'], values, bins=7)
+    for start in range(0, len(values), 999):
+        histograms.update('raw', values[start:start + 999])
+    assertMatchesNumpyHistogram(histograms, 'raw', values)
+
+
+def test_quantile_sketch_is_exact_before_compaction():
+    values = np.random.default_rng(1).normal(size=1000)
+    sketch = QuantileSketch(seed=1)
+    sketch.update(values)
+    for q in (0.1, 0.5, 0.9):
+        assert sketch.quantile(q) == np.quantile(values, q)
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'lognormal', 'sorted'])
+def test_quantile_sketch_rank_error(distribution):
+    # 10^6 values in chunks: the rank of every estimated percentile is off by less than 0.5%
+    random = np.random.default_rng(1)
+    values = {'normal': random.normal(size=10**6), 'lognormal': random.lognormal(size=10**6), 'sorted': np.arange(10**6, dtype=np.float64)}[distribution]
+    sketch = QuantileSketch(seed=1)
+    for start in range(0, len(values), 100000):
+        sketch.update(values[start:start + 100000])
+    assert sketch.count == len(values)
+    sortedValues = np.sort(values)
+    for q in np.linspace(0.01, 0.99, 99):
+        assert abs(np.searchsorted(sortedValues, sketch.quantile(q)) / len(values) - q) < 0.005
+
+
+def test_streaming_split_is_stratified(tmp_path):
+    csv = str(tmp_path / 'synthetic.csv')
+    createSyntheticCsv(csv, 20000, chunkSize=5000)
+    dataManager = StreamingDataManager(csv, str(tmp_path / 'store'), chunkSize=3000, seed=1)
+    outcome = np.asarray(dataManager._columns['Outcome'])
+    split = np.asarray(dataManager._split)
+    share = outcome.mean()
+    for code, fraction in ((dataManager.TEST, 0.1), (dataManager.VALIDATE, 0.18), (dataManager.TRAIN, 0.72)):
+        assert abs(np.mean(split == code) - fraction) < 0.002
+        assert abs(outcome[split == code].mean() - share) < 0.002
+    # the histograms of the column store agree with np.histogram as well
+    values = pandas.read_csv(csv)[DataManager.feature_columns + ['Outcome']].values.astype(np.float64)
+    assertMatchesNumpyHistogram(dataManager.histograms, 'raw', values)
+    # a second instance uses the stored split
+    reloaded = StreamingDataManager(csv, str(tmp_path / 'store'), chunkSize=3000, seed=1)
+    assert reloaded.split_sizes == dataManager.split_sizes
+    np.testing.assert_array_equal(np.asarray(reloaded._split), split)
+
+
+def test_benchmarks_import_without_tensorflow():
+    # the data benchmarks (and these tests) use Benchmarks without training, TensorFlow is imported by the ones that train
+    code = "import sys, Benchmarks; print('tensorflow' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()[-1] == 'False'
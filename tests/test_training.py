@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+from NeuralNetworkManagement import NNManager, StackedDense, _ReplicaEarlyStopping, _optimizerVariables, keras, layers
+
+
+@pytest.mark.parametrize('shuffleBufferSize', [None, 0, 64])
+def test_train_with_shuffle_buffer(trainedNetwork, capsys, shuffleBufferSize):
+    # None trains on the batches in a fixed order, 0 shuffles the whole training set
+    dataManager, _ = trainedNetwork
+    networkManager = NNManager()
+    networkManager.createNetworkModel([4])
+    networkManager.trainAndSupervise(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, 1, False, 32, shuffleBufferSize)
+    assert networkManager.epochsTrained() == 1
+    label = {None: 'off', 0: 'all', 64: '64'}[shuffleBufferSize]
+    assert f"shuffle buffer {label}," in capsys.readouterr().out
+
+
+def trainOneEpoch(networkManager, dataManager):
+    networkManager.trainAndSupervise(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, 1, False, 32)
+
+
+def test_pooled_model_is_reinitialized(trainedNetwork):
+    # a run of the same configuration gets the compiled model back with new weights and fresh Adam state
+    dataManager, _ = trainedNetwork
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    networkManager.createNetworkModel([4], True, False)
+    model = networkManager.nn_model
+    initialOptimizerState = [variable.numpy() for variable in _optimizerVariables(model.optimizer)]
+    trainOneEpoch(networkManager, dataManager)
+    trainedWeights = model.get_weights()
+    networkManager.createNetworkModel([4], True, False)
+    assert networkManager.nn_model is model
+    for fresh, trained in zip(model.get_weights()[::2], trainedWeights[::2]):
+        assert not np.allclose(fresh, trained)
+    for variable, initial in zip(_optimizerVariables(model.optimizer), initialOptimizerState):
+        np.testing.assert_array_equal(variable.numpy(), initial)
+    trainOneEpoch(networkManager, dataManager)
+    assert networkManager.epochsTrained() == 1
+
+
+def test_pool_eviction_clears_the_session(trainedNetwork, monkeypatch):
+    dataManager, _ = trainedNetwork
+    cleared = list()
+    clearSession = keras.backend.clear_session
+    monkeypatch.setattr(keras.backend, 'clear_session', lambda: cleared.append(True) or clearSession())
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    networkManager.model_pool_size = 2
+    for topology in [[4], [5], [4]]:
+        networkManager.createNetworkModel(topology, True, False)
+    assert len(cleared) == 1
+    networkManager.createNetworkModel([6], True, False)
+    assert len(cleared) == 2
+    assert list(networkManager._modelPool) == [((4,), True, False, 'float64'), ((6,), True, False, 'float64')]
+    # the network pooled before the clear still trains
+    networkManager.createNetworkModel([4], True, False)
+    trainOneEpoch(networkManager, dataManager)
+    assert networkManager.epochsTrained() == 1
+
+
+@pytest.fixture(scope='module')
+def trainedEnsemble(trainedNetwork):
+    dataManager, _ = trainedNetwork
+    networkManager = NNManager()
+    networkManager.verbose = 0
+    networkManager.createEnsembleModel([6, 4], 3, True, False)
+    networkManager.trainEnsemble(dataManager.X_train, dataManager.y_train, dataManager.X_test, dataManager.y_test,
+        dataManager.X_validate, dataManager.y_validate, 3, False, 32)
+    return dataManager, networkManager
+
+
+def test_ensemble_has_a_history_per_replica(trainedEnsemble):
+    _, networkManager = trainedEnsemble
+    histories = [history.history for history in networkManager.current_run_replica_histories]
+    assert len(histories) == 3
+    assert all(len(history['loss']) == len(history['val_loss']) == 3 for history in histories)
+    # differently initialized replicas learn differently, the ensemble's history is their mean
+    assert histories[0]['loss'] != histories[1]['loss']
+    for name in ['loss', 'val_loss']:
+        np.testing.assert_allclose(networkManager.current_run_learning_history.history[name], np.mean([history[name] for history in histories], axis=0))
+
+
+def test_stacked_model_agrees_with_its_replicas(trainedEnsemble):
+    # every replica of the stacked model is the plain Dense network of its slices of the stacked weights
+    dataManager, networkManager = trainedEnsemble
+    X = dataManager.X_validate.values
+    stacked = networkManager.nn_model.predict(X, verbose=0)
+    stackedLayers = [layer for layer in networkManager.nn_model.layers if isinstance(layer, StackedDense)]
+    for replica in range(3):
+        model = keras.Sequential([keras.Input((8,))] + [layers.Dense(layer.units, activation=layer.activation) for layer in stackedLayers])
+        model.set_weights([weights[replica] for layer in stackedLayers for weights in layer.get_weights()])
+        np.testing.assert_allclose(stacked[:, replica], model.predict(X, verbose=0)[:, 0], rtol=1e-6, atol=1e-9)
+    np.testing.assert_allclose(networkManager.inference_engine.predictReplicas(X), stacked, rtol=1e-6, atol=1e-9)
+
+
+class _FakeStackedModel:
+
+    # one weight with the replica as its first axis, set to the epoch number by the test
+    def __init__(self, replicas):
+        self.weights = np.zeros((replicas, 2))
+        self.stop_training = False
+
+    def get_weights(self):
+        return [self.weights.copy()]
+
+    def set_weights(self, weights):
+        self.weights = weights[0].copy()
+
+
+def test_replica_early_stopping():
+    # replica 0 improves every epoch, replica 1 only in epoch 0 and stops after `patience` more epochs,
+    # training goes on until replica 0 stops as well; each gets the weights of its best epoch back
+    earlyStopping = _ReplicaEarlyStopping(2, patience=2)
+    model = _FakeStackedModel(2)
+    earlyStopping.set_model(model)
+    losses = [[1.0, 1.0], [0.9, 1.1], [0.8, 1.2], [0.7, 1.3], [0.7, 1.4], [0.7, 1.5]]
+    for epoch, (loss0, loss1) in enumerate(losses):
+        model.weights[:] = epoch
+        earlyStopping.on_epoch_end(epoch, {'val_replica_0_loss': loss0, 'val_replica_1_loss': loss1})
+        assert model.stop_training == (epoch == 5)
+    earlyStopping.on_train_end()
+    assert earlyStopping.stoppedEpoch.tolist() == [5, 2]
+    assert earlyStopping.bestEpoch.tolist() == [3, 0]
+    np.testing.assert_array_equal(model.weights, [[3, 3], [0, 0]])